@@ -1,10 +1,6 @@
 import { NextRequest, NextResponse } from 'next/server';
-import { exec } from 'child_process';
-import { promisify } from 'util';
-import path from 'path';
 import { createServerClient } from '@supabase/ssr';
-
-const execAsync = promisify(exec);
+import { runAgentJob } from '@/lib/services/agent-client';
 
 // Simple API key validation for cron jobs
 const validateApiKey = (request: NextRequest): boolean => {
@@ -41,28 +37,10 @@ export async function GET(request: NextRequest) {
     
     // Run forecasting agent if requested
     if (agentType === 'forecast' || agentType === 'all') {
-      const forecastScriptPath = path.resolve(process.cwd(), 'lib/agents/forecasting-agent/forecast_agent.py');
-      console.log(`Running forecasting agent: ${forecastScriptPath}`);
+      console.log('Running forecasting agent');
       
       try {
-        const { stdout, stderr } = await execAsync(`python3 ${forecastScriptPath}`);
-        
-        if (stderr) {
-          console.warn('Forecasting agent warnings:', stderr);
-        }
-        
-        // Try to parse JSON output
-        const jsonMatch = stdout.match(/({[\s\S]*})/);
-        
-        if (jsonMatch && jsonMatch[1]) {
-          forecastResult = JSON.parse(jsonMatch[1]);
-        } else {
-          forecastResult = { 
-            success: true, 
-            message: 'Forecasting agent completed but no structured output was provided',
-            raw_output: stdout.substring(0, 1000) // Truncate long output
-          };
-        }
+        forecastResult = await runAgentJob('forecast');
       } catch (forecastError) {
         forecastResult = { 
           success: false, 
@@ -73,28 +51,10 @@ export async function GET(request: NextRequest) {
     
     // Run prevention agent if requested
     if (agentType === 'prevention' || agentType === 'all') {
-      const preventionScriptPath = path.resolve(process.cwd(), 'lib/agents/prevention-agent/prevention_agent.py');
-      console.log(`Running prevention agent: ${preventionScriptPath}`);
+      console.log('Running prevention agent');
       
       try {
-        const { stdout, stderr } = await execAsync(`python3 ${preventionScriptPath}`);
-        
-        if (stderr) {
-          console.warn('Prevention agent warnings:', stderr);
-        }
-        
-        // Try to parse JSON output
-        const jsonMatch = stdout.match(/({[\s\S]*})/);
-        
-        if (jsonMatch && jsonMatch[1]) {
-          preventionResult = JSON.parse(jsonMatch[1]);
-        } else {
-          preventionResult = { 
-            success: true, 
-            message: 'Prevention agent completed but no structured output was provided',
-            raw_output: stdout.substring(0, 1000) // Truncate long output
-          };
-        }
+        preventionResult = await runAgentJob('prevention');
       } catch (preventionError) {
         preventionResult = { 
           success: false, 
@@ -1,10 +1,6 @@
 import { NextRequest, NextResponse } from 'next/server';
-import { exec } from 'child_process';
-import { promisify } from 'util';
-import path from 'path';
 import { createServerClient } from '@supabase/ssr';
-
-const execAsync = promisify(exec);
+import { runAgentJob } from '@/lib/services/agent-client';
 
 // Middleware to check if user is authenticated
 async function isAuthenticated(req: NextRequest) {
@@ -53,13 +49,16 @@ export async function POST(req: NextRequest) {
       provider,
       timeframe = '30d',
       forecast_horizon = '14d',
-      forecast_model = 'ensemble' 
+      forecast_model = 'ensemble',
+      reconciliation = 'none',
+      progressive = false
     } = body;
     
     // Validate inputs
     const validTimeframes = ['7d', '14d', '30d', '90d'];
     const validForecastHorizons = ['7d', '14d', '30d', '90d'];
-    const validForecastModels = ['statistical', 'prophet', 'ensemble', 'llm'];
+    const validForecastModels = ['statistical', 'prophet', 'ensemble', 'llm', 'auto', 'global'];
+    const validReconciliations = ['none', 'bottom_up', 'mint'];
     
     if (timeframe && !validTimeframes.includes(timeframe)) {
       return NextResponse.json(
@@ -77,50 +76,44 @@ export async function POST(req: NextRequest) {
     
     if (forecast_model && !validForecastModels.includes(forecast_model)) {
       return NextResponse.json(
-        { error: 'Invalid forecast_model. Must be one of: statistical, prophet, ensemble, llm' },
+        { error: 'Invalid forecast_model. Must be one of: statistical, prophet, ensemble, llm, auto, global' },
         { status: 400 }
       );
     }
     
-    // Build command to run the forecasting agent with the specified parameters
-    const scriptPath = path.resolve(process.cwd(), 'lib/agents/forecasting-agent/forecast_agent.py');
-    const command = [
-      `PYTHONPATH=${process.cwd()} python3`,
-      scriptPath,
-      `--user_id="${userId}"`,
-      project_id ? `--project_id="${project_id}"` : '',
-      provider ? `--provider="${provider}"` : '',
-      `--timeframe="${timeframe}"`,
-      `--forecast_horizon="${forecast_horizon}"`,
-      `--forecast_model="${forecast_model}"`
-    ].filter(Boolean).join(' ');
-    
-    console.log(`Running forecasting command: ${command}`);
-    
-    // Execute the Python script
-    const { stdout, stderr } = await execAsync(command);
-    
-    if (stderr) {
-      console.warn('Forecasting script warnings:', stderr);
+    if (reconciliation && !validReconciliations.includes(reconciliation)) {
+      return NextResponse.json(
+        { error: 'Invalid reconciliation. Must be one of: none, bottom_up, mint' },
+        { status: 400 }
+      );
     }
     
-    // Parse the output to extract forecasts
-    let result;
-    try {
-      // Find the JSON output in stdout
-      const jsonMatch = stdout.match(/({[\s\S]*})/);
-      if (jsonMatch && jsonMatch[1]) {
-        result = JSON.parse(jsonMatch[1]);
-      } else {
-        throw new Error('No valid JSON output found');
-      }
-    } catch (parseError) {
-      console.error('Error parsing forecasting output:', parseError);
-      return NextResponse.json({ 
-        success: false, 
-        message: 'Error parsing forecasting output',
-        error: parseError instanceof Error ? parseError.message : 'Unknown error'
-      }, { status: 500 });
+    if (typeof progressive !== 'boolean') {
+      return NextResponse.json(
+        { error: 'Invalid progressive. Must be a boolean' },
+        { status: 400 }
+      );
+    }
+    
+    // Run the forecasting agent with the specified parameters. Progressive requests
+    // get a preliminary statistical forecast and a refinement job to poll with GET ?job_id=
+    const result = await runAgentJob('forecast', {
+      user_id: userId,
+      project_id,
+      provider,
+      timeframe,
+      forecast_horizon,
+      forecast_model,
+      reconciliation,
+      progressive
+    });
+    
+    // The agent sheds load when too many forecasts are queued
+    if (result.status === 'rejected') {
+      return NextResponse.json(
+        { success: false, error: result.error },
+        { status: 429, headers: { 'Retry-After': '30' } }
+      );
     }
     
     // Return the forecasting results
@@ -154,6 +147,41 @@ export async function GET(req: NextRequest) {
     const provider = searchParams.get('provider');
     const model = searchParams.get('model');
     const isLatest = searchParams.get('is_latest') !== 'false'; // Default to true
+    const horizon = searchParams.get('horizon');
+    
+    // Forecasts are stored for the longest horizon; shorter ones are sliced from them
+    const horizonDays: Record<string, number> = { '7d': 7, '14d': 14, '30d': 30, '90d': 90 };
+    if (horizon && !horizonDays[horizon]) {
+      return NextResponse.json(
+        { error: 'Invalid horizon. Must be one of: 7d, 14d, 30d, 90d' },
+        { status: 400 }
+      );
+    }
+    
+    const timeframe = searchParams.get('timeframe');
+    if (timeframe && !horizonDays[timeframe]) {
+      return NextResponse.json(
+        { error: 'Invalid timeframe. Must be one of: 7d, 14d, 30d, 90d' },
+        { status: 400 }
+      );
+    }
+    
+    // Poll the refinement of a progressive forecast
+    const jobId = searchParams.get('job_id');
+    if (jobId) {
+      const job = await runAgentJob('forecast_status', {
+        job_id: jobId,
+        user_id: userId,
+        forecast_horizon: horizon || undefined,
+        timeframe: timeframe || undefined
+      });
+      
+      if (!job.success && !job.job_id) {
+        return NextResponse.json({ error: job.error }, { status: 404 });
+      }
+      
+      return NextResponse.json(job);
+    }
     
     // Create Supabase client
     const cookieStore = req.cookies;
@@ -175,34 +203,39 @@ export async function GET(req: NextRequest) {
       }
     );
     
-    // Build query for fetching forecasts
-    let query = supabase
-      .from('forecasts')
-      .select('*')
-      .eq('user_id', userId);
-    
-    // Apply filters if provided
-    if (projectId) {
-      query = query.eq('project_id', projectId);
-    }
-    
-    if (provider) {
-      query = query.eq('provider', provider);
-    }
-    
-    if (model) {
-      query = query.eq('model', model);
-    }
+    // Apply the request's filters to a forecast query
+    const applyFilters = (query: any) => {
+      query = query.eq('user_id', userId);
+      
+      if (projectId) {
+        query = query.eq('project_id', projectId);
+      }
+      
+      if (provider) {
+        query = query.eq('provider', provider);
+      }
+      
+      if (model) {
+        query = query.eq('model', model);
+      }
+      
+      return query;
+    };
     
-    if (isLatest) {
-      query = query.eq('is_latest', true);
-    }
+    // Latest views only expose each scope's published run, so readers never see
+    // a partially written run. Runs stored in the compact layout come back as one
+    // row per series and are read separately from row-layout runs.
+    const rowsQuery = applyFilters(
+      supabase.from(isLatest ? 'latest_forecast_rows' : 'forecasts_expanded').select('*')
+    ).order('forecast_date', { ascending: true });
     
-    // Order by forecast date
-    query = query.order('forecast_date', { ascending: true });
+    const seriesQuery = isLatest
+      ? applyFilters(supabase.from('latest_forecast_series').select('*'))
+      : Promise.resolve({ data: [], error: null });
     
-    // Execute query
-    const { data, error: dbError } = await query;
+    // Execute queries
+    const [rowsResult, seriesResult] = await Promise.all([rowsQuery, seriesQuery]);
+    const dbError = rowsResult.error || seriesResult.error;
     
     if (dbError) {
       return NextResponse.json({ error: dbError.message }, { status: 500 });
@@ -211,12 +244,10 @@ export async function GET(req: NextRequest) {
     // Process and group the forecasts by model
     const groupedForecasts: any = {};
     
-    data?.forEach(forecast => {
-      const model = forecast.model;
-      
-      if (!groupedForecasts[model]) {
-        groupedForecasts[model] = {
-          model,
+    const forecastGroup = (forecast: any) => {
+      if (!groupedForecasts[forecast.model]) {
+        groupedForecasts[forecast.model] = {
+          model: forecast.model,
           provider: forecast.provider,
           dates: [],
           tokens_input: [],
@@ -225,14 +256,40 @@ export async function GET(req: NextRequest) {
         };
       }
       
-      groupedForecasts[model].dates.push(forecast.forecast_date);
-      groupedForecasts[model].tokens_input.push(forecast.tokens_input_forecast);
-      groupedForecasts[model].tokens_output.push(forecast.tokens_output_forecast);
-      groupedForecasts[model].cost_in_usd.push(forecast.cost_forecast);
+      return groupedForecasts[forecast.model];
+    };
+    
+    rowsResult.data?.forEach((forecast: any) => {
+      const group = forecastGroup(forecast);
+      group.dates.push(forecast.forecast_date);
+      group.tokens_input.push(forecast.tokens_input_forecast);
+      group.tokens_output.push(forecast.tokens_output_forecast);
+      group.cost_in_usd.push(forecast.cost_forecast);
+    });
+    
+    seriesResult.data?.forEach((series: any) => {
+      const group = forecastGroup(series);
+      group.dates.push(...series.dates);
+      group.tokens_input.push(...series.tokens_input_forecast);
+      group.tokens_output.push(...series.tokens_output_forecast);
+      group.cost_in_usd.push(...series.cost_forecast);
     });
     
     // Convert to array for easier consumption by frontend
-    const forecasts = Object.values(groupedForecasts);
+    const forecasts = Object.values(groupedForecasts).map((group: any) => {
+      if (!horizon) {
+        return group;
+      }
+      
+      const days = horizonDays[horizon];
+      return {
+        ...group,
+        dates: group.dates.slice(0, days),
+        tokens_input: group.tokens_input.slice(0, days),
+        tokens_output: group.tokens_output.slice(0, days),
+        cost_in_usd: group.cost_in_usd.slice(0, days)
+      };
+    });
     
     return NextResponse.json({
       success: true,
@@ -120,4 +120,206 @@ EXECUTE FUNCTION update_updated_at_column();
 CREATE TRIGGER update_notification_settings_updated_at
 BEFORE UPDATE ON notification_settings
 FOR EACH ROW
-EXECUTE FUNCTION update_updated_at_column(); 
\ No newline at end of file
+EXECUTE FUNCTION update_updated_at_column(); 
+
+-- Create forecast_runs table (one row per forecasting run)
+CREATE TABLE forecast_runs (
+  id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+  user_id UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+  project_id UUID REFERENCES projects(id) ON DELETE CASCADE,
+  scope_key TEXT NOT NULL, -- '<user_id>:<project_id or *>'
+  provider VARCHAR(255),
+  forecast_model VARCHAR(50) NOT NULL,
+  forecast_horizon VARCHAR(10) NOT NULL,
+  series_count INT NOT NULL DEFAULT 0,
+  row_count INT NOT NULL DEFAULT 0,
+  quality_tier VARCHAR(20) NOT NULL DEFAULT 'final', -- 'final'; preliminary progressive forecasts are returned, not stored
+  storage_layout VARCHAR(20) NOT NULL DEFAULT 'rows', -- 'rows' (forecasts) or 'compact' (forecast_series)
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+);
+
+CREATE INDEX forecast_runs_scope_created_idx ON forecast_runs (scope_key, created_at DESC);
+
+-- Forecast rows belong to the run that produced them
+ALTER TABLE forecasts ADD COLUMN run_id UUID REFERENCES forecast_runs(id) ON DELETE CASCADE;
+CREATE INDEX forecasts_run_id_idx ON forecasts (run_id);
+
+-- is_latest is superseded by forecast_latest and no longer maintained
+ALTER TABLE forecasts ALTER COLUMN is_latest SET DEFAULT false;
+
+-- Enable RLS on forecast_runs table
+ALTER TABLE forecast_runs ENABLE ROW LEVEL SECURITY;
+
+-- Create policies for forecast_runs
+CREATE POLICY "Users can view their own forecast runs" ON forecast_runs
+  FOR SELECT USING (auth.uid() = user_id);
+
+CREATE POLICY "Users can insert their own forecast runs" ON forecast_runs
+  FOR INSERT WITH CHECK (auth.uid() = user_id);
+
+CREATE POLICY "Users can delete their own forecast runs" ON forecast_runs
+  FOR DELETE USING (auth.uid() = user_id);
+
+-- Create forecast_latest table (per-scope pointer to the published run)
+CREATE TABLE forecast_latest (
+  scope_key TEXT PRIMARY KEY,
+  user_id UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+  project_id UUID REFERENCES projects(id) ON DELETE CASCADE,
+  run_id UUID NOT NULL REFERENCES forecast_runs(id) ON DELETE CASCADE,
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+);
+
+-- Enable RLS on forecast_latest table
+ALTER TABLE forecast_latest ENABLE ROW LEVEL SECURITY;
+
+-- Create policies for forecast_latest
+CREATE POLICY "Users can view their own latest forecast pointers" ON forecast_latest
+  FOR SELECT USING (auth.uid() = user_id);
+
+-- Swap a scope's pointer to a fully written run in a single statement
+CREATE OR REPLACE FUNCTION publish_forecast_run(p_run_id UUID)
+RETURNS VOID AS $$
+BEGIN
+  INSERT INTO forecast_latest (scope_key, user_id, project_id, run_id, updated_at)
+  SELECT scope_key, user_id, project_id, id, now()
+  FROM forecast_runs
+  WHERE id = p_run_id
+  ON CONFLICT (scope_key) DO UPDATE
+  SET run_id = EXCLUDED.run_id, updated_at = EXCLUDED.updated_at;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Drop superseded runs beyond the newest p_keep for a scope (their forecasts cascade)
+CREATE OR REPLACE FUNCTION prune_forecast_runs(p_scope_key TEXT, p_keep INT DEFAULT 5)
+RETURNS INT AS $$
+DECLARE
+  deleted INT;
+BEGIN
+  DELETE FROM forecast_runs r
+  WHERE r.scope_key = p_scope_key
+    AND r.id NOT IN (
+      SELECT id FROM forecast_runs
+      WHERE scope_key = p_scope_key
+      ORDER BY created_at DESC
+      LIMIT p_keep
+    )
+    AND NOT EXISTS (SELECT 1 FROM forecast_latest l WHERE l.run_id = r.id);
+  GET DIAGNOSTICS deleted = ROW_COUNT;
+  RETURN deleted;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Create forecast_series table (compact layout: one row per series per run)
+CREATE TABLE forecast_series (
+  id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+  run_id UUID NOT NULL REFERENCES forecast_runs(id) ON DELETE CASCADE,
+  user_id UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+  project_id UUID REFERENCES projects(id) ON DELETE CASCADE,
+  provider VARCHAR(255) NOT NULL,
+  model VARCHAR(255) NOT NULL,
+  forecast_model VARCHAR(50) NOT NULL,
+  confidence_level DECIMAL(3, 2) NOT NULL DEFAULT 0.8,
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+  dates DATE[] NOT NULL,
+  tokens_input_forecast BIGINT[] NOT NULL,
+  tokens_output_forecast BIGINT[] NOT NULL,
+  cost_forecast DECIMAL(10, 6)[] NOT NULL
+);
+
+CREATE INDEX forecast_series_run_id_idx ON forecast_series (run_id);
+
+-- Enable RLS on forecast_series table
+ALTER TABLE forecast_series ENABLE ROW LEVEL SECURITY;
+
+-- Create policies for forecast_series
+CREATE POLICY "Users can view their own forecast series" ON forecast_series
+  FOR SELECT USING (auth.uid() = user_id);
+
+CREATE POLICY "Users can insert their own forecast series" ON forecast_series
+  FOR INSERT WITH CHECK (auth.uid() = user_id);
+
+CREATE POLICY "Users can delete their own forecast series" ON forecast_series
+  FOR DELETE USING (auth.uid() = user_id);
+
+-- Expand compact series into one row per day, shaped like the forecasts table
+CREATE VIEW forecast_series_rows WITH (security_invoker = true) AS
+SELECT
+  s.id, s.run_id, s.user_id, s.project_id, s.provider, s.model,
+  d.forecast_date, d.tokens_input_forecast, d.tokens_output_forecast, d.cost_forecast,
+  s.forecast_model, s.created_at, s.confidence_level
+FROM forecast_series s
+CROSS JOIN LATERAL unnest(s.dates, s.tokens_input_forecast, s.tokens_output_forecast, s.cost_forecast)
+  AS d(forecast_date, tokens_input_forecast, tokens_output_forecast, cost_forecast);
+
+-- Forecast rows from both storage layouts
+CREATE VIEW forecasts_expanded WITH (security_invoker = true) AS
+SELECT
+  id, run_id, user_id, project_id, provider, model,
+  forecast_date, tokens_input_forecast, tokens_output_forecast, cost_forecast,
+  forecast_model, created_at, confidence_level
+FROM forecasts
+UNION ALL
+SELECT * FROM forecast_series_rows;
+
+-- Readers see exactly one complete run per scope
+CREATE VIEW latest_forecasts WITH (security_invoker = true) AS
+SELECT f.*
+FROM forecasts_expanded f
+JOIN forecast_latest l ON f.run_id = l.run_id;
+
+-- Latest runs per layout, for readers that can consume arrays directly
+CREATE VIEW latest_forecast_rows WITH (security_invoker = true) AS
+SELECT f.*
+FROM forecasts f
+JOIN forecast_latest l ON f.run_id = l.run_id;
+
+CREATE VIEW latest_forecast_series WITH (security_invoker = true) AS
+SELECT s.*
+FROM forecast_series s
+JOIN forecast_latest l ON s.run_id = l.run_id;
+
+-- Create forecast_filter_states table (Holt-Winters states of each statistical series, for online updates)
+CREATE TABLE forecast_filter_states (
+  series_key TEXT PRIMARY KEY, -- '<user_id>|<project_id or *>|<provider or *>|<model>'
+  scope_key TEXT NOT NULL, -- '<user_id>:<project_id or *>'
+  user_id UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+  project_id UUID REFERENCES projects(id) ON DELETE CASCADE,
+  provider VARCHAR(255),
+  model VARCHAR(255) NOT NULL,
+  states JSONB NOT NULL, -- per metric: smoothing parameters, level, trend, seasonal states
+  last_day DATE NOT NULL, -- last day filtered into the states
+  fitted_at TIMESTAMP WITH TIME ZONE, -- last full refit
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+);
+
+CREATE INDEX forecast_filter_states_scope_key_idx ON forecast_filter_states (scope_key);
+
+-- Enable RLS on forecast_filter_states table
+ALTER TABLE forecast_filter_states ENABLE ROW LEVEL SECURITY;
+
+-- Create policies for forecast_filter_states
+CREATE POLICY "Users can view their own forecast filter states" ON forecast_filter_states
+  FOR SELECT USING (auth.uid() = user_id);
+
+-- Create alert_fingerprints table (when each standing alert was last sent, for the prevention agent's cooldown)
+CREATE TABLE alert_fingerprints (
+  alert_key TEXT PRIMARY KEY, -- '<type>|<api_key_id or *>|<threshold scope>|<model or *>'
+  fingerprint TEXT NOT NULL, -- alert_key with the severity band last sent
+  user_id UUID REFERENCES auth.users(id) ON DELETE CASCADE,
+  api_key_id UUID REFERENCES user_api_keys(id) ON DELETE CASCADE,
+  alert_type VARCHAR(50) NOT NULL,
+  threshold_scope VARCHAR(50),
+  model VARCHAR(255),
+  severity VARCHAR(50) NOT NULL,
+  severity_band INT NOT NULL DEFAULT 0,
+  last_sent_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+CREATE INDEX alert_fingerprints_user_id_idx ON alert_fingerprints (user_id);
+
+-- Enable RLS on alert_fingerprints table
+ALTER TABLE alert_fingerprints ENABLE ROW LEVEL SECURITY;
+
+-- Create policies for alert_fingerprints
+CREATE POLICY "Users can view their own alert fingerprints" ON alert_fingerprints
+  FOR SELECT USING (auth.uid() = user_id);
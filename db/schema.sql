@@ -86,6 +86,31 @@ CREATE POLICY "Users can insert usage metrics" ON usage_metrics
 CREATE POLICY "Users can update their own usage metrics" ON usage_metrics
   FOR UPDATE USING (auth.uid() = user_id);
 
+-- Create series_statistics table (running statistics per usage series, kept by the usage fetchers)
+CREATE TABLE series_statistics (
+  series_key TEXT PRIMARY KEY, -- '<user_id>|<project_id or *>|<api_key_id or *>|<provider>|<model>'
+  user_id UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+  project_id UUID REFERENCES projects(id) ON DELETE CASCADE,
+  api_key_id UUID REFERENCES user_api_keys(id) ON DELETE CASCADE,
+  provider VARCHAR(255) NOT NULL,
+  model VARCHAR(255) NOT NULL,
+  stats JSONB NOT NULL, -- running totals, Welford moments and the recent-days window
+  summary JSONB NOT NULL, -- averages, growth rate, volatility and last-7-day cost for dashboards
+  last_day DATE NOT NULL,
+  version INTEGER NOT NULL DEFAULT 0, -- bumped by every write; writers update only the version they read
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+);
+
+CREATE INDEX series_statistics_user_id_idx ON series_statistics (user_id);
+CREATE INDEX series_statistics_api_key_id_idx ON series_statistics (api_key_id);
+
+-- Enable RLS on series_statistics table
+ALTER TABLE series_statistics ENABLE ROW LEVEL SECURITY;
+
+-- Create policies for series_statistics
+CREATE POLICY "Users can view their own series statistics" ON series_statistics
+  FOR SELECT USING (auth.uid() = user_id);
+
 -- Create function for updating the updated_at timestamp
 CREATE OR REPLACE FUNCTION update_updated_at_column()
 RETURNS TRIGGER AS $$
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Agent Server for Teiden Dashboard
+
+This script runs a long-lived HTTP service that keeps the forecasting and
+prevention agents loaded, with their libraries imported and their compiled
+graphs and clients warm, and runs their jobs on request. API routes post
+structured job requests to it instead of starting a Python process per call.
+"""
+
+import os
+import sys
+import json
+import time
+import inspect
+import importlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, List, Any, Callable
+
+# Make the agent scripts importable from their own directories
+AGENTS_DIR = os.path.dirname(os.path.abspath(__file__))
+for agent_dir in ("forecasting-agent", "prevention-agent"):
+    sys.path.insert(0, os.path.join(AGENTS_DIR, agent_dir))
+
+from series_stats import update_series_statistics
+
+server_host = os.environ.get("AGENT_SERVER_HOST", "127.0.0.1")
+server_port = int(os.environ.get("AGENT_SERVER_PORT", 8765))
+server_token = os.environ.get("AGENT_SERVER_TOKEN")
+
+# Libraries the agents load on first use, imported when the server starts
+WARM_MODULES = ["pandas", "statsmodels.tsa.holtwinters", "prophet", "sklearn.ensemble", "requests"]
+
+def load_jobs() -> Dict[str, Callable[..., Dict[str, Any]]]:
+    """Import the agents once and return their entry points by job type"""
+    forecast_agent = importlib.import_module("forecast_agent")
+    prevention_agent = importlib.import_module("prevention_agent")
+
+    # The agents import their heavy libraries lazily; load them and compile
+    # the graphs up front so the first request doesn't pay for it
+    for module in WARM_MODULES:
+        importlib.import_module(module)
+    forecast_agent.get_graph()
+    prevention_agent.get_graph()
+    forecast_agent.get_supabase()
+    prevention_agent.get_supabase()
+
+    def update_usage_statistics(usage_rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Fold usage rows stored by the dashboard's fetcher into the series statistics"""
+        return {"success": True, **update_series_statistics(forecast_agent.get_supabase(), usage_rows)}
+    
+    # Check keys as fetchers report new usage, and send notifications, including any queued while the server was down
+    prevention_agent.usage_event_monitor.start()
+    prevention_agent.notification_dispatcher.start()
+    
+    # Report the forecast cache's, admission control's, refinements', usage events' and notifications' counters on the health endpoint
+    AgentRequestHandler.stats.reporters = {
+        "forecast_cache": forecast_agent.forecast_cache.stats,
+        "forecast_flights": forecast_agent.forecast_flights.stats,
+        "forecast_admission": forecast_agent.forecast_admission.stats,
+        "forecast_refinements": forecast_agent.forecast_refinements.stats,
+        "usage_events": prevention_agent.usage_event_monitor.stats,
+        "notifications": prevention_agent.notification_dispatcher.stats
+    }
+
+    return {
+        "forecast": forecast_agent.run_forecast,
+        "forecast_online": forecast_agent.run_online_update,
+        "forecast_status": forecast_agent.forecast_refinement_status,
+        "prevention": prevention_agent.run_prevention_check,
+        "usage_events": prevention_agent.handle_usage_events,
+        "invalidate_forecasts": forecast_agent.invalidate_forecast_cache,
+        "series_statistics": update_usage_statistics
+    }
+
+class AgentServerStats:
+    """Counters reported by the health endpoint"""
+    def __init__(self):
+        self.started_at = time.time()
+        self.jobs = {}
+        self.reporters = {}
+        self._lock = threading.Lock()
+
+    def record(self, job_type: str, seconds: float, success: bool):
+        with self._lock:
+            job_stats = self.jobs.setdefault(job_type, {"count": 0, "failures": 0, "total_seconds": 0.0})
+            job_stats["count"] += 1
+            job_stats["failures"] += 0 if success else 1
+            job_stats["total_seconds"] += seconds
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            snapshot = {
+                "uptime_seconds": time.time() - self.started_at,
+                "jobs": {job_type: dict(job_stats) for job_type, job_stats in self.jobs.items()}
+            }
+        for name, report in self.reporters.items():
+            snapshot[name] = report()
+        return snapshot
+
+class AgentRequestHandler(BaseHTTPRequestHandler):
+    """Serves GET /health and POST /jobs/<job type>"""
+    jobs: Dict[str, Callable[..., Dict[str, Any]]] = {}
+    stats = AgentServerStats()
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.send_json(200, {"status": "ok", **self.stats.snapshot()})
+        else:
+            self.send_json(404, {"error": f"Unknown path: {self.path}"})
+
+    def do_POST(self):
+        if server_token and self.headers.get("x-agent-token") != server_token:
+            self.send_json(401, {"error": "Unauthorized"})
+            return
+
+        job_type = self.path[len("/jobs/"):] if self.path.startswith("/jobs/") else None
+        job = self.jobs.get(job_type)
+        if not job:
+            self.send_json(404, {"error": f"Unknown job type. Must be one of: {', '.join(self.jobs)}"})
+            return
+
+        # Parse and validate the job parameters against the entry point's signature
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            params = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(params, dict):
+                raise ValueError("Request body must be a JSON object")
+        except ValueError as e:
+            self.send_json(400, {"error": f"Invalid request body: {str(e)}"})
+            return
+
+        unknown = set(params) - set(inspect.signature(job).parameters)
+        if unknown:
+            self.send_json(400, {"error": f"Unknown parameters for {job_type}: {', '.join(sorted(unknown))}"})
+            return
+
+        started = time.perf_counter()
+        try:
+            result = job(**params)
+        except Exception as e:
+            result = {"success": False, "error": str(e), "status": "error"}
+        self.stats.record(job_type, time.perf_counter() - started, result.get("success", False))
+        self.send_json(200, result)
+
+    def send_json(self, status: int, body: Dict[str, Any]):
+        payload = json.dumps(body, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+def serve(host: str = server_host, port: int = server_port):
+    """Load the agents and serve jobs until interrupted"""
+    started = time.perf_counter()
+    AgentRequestHandler.jobs = load_jobs()
+    print(f"Agents loaded in {time.perf_counter() - started:.2f}s")
+
+    server = ThreadingHTTPServer((host, port), AgentRequestHandler)
+    server.daemon_threads = True
+    print(f"Agent server listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Cold-start Benchmark for Teiden Dashboard Agents
+
+This script measures how long each agent entry point takes to import in a fresh
+Python process, the cost every cron-triggered or API-triggered run pays before
+doing any work. It also checks that heavy libraries are left for the code paths
+that need them, and exits non-zero if any entry point is over its budget.
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from typing import Dict, Any, List
+
+AGENTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Import budget in seconds per agent entry point, measured as the median of
+# several fresh interpreter starts
+ENTRY_POINTS = {
+    "forecast_agent": {"dir": "forecasting-agent", "budget": 0.75},
+    "prevention_agent": {"dir": "prevention-agent", "budget": 0.5}
+}
+
+# Libraries that must not be loaded just by importing an agent
+HEAVY_MODULES = ["pandas", "prophet", "statsmodels", "sklearn", "langchain", "langchain_openai", "langgraph", "supabase", "requests"]
+
+# Runs in the child process: time the import and report which heavy modules it pulled in
+PROBE = """
+import sys, json, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+heavy = {heavy!r}
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in heavy if m in sys.modules]}}))
+"""
+
+def measure_import(module: str, agent_dir: str, repeats: int) -> Dict[str, Any]:
+    """Import a module in fresh interpreters and return the median import time"""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.path.join(AGENTS_DIR, agent_dir), env.get("PYTHONPATH")]))
+    # The agents read these at import; placeholders keep the probe offline
+    env.setdefault("NEXT_PUBLIC_SUPABASE_URL", "http://localhost")
+    env.setdefault("SUPABASE_SERVICE_KEY", "cold-start-benchmark")
+
+    samples: List[float] = []
+    loaded: List[str] = []
+    for _ in range(repeats):
+        completed = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            env=env, capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            return {"error": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "import failed"}
+        probe = json.loads(completed.stdout.strip().splitlines()[-1])
+        samples.append(probe["seconds"])
+        loaded = probe["loaded"]
+
+    return {
+        "median_seconds": statistics.median(samples),
+        "min_seconds": min(samples),
+        "max_seconds": max(samples),
+        "heavy_modules_loaded": loaded
+    }
+
+def run_benchmark(repeats: int = 5, budgets: Dict[str, float] = None) -> Dict[str, Any]:
+    """Measure every entry point and check it against its budget"""
+    budgets = budgets or {}
+    results = {}
+    passed = True
+
+    for module, entry in ENTRY_POINTS.items():
+        budget = budgets.get(module, entry["budget"])
+        result = measure_import(module, entry["dir"], repeats)
+        result["budget_seconds"] = budget
+
+        if "error" in result:
+            result["passed"] = False
+        else:
+            result["passed"] = result["median_seconds"] <= budget and not result["heavy_modules_loaded"]
+
+        passed = passed and result["passed"]
+        results[module] = result
+
+    return {"passed": passed, "repeats": repeats, "entry_points": results}
+
+def parse_budgets(values: List[str]) -> Dict[str, float]:
+    """Parse --budget name=seconds overrides"""
+    budgets = {}
+    for value in values or []:
+        name, _, seconds = value.partition("=")
+        if name not in ENTRY_POINTS or not seconds:
+            raise argparse.ArgumentTypeError(f"Invalid budget '{value}'. Use one of {', '.join(ENTRY_POINTS)}=<seconds>")
+        budgets[name] = float(seconds)
+    return budgets
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure agent import time against a cold-start budget")
+    parser.add_argument("--repeats", type=int, default=5, help="Fresh interpreter starts per entry point")
+    parser.add_argument("--budget", action="append", help="Override a budget, e.g. forecast_agent=0.5")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.repeats, parse_budgets(args.budget))
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for module, result in report["entry_points"].items():
+            status = "ok" if result["passed"] else "FAIL"
+            if "error" in result:
+                print(f"{module}: {status} ({result['error']})")
+                continue
+            print(f"{module}: {status} median {result['median_seconds']:.3f}s "
+                  f"(budget {result['budget_seconds']:.2f}s)")
+            if result["heavy_modules_loaded"]:
+                print(f"  heavy modules loaded at import: {', '.join(result['heavy_modules_loaded'])}")
+
+    sys.exit(0 if report["passed"] else 1)
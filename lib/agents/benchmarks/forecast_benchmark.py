@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Forecasting Benchmark for Teiden Dashboard Agents
+
+This script runs every forecast_model of the forecasting agent over synthetic
+usage series and reports fit time, peak Python memory and rolling-origin
+accuracy (MAPE and sMAPE), overall and per usage pattern. Results are saved as
+JSON so a run can be compared against one from another commit with --compare.
+
+It runs fully offline: usage comes from synthetic_usage.py, the LLM model uses
+the stub backend and model selection memory goes to a temporary directory.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import datetime
+import tempfile
+import tracemalloc
+import subprocess
+from typing import Dict, List, Any, Optional
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARKS_DIR), "forecasting-agent"))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+import forecast_agent
+from usage_cube import UsageCube
+from synthetic_usage import generate_series, to_usage_rows
+
+BENCHMARK_MODELS = ["statistical", "prophet", "ensemble", "llm", "auto", "global"]
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+
+# How much worse a result may get before --compare reports a regression
+TIME_TOLERANCE = 0.25  # relative increase in fit time
+MEMORY_TOLERANCE = 0.25  # relative increase in peak memory
+SMAPE_TOLERANCE = 1.0  # sMAPE points
+
+def build_frames(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Build each series' daily frame through the agent's usage cube"""
+    cube = UsageCube.from_rows(rows, series_fields=("api_key_id", "model"))
+    return {f"{key}/{model}": cube.frame((key, model)) for key, model in cube.series}
+
+def run_model(forecast_model: str, frames: Dict[str, Any], horizon_days: int) -> Dict[str, Any]:
+    """Forecast every series with one forecast_model the way the agent would.
+
+    Series go through the agent's forecast_series, so sparse and short series
+    take the closed-form path unless FORECAST_DEMAND_ROUTING is off.
+    """
+    # Keep LLM responses and selection winners from leaking between calls
+    forecast_agent.CACHE_DIR = tempfile.mkdtemp(prefix="forecast-benchmark-")
+    forecast_agent.LLM_BACKEND = "stub"
+
+    state = {
+        "user_id": "benchmark",
+        "project_id": None,
+        "provider": None,
+        "forecast_model": forecast_model,
+        "cost_mode": "fitted",
+        "reconciliation": "none",
+        "compute_budget": {"seconds": forecast_agent.DEFAULT_COMPUTE_BUDGET_SECONDS, "mode": "wall"},
+        "run_report": {}
+    }
+    return forecast_agent.forecast_series(state, frames, horizon_days)
+
+def mape(actual: np.ndarray, predicted: np.ndarray) -> Optional[float]:
+    """Mean absolute percentage error over the non-zero actual values"""
+    mask = actual != 0
+    if not mask.any():
+        return None
+    return float(np.mean(np.abs((actual[mask] - predicted[mask]) / actual[mask])) * 100)
+
+def backtest_model(forecast_model: str, frames: Dict[str, Any], horizon_days: int, folds: int, min_train: int) -> Dict[str, List[Dict[str, float]]]:
+    """Rolling-origin backtest of one forecast_model over every series at once.
+
+    Each fold cuts every long enough series fold x horizon days before its end and
+    forecasts the next horizon days. Returns per-series fold errors.
+    """
+    errors = {name: [] for name in frames}
+    for k in range(folds, 0, -1):
+        train, actual = {}, {}
+        for name, df in frames.items():
+            origin = len(df) - k * horizon_days
+            if origin < min_train:
+                continue
+            train[name] = df.iloc[:origin]
+            actual[name] = df[forecast_agent.FORECAST_METRICS].iloc[origin:origin + horizon_days].to_numpy(dtype=float)
+        if not train:
+            continue
+
+        forecasts = run_model(forecast_model, train, horizon_days)
+        for name, values in forecasts.items():
+            predicted = np.column_stack(values)[:len(actual[name])]
+            errors[name].append({
+                "smape": forecast_agent.smape(actual[name], predicted),
+                "mape": mape(actual[name], predicted)
+            })
+    return errors
+
+def summarize_errors(errors: Dict[str, List[Dict[str, float]]], patterns: Dict[str, List[str]]) -> Dict[str, Any]:
+    """Average fold errors overall and per usage pattern"""
+    def average(names):
+        folds = [fold for name in names for fold in errors[name]]
+        mapes = [fold["mape"] for fold in folds if fold["mape"] is not None]
+        return {
+            "smape": float(np.mean([fold["smape"] for fold in folds])) if folds else None,
+            "mape": float(np.mean(mapes)) if mapes else None,
+            "folds": len(folds)
+        }
+
+    by_pattern = {}
+    for pattern in sorted({pattern for names in patterns.values() for pattern in names} | {"plain"}):
+        names = [name for name in errors if pattern in patterns[name] or (pattern == "plain" and not patterns[name])]
+        if names:
+            by_pattern[pattern] = average(names)
+    return {**average(list(errors)), "by_pattern": by_pattern}
+
+def benchmark_model(forecast_model: str, frames: Dict[str, Any], patterns: Dict[str, List[str]], horizon_days: int,
+                    folds: int, min_train: int, measure_memory: bool = True) -> Dict[str, Any]:
+    """Time, trace and backtest one forecast_model"""
+    started = time.perf_counter()
+    run_model(forecast_model, frames, horizon_days)
+    fit_seconds = time.perf_counter() - started
+
+    # Traced separately, since tracing slows the fit down
+    peak_memory_mb = None
+    if measure_memory:
+        tracemalloc.start()
+        try:
+            run_model(forecast_model, frames, horizon_days)
+            peak_memory_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        finally:
+            tracemalloc.stop()
+
+    started = time.perf_counter()
+    errors = backtest_model(forecast_model, frames, horizon_days, folds, min_train)
+    backtest_seconds = time.perf_counter() - started
+
+    return {
+        "fit_seconds": fit_seconds,
+        "fit_ms_per_series": fit_seconds / max(len(frames), 1) * 1000,
+        "peak_memory_mb": peak_memory_mb,
+        "backtest_seconds": backtest_seconds,
+        "accuracy": summarize_errors(errors, patterns)
+    }
+
+def current_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARKS_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmark(models: List[str], series: int, days: int, horizon_days: int, folds: int, seed: int,
+                  measure_memory: bool = True) -> Dict[str, Any]:
+    """Generate the synthetic usage and benchmark every requested forecast_model"""
+    generated = generate_series(series, days, seed)
+    rows = to_usage_rows(generated)
+
+    started = time.perf_counter()
+    frames = build_frames(rows)
+    cube_seconds = time.perf_counter() - started
+
+    patterns = {f"{label['api_key_id']}/{label['model']}": series_patterns
+                for label, series_patterns in zip(generated["labels"], generated["patterns"])}
+    min_train = forecast_agent.SELECTION_MIN_TRAIN_DAYS
+
+    results = {}
+    for forecast_model in models:
+        print(f"Benchmarking {forecast_model}...", file=sys.stderr)
+        results[forecast_model] = benchmark_model(forecast_model, frames, patterns, horizon_days, folds, min_train, measure_memory)
+
+    return {
+        "commit": current_commit(),
+        "created_at": datetime.datetime.now().isoformat(),
+        "config": {"series": series, "days": days, "horizon_days": horizon_days, "folds": folds, "seed": seed, "rows": len(rows)},
+        "cube_build_seconds": cube_seconds,
+        "results": results
+    }
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[str]:
+    """List the regressions of current against baseline beyond the tolerances"""
+    regressions = []
+    if baseline.get("config") != current.get("config"):
+        print("Warning: benchmark configs differ, comparison may not be meaningful", file=sys.stderr)
+
+    for forecast_model, result in current["results"].items():
+        previous = baseline.get("results", {}).get(forecast_model)
+        if not previous:
+            continue
+        if result["fit_seconds"] > previous["fit_seconds"] * (1 + TIME_TOLERANCE):
+            regressions.append(f"{forecast_model}: fit time {previous['fit_seconds']:.2f}s -> {result['fit_seconds']:.2f}s")
+        if result["peak_memory_mb"] and previous.get("peak_memory_mb") and \
+                result["peak_memory_mb"] > previous["peak_memory_mb"] * (1 + MEMORY_TOLERANCE):
+            regressions.append(f"{forecast_model}: peak memory {previous['peak_memory_mb']:.1f}MB -> {result['peak_memory_mb']:.1f}MB")
+        before, after = previous["accuracy"]["smape"], result["accuracy"]["smape"]
+        if before is not None and after is not None and after > before + SMAPE_TOLERANCE:
+            regressions.append(f"{forecast_model}: sMAPE {before:.2f} -> {after:.2f}")
+    return regressions
+
+def print_report(report: Dict[str, Any]):
+    print(f"{'model':<12} {'fit s':>8} {'ms/series':>10} {'peak MB':>8} {'sMAPE':>7} {'MAPE':>8}")
+    for forecast_model, result in report["results"].items():
+        accuracy = result["accuracy"]
+        peak = f"{result['peak_memory_mb']:.1f}" if result["peak_memory_mb"] is not None else "-"
+        smape_text = f"{accuracy['smape']:.2f}" if accuracy["smape"] is not None else "-"
+        mape_text = f"{accuracy['mape']:.2f}" if accuracy["mape"] is not None else "-"
+        print(f"{forecast_model:<12} {result['fit_seconds']:>8.2f} {result['fit_ms_per_series']:>10.1f} {peak:>8} {smape_text:>7} {mape_text:>8}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the forecasting agent's models on synthetic usage")
+    parser.add_argument("--models", default=",".join(BENCHMARK_MODELS), help="Comma-separated forecast_model values")
+    parser.add_argument("--series", type=int, default=20)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--horizon_days", type=int, default=7)
+    parser.add_argument("--folds", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no_memory", action="store_true", help="Skip the traced run that measures peak memory")
+    parser.add_argument("--no_routing", action="store_true", help="Fit every series, skipping the closed-form routing")
+    parser.add_argument("--output", help="Results file (default: results/forecast-<commit>.json)")
+    parser.add_argument("--compare", help="Baseline results file; exits non-zero on regressions")
+    args = parser.parse_args()
+
+    # Prophet and Stan log every fit
+    for logger_name in ("prophet", "cmdstanpy"):
+        logging.getLogger(logger_name).setLevel(logging.ERROR)
+
+    models = [model for model in args.models.split(",") if model]
+    unknown = set(models) - set(BENCHMARK_MODELS)
+    if unknown:
+        parser.error(f"Unknown models: {', '.join(sorted(unknown))}")
+
+    forecast_agent.DEMAND_ROUTING = forecast_agent.DEMAND_ROUTING and not args.no_routing
+    report = run_benchmark(models, args.series, args.days, args.horizon_days, args.folds, args.seed, not args.no_memory)
+    print_report(report)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"forecast-{report['commit'] or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_results(json.load(f), report)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
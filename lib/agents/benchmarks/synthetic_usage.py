@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Synthetic Usage Generator for Teiden Dashboard Benchmarks
+
+This script generates realistic daily API usage for any number of series, shaped
+like usage_metrics rows. Each series mixes a random selection of the patterns
+real usage shows: trend, weekly seasonality, spikes, intermittent zero days and
+regime changes (a lasting level shift). Output is deterministic for a seed.
+"""
+
+import json
+import argparse
+import datetime
+from typing import Dict, List, Any, Optional
+import numpy as np
+
+# Models and their per-1M-token prices (input, output), used to price the usage
+SYNTHETIC_MODELS = {
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-4-turbo": (10.0, 30.0),
+    "gpt-3.5-turbo": (0.5, 1.5),
+    "text-embedding-3-small": (0.02, 0.0)
+}
+
+# Share of series that get each pattern
+PATTERN_RATES = {
+    "trend": 0.6,
+    "weekly_seasonality": 0.7,
+    "spikes": 0.3,
+    "intermittent": 0.25,
+    "regime_change": 0.2
+}
+
+def generate_series(series: int = 100, days: int = 90, seed: int = 0, pattern_rates: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """Generate daily usage as arrays.
+
+    Returns the series labels (user, project, key, model), the patterns each
+    series was given, the day dates and a (series x days x 3) array of
+    input tokens, output tokens and cost in USD.
+    """
+    rng = np.random.default_rng(seed)
+    rates = {**PATTERN_RATES, **(pattern_rates or {})}
+    t = np.arange(days)
+    model_names = list(SYNTHETIC_MODELS)
+
+    labels, patterns = [], []
+    values = np.zeros((series, days, 3))
+    for s in range(series):
+        model = model_names[rng.integers(len(model_names))]
+        labels.append({
+            "user_id": f"user-{s % max(series // 20, 1):03d}",
+            "project_id": f"project-{s % max(series // 5, 1):03d}",
+            "api_key_id": f"key-{s:05d}",
+            "model": model
+        })
+        has = {name: bool(rng.random() < rate) for name, rate in rates.items()}
+        patterns.append(sorted(name for name, present in has.items() if present))
+
+        # Baseline daily input tokens spread over a few orders of magnitude
+        level = np.full(days, rng.lognormal(mean=10, sigma=1.5))
+        if has["trend"]:
+            level *= np.exp(rng.normal(0.005, 0.015) * t)
+        if has["weekly_seasonality"]:
+            profile = 1 + rng.uniform(0.1, 0.6) * np.array([0.3, 0.4, 0.4, 0.35, 0.2, -0.8, -0.9])
+            level *= profile[(t + rng.integers(7)) % 7]
+        if has["regime_change"]:
+            change_day = rng.integers(days // 4, max(days * 3 // 4, days // 4 + 1))
+            level[change_day:] *= rng.choice([rng.uniform(0.2, 0.6), rng.uniform(1.5, 4.0)])
+
+        tokens_input = level * rng.lognormal(0, rng.uniform(0.05, 0.3), days)
+        if has["spikes"]:
+            spike_days = rng.random(days) < rng.uniform(0.02, 0.08)
+            tokens_input[spike_days] *= rng.uniform(3, 10, spike_days.sum())
+        if has["intermittent"]:
+            tokens_input[rng.random(days) < rng.uniform(0.3, 0.8)] = 0
+
+        tokens_output = tokens_input * rng.uniform(0.1, 0.6)
+        if model.startswith("text-embedding"):
+            tokens_output[:] = 0
+        input_price, output_price = SYNTHETIC_MODELS[model]
+        cost = (tokens_input * input_price + tokens_output * output_price) / 1_000_000
+
+        values[s, :, 0] = np.round(tokens_input)
+        values[s, :, 1] = np.round(tokens_output)
+        values[s, :, 2] = cost
+
+    end = datetime.date.today()
+    dates = [end - datetime.timedelta(days=days - 1 - d) for d in range(days)]
+    return {"labels": labels, "patterns": patterns, "dates": dates, "values": values}
+
+def to_usage_rows(generated: Dict[str, Any], provider: str = "openai") -> List[Dict[str, Any]]:
+    """Flatten generated series into usage_metrics-shaped rows, leaving out zero days"""
+    rows = []
+    for label, series_values in zip(generated["labels"], generated["values"]):
+        for date, (tokens_input, tokens_output, cost) in zip(generated["dates"], series_values):
+            if tokens_input == 0 and tokens_output == 0:
+                continue
+            rows.append({
+                **label,
+                "provider": provider,
+                "timestamp": f"{date.isoformat()}T12:00:00+00:00",
+                "tokens_input": int(tokens_input),
+                "tokens_output": int(tokens_output),
+                "cost_in_usd": round(float(cost), 6)
+            })
+    return rows
+
+def generate_usage_rows(series: int = 100, days: int = 90, seed: int = 0, provider: str = "openai") -> List[Dict[str, Any]]:
+    """Generate synthetic usage_metrics rows"""
+    return to_usage_rows(generate_series(series, days, seed), provider)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic usage_metrics rows as JSON")
+    parser.add_argument("--series", type=int, default=100)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the rows to this file instead of stdout")
+    args = parser.parse_args()
+
+    rows = generate_usage_rows(args.series, args.days, args.seed)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(rows, f)
+        print(f"Wrote {len(rows)} rows for {args.series} series to {args.output}")
+    else:
+        print(json.dumps(rows))
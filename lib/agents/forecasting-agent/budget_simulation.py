@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Budget-exhaustion simulation for the Teiden forecasting agent
+
+Turns point forecasts of daily cost into the probability of crossing a cost
+threshold and the distribution of when it happens. Historical residuals of
+every series are bootstrapped onto its forecast to draw thousands of future
+paths, with all series simulated together as NumPy arrays (in chunks that
+bound memory) rather than one series at a time.
+"""
+
+import os
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional
+import numpy as np
+
+# Paths drawn per series, and the most path x day values held in memory at once
+SIMULATION_PATHS = int(os.environ.get("FORECAST_SIMULATION_PATHS", 2000))
+SIMULATION_CHUNK_VALUES = int(os.environ.get("FORECAST_SIMULATION_CHUNK_VALUES", 20_000_000))
+
+# Chunks are simulated on this many threads (NumPy releases the GIL for the array work)
+SIMULATION_WORKERS = int(os.environ.get("FORECAST_SIMULATION_WORKERS", os.cpu_count() or 1))
+
+# Residuals are taken against a trailing mean of this many days
+RESIDUAL_WINDOW_DAYS = 7
+
+# Horizons the crossing probability is reported for
+REPORT_HORIZONS = {"7d": 7, "14d": 14, "30d": 30, "90d": 90}
+
+def trailing_mean_residuals(history: np.ndarray, first_day: np.ndarray, last_day: np.ndarray,
+                            window: int = RESIDUAL_WINDOW_DAYS):
+    """Residuals of each day against the mean of the window days before it.
+
+    history is (series x days). Only days with a full window inside a series'
+    span count. Returns a (series x days) array with each series' valid
+    residuals packed first, and the number of valid residuals per series.
+    """
+    series_count, days = history.shape
+    cumulative = np.concatenate([np.zeros((series_count, 1)), np.cumsum(history, axis=1)], axis=1)
+    residuals = np.zeros_like(history, dtype=float)
+    if days > window:
+        trailing = (cumulative[:, window:-1] - cumulative[:, :-window - 1]) / window
+        residuals[:, window:] = history[:, window:] - trailing
+
+    day_index = np.arange(days)
+    valid = (day_index >= first_day[:, None] + window) & (day_index <= last_day[:, None])
+
+    # Move each series' valid residuals to the front so they can be sampled by index
+    order = np.argsort(~valid, axis=1, kind="stable")
+    return np.take_along_axis(residuals, order, axis=1), valid.sum(axis=1)
+
+def simulate_budget_exhaustion(forecasts: np.ndarray, residuals: np.ndarray, residual_counts: np.ndarray,
+                               thresholds: np.ndarray, paths: int = SIMULATION_PATHS,
+                               seed: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """Simulate cumulative cost paths and when they cross each series' threshold.
+
+    forecasts is (series x horizon) daily cost, residuals/residual_counts come
+    from trailing_mean_residuals and thresholds is one cumulative cost per
+    series (NaN for none). Each path adds bootstrapped residuals to the
+    forecast, clipped at zero, so cumulative cost never decreases and the
+    crossing day is the number of days still under the threshold.
+
+    Returns per series the probability of crossing within the horizon, the
+    probability per REPORT_HORIZONS entry within the horizon, and the 10th,
+    50th and 90th percentile days to crossing among crossing paths (NaN if
+    no path crosses).
+    """
+    series_count, horizon_days = forecasts.shape
+    report_horizons = {name: days for name, days in REPORT_HORIZONS.items() if days <= horizon_days}
+
+    probability = np.zeros(series_count)
+    probability_by_horizon = {name: np.zeros(series_count) for name in report_horizons}
+    days_to_crossing = np.full((series_count, 3), np.nan)
+
+    # Only simulate series that could cross: with the largest residual every
+    # day, a series that still stays under its threshold never crosses
+    residuals = residuals.astype(np.float32)
+    has_residuals = np.arange(residuals.shape[1]) < residual_counts[:, None]
+    largest_residual = np.where(residual_counts > 0, np.where(has_residuals, residuals, -np.inf).max(axis=1), 0)
+    reachable = np.maximum(forecasts + largest_residual[:, None], 0).sum(axis=1)
+    active = np.flatnonzero(~np.isnan(thresholds) & (reachable >= np.nan_to_num(thresholds, nan=np.inf)))
+
+    # Split the memory budget across the worker threads
+    workers = max(1, SIMULATION_WORKERS)
+    chunk_size = max(1, SIMULATION_CHUNK_VALUES // workers // (paths * horizon_days))
+    chunks = [active[start:start + chunk_size] for start in range(0, len(active), chunk_size)]
+    chunk_seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+
+    def simulate_chunk(chunk, chunk_seed):
+        rng = np.random.default_rng(chunk_seed)
+        counts = residual_counts[chunk]
+
+        # Draw residual indexes uniformly within each series' valid residuals,
+        # with separate draws per series so series' crossings are independent
+        uniform = rng.random((len(chunk), paths * horizon_days), dtype=np.float32)
+        draws = (uniform * counts[:, None]).astype(np.int64)
+        np.minimum(draws, np.maximum(counts - 1, 0)[:, None], out=draws)
+        sampled = np.take_along_axis(residuals[chunk], draws, axis=1).reshape(len(chunk), paths, horizon_days)
+        sampled[counts == 0] = 0
+
+        sampled += forecasts[chunk, None, :].astype(np.float32)
+        np.maximum(sampled, 0, out=sampled)
+        cumulative = np.cumsum(sampled, axis=2, out=sampled)
+
+        # Days under the threshold; horizon_days means the path never crossed
+        crossing_day = (cumulative < thresholds[chunk, None, None]).sum(axis=2)
+        crossed = crossing_day < horizon_days
+
+        # Chunks cover disjoint series, so threads write to disjoint entries
+        probability[chunk] = crossed.mean(axis=1)
+        for name, days in report_horizons.items():
+            probability_by_horizon[name][chunk] = (crossing_day < days).mean(axis=1)
+
+        # Percentiles over crossing paths only (day 1 is tomorrow)
+        has_crossing = crossed.any(axis=1)
+        if has_crossing.any():
+            masked = np.where(crossed[has_crossing], crossing_day[has_crossing] + 1, np.nan)
+            days_to_crossing[chunk[has_crossing]] = np.nanpercentile(masked, [10, 50, 90], axis=1).T
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(simulate_chunk, chunks, chunk_seeds))
+
+    return {
+        "probability": probability,
+        "probability_by_horizon": probability_by_horizon,
+        "days_to_crossing": days_to_crossing
+    }
+
+def summarize_simulation(simulation: Dict[str, np.ndarray], index: int) -> Dict[str, Any]:
+    """One series' simulation results as plain JSON-friendly values"""
+    p10, p50, p90 = (None if np.isnan(value) else float(value) for value in simulation["days_to_crossing"][index])
+    return {
+        "probability": float(simulation["probability"][index]),
+        "probability_by_horizon": {name: float(values[index]) for name, values in simulation["probability_by_horizon"].items()},
+        "days_to_crossing": {"p10": p10, "p50": p50, "p90": p90}
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time a fleet-wide budget-exhaustion simulation on random data")
+    parser.add_argument("--series", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=90, help="Days of history per series")
+    parser.add_argument("--horizon_days", type=int, default=90)
+    parser.add_argument("--paths", type=int, default=SIMULATION_PATHS)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    level = rng.lognormal(0, 1, (args.series, 1))
+    history = np.maximum(level * (1 + rng.normal(0, 0.3, (args.series, args.days))), 0)
+    forecasts = np.repeat(level, args.horizon_days, axis=1)
+    thresholds = level[:, 0] * args.horizon_days * rng.uniform(0.8, 1.2, args.series)
+
+    started = time.perf_counter()
+    residuals, counts = trailing_mean_residuals(history, np.zeros(args.series, dtype=int), np.full(args.series, args.days - 1))
+    simulation = simulate_budget_exhaustion(forecasts, residuals, counts, thresholds, args.paths, args.seed)
+    elapsed = time.perf_counter() - started
+
+    print(f"Simulated {args.series} series x {args.paths} paths x {args.horizon_days} days in {elapsed:.2f}s")
+    print(f"Mean crossing probability: {simulation['probability'].mean():.3f}")
@@ -8,18 +8,35 @@ future usage patterns and stores the forecasts back in Supabase.
 """
 
 import os
+import sys
 import json
+import argparse
+import time
+import hashlib
 import datetime
+import threading
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import lru_cache
 from typing import Dict, List, Any, Optional, TypedDict, Literal
 from dotenv import load_dotenv
-import pandas as pd
 import numpy as np
-from supabase import create_client
-from statsmodels.tsa.holtwinters import ExponentialSmoothing
-from prophet import Prophet
-from langchain.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
-from langgraph.graph import StateGraph, END
+from usage_cube import UsageCube
+from hierarchy import Hierarchy, HIERARCHY_FIELDS, HIERARCHY_LEVELS, reconcile
+from budget_simulation import trailing_mean_residuals, simulate_budget_exhaustion, summarize_simulation
+from global_model import forecast_global
+from intermittent_demand import DEMAND_PATHS, SEASONAL_PERIOD, SHORT_SERIES_DAYS, classify_demand, croston_sba_forecast, seasonal_naive_forecast
+
+# Statistics shared with the other agents live in lib/agents
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from series_stats import SeriesStats, combined_summary, query_series_statistics
+from online_holt_winters import (
+    filter_state_from_fit, frozen_filter_state, stack_filter_states, unstack_filter_states, advance_filter_states, forecast_filter_states
+)
+
+# pandas, statsmodels, prophet, langchain_openai, langgraph and supabase are
+# imported where they are first needed, so a run only pays for the code path
+# it takes (see benchmarks/cold_start.py)
 
 # Load environment variables
 load_dotenv()
@@ -27,23 +44,118 @@ supabase_url = os.environ.get("NEXT_PUBLIC_SUPABASE_URL")
 supabase_key = os.environ.get("SUPABASE_SERVICE_KEY", os.environ.get("NEXT_PUBLIC_SUPABASE_ANON_KEY"))
 openai_api_key = os.environ.get("OPENAI_API_KEY")
 
-# Initialize Supabase client
-supabase = create_client(supabase_url, supabase_key)
+# Supabase client, created on first use
+_supabase = None
+
+def get_supabase():
+    """Return the shared Supabase client, creating it on first use"""
+    global _supabase
+    if _supabase is None:
+        from supabase import create_client
+        _supabase = create_client(supabase_url, supabase_key)
+    return _supabase
+
+# Directory for state the agent remembers between runs
+CACHE_DIR = os.environ.get(
+    "TEIDEN_AGENT_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+)
+
+# usage_metrics columns the cube is built from
+USAGE_COLUMNS = "timestamp,model,tokens_input,tokens_output,cost_in_usd"
+HIERARCHY_USAGE_COLUMNS = USAGE_COLUMNS + ",user_id,project_id,api_key_id"
+
+# Metrics forecast for every series, in the order forecasters return them
+FORECAST_METRICS = ["tokens_input", "tokens_output", "cost_in_usd"]
+TOKEN_METRICS = ["tokens_input", "tokens_output"]
+
+# Versioned per-model prices used when cost_mode="derived"
+PRICE_TABLE_PATH = os.environ.get(
+    "MODEL_PRICE_TABLE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_prices.json")
+)
+COST_DIVERGENCE_TOLERANCE = 0.05  # fit a residual correction past 5% observed vs priced cost
+
+# Settings for forecast_model="auto" (compute-budgeted model selection)
+SELECTION_MARGIN = 0.1  # expensive models must beat statistical sMAPE by 10%
+SELECTION_FOLDS = 3  # rolling origins per backtest
+SELECTION_MIN_TRAIN_DAYS = 10
+SELECTION_TTL_DAYS = 7  # how long a remembered winner is reused without a backtest
+DEFAULT_COMPUTE_BUDGET_SECONDS = 60
+# Seconds assumed for one Prophet forecast until the run has timed one
+SELECTION_PROPHET_SECONDS = float(os.environ.get("FORECAST_SELECTION_PROPHET_SECONDS", 1.0))
+
+# Settings for forecast_model="llm"
+LLM_BACKEND = os.environ.get("FORECAST_LLM_BACKEND", "openai")  # "openai" or the offline "stub"
+LLM_TOKEN_BUDGET = int(os.environ.get("FORECAST_LLM_TOKEN_BUDGET", 8000))  # per batched request
+LLM_MAX_CONCURRENCY = int(os.environ.get("FORECAST_LLM_MAX_CONCURRENCY", 4))
+LLM_CONTEXT_DAYS = 14
+
+# Number of forecast runs kept per scope, including the published one
+FORECAST_RUN_RETENTION = int(os.environ.get("FORECAST_RUN_RETENTION", 5))
+
+# "rows" writes one forecasts row per model per day; "compact" writes one
+# forecast_series row per model holding the whole horizon as arrays
+FORECAST_STORAGE_LAYOUT = os.environ.get("FORECAST_STORAGE_LAYOUT", "rows")
+
+# Completed forecast results kept in memory, reused while their usage data is unchanged
+FORECAST_CACHE_SIZE = int(os.environ.get("FORECAST_CACHE_SIZE", 128))
+
+# Concurrent forecast runs allowed per tenant (user) and per process, and how many
+# runs may wait for a slot (and for how long) before new ones are rejected
+FORECAST_TENANT_CONCURRENCY = int(os.environ.get("FORECAST_TENANT_CONCURRENCY", 2))
+FORECAST_MAX_CONCURRENCY = int(os.environ.get("FORECAST_MAX_CONCURRENCY", os.cpu_count() or 4))
+FORECAST_QUEUE_LIMIT = int(os.environ.get("FORECAST_QUEUE_LIMIT", 16))
+FORECAST_QUEUE_TIMEOUT = float(os.environ.get("FORECAST_QUEUE_TIMEOUT", 300))
+
+# Progressive runs of these models answer with a statistical forecast within
+# FORECAST_PRELIMINARY_SECONDS and refine on FORECAST_REFINE_WORKERS background threads
+PROGRESSIVE_MODELS = {"prophet", "ensemble", "llm", "auto"}
+FORECAST_PRELIMINARY_SECONDS = float(os.environ.get("FORECAST_PRELIMINARY_SECONDS", 3))
+FORECAST_REFINE_WORKERS = int(os.environ.get("FORECAST_REFINE_WORKERS", 2))
+
+# Per-series models whose sparse and short series are routed to closed-form forecasts (see intermittent_demand.py)
+ROUTED_MODELS = {"statistical", "prophet", "ensemble", "auto"}
+DEMAND_ROUTING = os.environ.get("FORECAST_DEMAND_ROUTING", "on") != "off"
+
+# Days held out to validate the global model per series; series where it loses to their
+# closed-form forecast get that instead (0 turns validation off)
+GLOBAL_VALIDATION_DAYS = int(os.environ.get("FORECAST_GLOBAL_VALIDATION_DAYS", 7))
+
+# Days of history or forecast per timeframe value
+TIMEFRAME_DAYS = {"7d": 7, "14d": 14, "30d": 30, "90d": 90}
+
+# Every series is fitted once on the longest history for the longest horizon;
+# shorter timeframe and horizon requests are served by slicing that forecast
+FIT_TIMEFRAME = os.environ.get("FORECAST_FIT_TIMEFRAME", "90d")
+FIT_HORIZON = os.environ.get("FORECAST_FIT_HORIZON", "90d")
+
+# Published models whose scopes run_online_update may refresh from the saved filter states
+ONLINE_UPDATE_MODELS = {"statistical", "statistical_online"}
 
 # Define state types
 class ForecastState(TypedDict):
     user_id: Optional[str]
     project_id: Optional[str]
     provider: Optional[str]
-    usage_data: Optional[List[Dict[str, Any]]]
+    usage_cube: Optional[UsageCube]
+    hierarchy_cube: Optional[UsageCube]
+    data_analysis: Dict[str, Any]
     forecast_results: Optional[Dict[str, Any]]
     error: Optional[str]
     status: Literal["initialized", "fetching_data", "analyzing_data", "forecasting", "storing_results", "completed", "error"]
     timeframe: Literal["7d", "14d", "30d", "90d"]
     forecast_horizon: Literal["7d", "14d", "30d", "90d"]
-    forecast_model: Literal["statistical", "prophet", "ensemble", "llm"]
+    forecast_model: Literal["statistical", "prophet", "ensemble", "llm", "auto", "global"]
     models_to_forecast: List[str]
     threshold_alerts: Dict[str, Any]
+    compute_budget: Optional[Dict[str, Any]]
+    cost_mode: Literal["fitted", "derived"]
+    storage_layout: Literal["rows", "compact"]
+    reconciliation: Literal["none", "bottom_up", "mint"]
+    filter_states: Optional[Dict[str, Any]]
+    quality_tier: Literal["preliminary", "final"]
+    run_report: Dict[str, Any]
 
 # Define forecasting methods
 def fetch_historical_data(state: ForecastState) -> ForecastState:
@@ -69,7 +181,9 @@ def fetch_historical_data(state: ForecastState) -> ForecastState:
         end_date_str = end_date.isoformat()
         
         # Build the query based on provided filters
-        query = supabase.table("usage_metrics").select("*").gte("timestamp", start_date_str).lte("timestamp", end_date_str)
+        hierarchical = (state.get("reconciliation") or "none") != "none"
+        columns = HIERARCHY_USAGE_COLUMNS if hierarchical else USAGE_COLUMNS
+        query = get_supabase().table("usage_metrics").select(columns).gte("timestamp", start_date_str).lte("timestamp", end_date_str)
         
         # Apply filters if provided
         if state["user_id"]:
@@ -88,14 +202,18 @@ def fetch_historical_data(state: ForecastState) -> ForecastState:
             state["status"] = "error"
             return state
             
-        # Update state with fetched data
-        data = response.data
-        state["usage_data"] = data
+        # Aggregate the rows into the daily cube every later node reads
+        if hierarchical:
+            # Keep the bottom-level series for reconciliation; per-model totals are summed from them
+            state["hierarchy_cube"] = UsageCube.from_rows(response.data, series_fields=HIERARCHY_FIELDS)
+            cube = state["hierarchy_cube"].aggregate(("model",))
+        else:
+            cube = UsageCube.from_rows(response.data)
+        state["usage_cube"] = cube
         
         # Extract unique models to forecast if not specified
         if not state["models_to_forecast"]:
-            models = set(item["model"] for item in data)
-            state["models_to_forecast"] = list(models)
+            state["models_to_forecast"] = list(cube.series)
             
         return state
     except Exception as e:
@@ -109,82 +227,36 @@ def analyze_data(state: ForecastState) -> ForecastState:
         state = state.copy()
         state["status"] = "analyzing_data"
         
-        if not state["usage_data"]:
+        cube = state.get("usage_cube")
+        if cube is None or not cube.row_count:
             state["error"] = "No historical data available for analysis"
             state["status"] = "error"
             return state
-            
-        # Convert to pandas DataFrame for analysis
-        df = pd.DataFrame(state["usage_data"])
-        
-        # Convert timestamp to datetime
-        df["timestamp"] = pd.to_datetime(df["timestamp"])
-        df = df.sort_values("timestamp")
-        
-        # Group by date, model and sum the tokens
-        daily_usage = df.groupby([pd.Grouper(key="timestamp", freq="D"), "model"]).agg({
-            "tokens_input": "sum",
-            "tokens_output": "sum",
-            "cost_in_usd": "sum"
-        }).reset_index()
-        
-        # Analyze growth rate for each model
-        model_analysis = {}
+        
+        # Models whose stored statistics are current are read from the statistics store
+        model_analysis = load_model_statistics(state, cube)
+        statistics_models = len(model_analysis)
+        
+        # Analyze growth rate for each remaining model over its gap-free daily series
         for model in state["models_to_forecast"]:
-            model_data = daily_usage[daily_usage["model"] == model]
-            
-            if len(model_data) <= 1:
-                model_analysis[model] = {
-                    "avg_daily_input_tokens": float(model_data["tokens_input"].mean() if not model_data.empty else 0),
-                    "avg_daily_output_tokens": float(model_data["tokens_output"].mean() if not model_data.empty else 0),
-                    "avg_daily_cost": float(model_data["cost_in_usd"].mean() if not model_data.empty else 0),
-                    "growth_rate": 0.0,
-                    "volatility": 0.0,
-                    "data_points": len(model_data)
-                }
-                continue
-                
-            # Calculate growth rate
-            if len(model_data) >= 7:
-                # Use 7-day average at beginning and end
-                start_avg = model_data.iloc[:7]["tokens_input"].mean() + model_data.iloc[:7]["tokens_output"].mean()
-                end_avg = model_data.iloc[-7:]["tokens_input"].mean() + model_data.iloc[-7:]["tokens_output"].mean()
-                
-                if start_avg > 0:
-                    growth_rate = (end_avg / start_avg - 1) * 100
-                else:
-                    growth_rate = 0
-            else:
-                # If less than 7 days, use simple start/end comparison
-                start_val = model_data.iloc[0]["tokens_input"] + model_data.iloc[0]["tokens_output"]
-                end_val = model_data.iloc[-1]["tokens_input"] + model_data.iloc[-1]["tokens_output"]
-                
-                if start_val > 0:
-                    growth_rate = (end_val / start_val - 1) * 100
-                else:
-                    growth_rate = 0
-            
-            # Calculate volatility (standard deviation of daily percentage changes)
-            total_tokens = model_data["tokens_input"] + model_data["tokens_output"]
-            pct_changes = total_tokens.pct_change().dropna()
-            volatility = float(pct_changes.std() * 100) if not pct_changes.empty else 0
-            
-            model_analysis[model] = {
-                "avg_daily_input_tokens": float(model_data["tokens_input"].mean()),
-                "avg_daily_output_tokens": float(model_data["tokens_output"].mean()),
-                "avg_daily_cost": float(model_data["cost_in_usd"].mean()),
-                "growth_rate": float(growth_rate),
-                "volatility": volatility,
-                "data_points": len(model_data),
-                "last_7_days_avg_cost": float(model_data.iloc[-7:]["cost_in_usd"].mean() if len(model_data) >= 7 else model_data["cost_in_usd"].mean())
-            }
+            if model not in model_analysis:
+                model_analysis[model] = series_analysis(cube.series_values(model) if model in cube else np.zeros((0, len(cube.metrics))))
         
         # Update state with analysis results
         state["data_analysis"] = {
             "model_analysis": model_analysis,
-            "total_days": len(df["timestamp"].dt.date.unique()),
-            "total_api_calls_estimate": int(df["tokens_input"].sum() / 1000),  # rough estimate assuming 1k tokens per call
-            "total_cost": float(df["cost_in_usd"].sum())
+            "total_days": cube.observed_days(),
+            "total_api_calls_estimate": int(cube.totals("tokens_input").sum() / 1000),  # rough estimate assuming 1k tokens per call
+            "total_cost": float(cube.totals("cost_in_usd").sum()),
+            "statistics_source": {"series_statistics": statistics_models, "usage_cube": len(model_analysis) - statistics_models}
+        }
+        
+        # The same analysis over each shorter timeframe, for requests served from this run's fit
+        fitted_days = TIMEFRAME_DAYS.get(state["timeframe"], 90)
+        state["data_analysis"]["by_timeframe"] = {
+            timeframe: timeframe_analysis(cube, state["models_to_forecast"], days)
+            for timeframe, days in TIMEFRAME_DAYS.items()
+            if days < fitted_days
         }
         
         return state
@@ -193,86 +265,144 @@ def analyze_data(state: ForecastState) -> ForecastState:
         state["status"] = "error"
         return state
 
+def series_analysis(model_data: np.ndarray) -> Dict[str, Any]:
+    """Averages, growth rate and volatility of a (days x metrics) daily series"""
+    input_tokens, output_tokens, cost = model_data.T
+    
+    if len(model_data) <= 1:
+        return {
+            "avg_daily_input_tokens": float(input_tokens.mean()) if len(model_data) else 0.0,
+            "avg_daily_output_tokens": float(output_tokens.mean()) if len(model_data) else 0.0,
+            "avg_daily_cost": float(cost.mean()) if len(model_data) else 0.0,
+            "growth_rate": 0.0,
+            "volatility": 0.0,
+            "data_points": len(model_data)
+        }
+    
+    total_tokens = input_tokens + output_tokens
+    
+    # Calculate growth rate
+    if len(model_data) >= 7:
+        # Use 7-day average at beginning and end
+        start_avg = total_tokens[:7].mean()
+        end_avg = total_tokens[-7:].mean()
+        growth_rate = (end_avg / start_avg - 1) * 100 if start_avg > 0 else 0
+    else:
+        # If less than 7 days, use simple start/end comparison
+        growth_rate = (total_tokens[-1] / total_tokens[0] - 1) * 100 if total_tokens[0] > 0 else 0
+    
+    # Calculate volatility (standard deviation of daily percentage changes, skipping zero days)
+    previous = total_tokens[:-1]
+    pct_changes = total_tokens[1:][previous > 0] / previous[previous > 0] - 1
+    volatility = float(pct_changes.std(ddof=1) * 100) if len(pct_changes) > 1 else 0
+    
+    return {
+        "avg_daily_input_tokens": float(input_tokens.mean()),
+        "avg_daily_output_tokens": float(output_tokens.mean()),
+        "avg_daily_cost": float(cost.mean()),
+        "growth_rate": float(growth_rate),
+        "volatility": volatility,
+        "data_points": len(model_data),
+        "last_7_days_avg_cost": float(cost[-7:].mean())
+    }
+
+def timeframe_analysis(cube: UsageCube, models: List[str], days: int) -> Dict[str, Any]:
+    """analyze_data's figures over the last days of the cube, as a fetch of that timeframe would give them"""
+    start = np.datetime64((datetime.datetime.now() - datetime.timedelta(days=days)).date()) + 1
+    in_range = cube.days >= start
+    model_analysis = {}
+    for model in models:
+        model_data = np.zeros((0, len(cube.metrics)))
+        if model in cube:
+            # Each series starts at its first row in the timeframe
+            span = cube.span(model)
+            observed = cube.observed[cube.index[model], span] & in_range[span]
+            if observed.any():
+                model_data = cube.series_values(model)[observed.argmax():len(observed) - observed[::-1].argmax()]
+        model_analysis[model] = series_analysis(model_data)
+    
+    values = cube.values[:, in_range]
+    return {
+        "model_analysis": model_analysis,
+        "total_days": int(cube.observed[:, in_range].any(axis=0).sum()),
+        "total_api_calls_estimate": int(values[:, :, cube.metric_index["tokens_input"]].sum() / 1000),
+        "total_cost": float(values[:, :, cube.metric_index["cost_in_usd"]].sum())
+    }
+
+def load_model_statistics(state: ForecastState, cube: UsageCube) -> Dict[str, Dict[str, Any]]:
+    """Per-model statistics from the series_statistics store.
+    
+    Only models whose statistics reach the last day the cube holds for them are
+    returned, so usage the store hasn't seen yet is never skipped. Statistics
+    cover each series since it was first ingested rather than the timeframe.
+    """
+    try:
+        rows = query_series_statistics(get_supabase(), state["user_id"], state["project_id"], state["provider"])
+    except Exception as e:
+        print(f"Could not read series statistics: {str(e)}")
+        return {}
+    
+    stats_by_model = defaultdict(list)
+    for row in rows:
+        if row["model"] in state["models_to_forecast"] and row["model"] in cube:
+            stats_by_model[row["model"]].append(SeriesStats.from_dict(row["stats"]))
+    
+    model_statistics = {}
+    for model, stats_list in stats_by_model.items():
+        cube_last_day = datetime.date.fromisoformat(str(cube.days[cube.last_day[cube.index[model]]]))
+        if max(stats.last_day for stats in stats_list) >= cube_last_day:
+            model_statistics[model] = combined_summary(stats_list)
+    return model_statistics
+
 def generate_forecast(state: ForecastState) -> ForecastState:
     """Generate forecasts based on historical data using the selected forecasting model"""
     try:
         state = state.copy()
         state["status"] = "forecasting"
         
-        if not state["usage_data"]:
+        cube = state.get("usage_cube")
+        if cube is None or not cube.row_count:
             state["error"] = "No historical data available for forecasting"
             state["status"] = "error"
             return state
-            
-        # Convert to pandas DataFrame
-        df = pd.DataFrame(state["usage_data"])
-        df["timestamp"] = pd.to_datetime(df["timestamp"])
         
         # Determine forecast horizon in days
-        if state["forecast_horizon"] == "7d":
-            horizon_days = 7
-        elif state["forecast_horizon"] == "14d":
-            horizon_days = 14
-        elif state["forecast_horizon"] == "30d":
-            horizon_days = 30
-        else:  # 90d
-            horizon_days = 90
-            
-        # Generate forecasts for each model
-        forecasts = {}
-        for model_name in state["models_to_forecast"]:
-            model_df = df[df["model"] == model_name].copy()
-            
-            if model_df.empty:
-                continue
-                
-            # Group by day
-            model_df = model_df.groupby(pd.Grouper(key="timestamp", freq="D")).agg({
-                "tokens_input": "sum",
-                "tokens_output": "sum",
-                "cost_in_usd": "sum"
-            }).reset_index()
-            
-            # Fill missing dates with zeros
-            date_range = pd.date_range(start=model_df["timestamp"].min(), end=model_df["timestamp"].max(), freq="D")
-            model_df = model_df.set_index("timestamp").reindex(date_range, fill_value=0).reset_index().rename(columns={"index": "timestamp"})
-            
-            # Select forecasting method based on state
-            if state["forecast_model"] == "statistical":
-                # Use Holt-Winters exponential smoothing
-                input_forecast, output_forecast, cost_forecast = statistical_forecast(model_df, horizon_days)
-            elif state["forecast_model"] == "prophet":
-                # Use Facebook Prophet
-                input_forecast, output_forecast, cost_forecast = prophet_forecast(model_df, horizon_days)
-            elif state["forecast_model"] == "ensemble":
-                # Use ensemble of methods
-                input_forecast, output_forecast, cost_forecast = ensemble_forecast(model_df, horizon_days)
-            else:  # "llm"
-                # Use LLM-based forecasting
-                input_forecast, output_forecast, cost_forecast = llm_forecast(model_df, horizon_days, model_name, openai_api_key)
-            
-            # Store forecasts
-            forecast_dates = [
-                (datetime.datetime.now() + datetime.timedelta(days=i)).strftime("%Y-%m-%d")
-                for i in range(1, horizon_days + 1)
-            ]
-            
-            forecasts[model_name] = {
-                "dates": forecast_dates,
-                "tokens_input": [float(val) for val in input_forecast],
-                "tokens_output": [float(val) for val in output_forecast],
-                "cost_in_usd": [float(val) for val in cost_forecast],
-                "total_forecast_cost": float(sum(cost_forecast)),
-                "total_forecast_tokens": float(sum(input_forecast) + sum(output_forecast))
+        horizon_days = TIMEFRAME_DAYS.get(state["forecast_horizon"], 90)
+        
+        forecast_dates = [
+            (datetime.datetime.now() + datetime.timedelta(days=i)).strftime("%Y-%m-%d")
+            for i in range(1, horizon_days + 1)
+        ]
+        
+        reconciliation = state.get("reconciliation") or "none"
+        hierarchy_results = None
+        if reconciliation != "none":
+            # Fit only the bottom-level series and derive every other level from them
+            series_forecasts, hierarchy_results = hierarchical_forecast(state, horizon_days, forecast_dates)
+        else:
+            # Each model's gap-free daily series, read from the cube
+            model_frames = {
+                model_name: cube.frame(model_name)
+                for model_name in state["models_to_forecast"]
+                if model_name in cube
             }
+            series_forecasts = forecast_series(state, model_frames, horizon_days)
+        
+        forecasts = {
+            model_name: forecast_entry(forecast_dates, *values)
+            for model_name, values in series_forecasts.items()
+        }
             
         # Update state with forecasts
         state["forecast_results"] = {
             "forecasts": forecasts,
             "generated_at": datetime.datetime.now().isoformat(),
             "forecast_horizon": state["forecast_horizon"],
-            "forecast_model": state["forecast_model"]
+            "forecast_model": state["forecast_model"],
+            "cost_mode": state.get("cost_mode") or "fitted"
         }
+        if hierarchy_results:
+            state["forecast_results"]["hierarchy"] = hierarchy_results
         
         return state
     except Exception as e:
@@ -280,179 +410,764 @@ def generate_forecast(state: ForecastState) -> ForecastState:
         state["status"] = "error"
         return state
 
-def statistical_forecast(df, horizon_days):
-    """Generate forecast using Holt-Winters exponential smoothing"""
-    # For tokens_input
-    input_model = ExponentialSmoothing(
-        df["tokens_input"],
-        trend="add",
-        seasonal="add" if len(df) >= 14 else None,
-        seasonal_periods=7 if len(df) >= 14 else None
-    ).fit()
-    input_forecast = input_model.forecast(horizon_days)
+def forecast_series(state: ForecastState, model_frames, horizon_days, series_models=None):
+    """Forecast every series in model_frames with the state's forecast_model and cost_mode.
     
-    # For tokens_output
-    output_model = ExponentialSmoothing(
-        df["tokens_output"],
-        trend="add",
-        seasonal="add" if len(df) >= 14 else None,
-        seasonal_periods=7 if len(df) >= 14 else None
-    ).fit()
-    output_forecast = output_model.forecast(horizon_days)
+    series_models maps series names to model names for pricing when the series
+    aren't named by model. Reports of the run are merged into state["run_report"].
+    """
+    # In derived cost mode only the token series are fitted
+    cost_mode = state.get("cost_mode") or "fitted"
+    metrics = TOKEN_METRICS if cost_mode == "derived" else FORECAST_METRICS
     
-    # For cost_in_usd
-    cost_model = ExponentialSmoothing(
-        df["cost_in_usd"],
-        trend="add",
-        seasonal="add" if len(df) >= 14 else None,
-        seasonal_periods=7 if len(df) >= 14 else None
-    ).fit()
-    cost_forecast = cost_model.forecast(horizon_days)
+    # Sparse, intermittent and very short series skip the fitted models
+    fast_forecasts = {}
+    dense_frames = model_frames
+    if DEMAND_ROUTING and state["forecast_model"] in ROUTED_MODELS:
+        dense_frames, fast_forecasts, routing_report = route_series(model_frames, horizon_days, metrics)
+        state["run_report"] = {**(state.get("run_report") or {}), "routing": routing_report}
     
-    # Ensure non-negative values
-    input_forecast = np.maximum(input_forecast, 0)
-    output_forecast = np.maximum(output_forecast, 0)
-    cost_forecast = np.maximum(cost_forecast, 0)
+    # Select forecasting method based on state
+    if state["forecast_model"] == "auto":
+        # Pick a method per series with backtests under the compute budget
+        budget_settings = state.get("compute_budget") or {}
+        budget = ComputeBudget(
+            budget_settings.get("seconds", DEFAULT_COMPUTE_BUDGET_SECONDS),
+            budget_settings.get("mode", "wall")
+        )
+        series_forecasts, selection_report = select_and_forecast(dense_frames, horizon_days, budget, state, metrics)
+        state["run_report"] = {**(state.get("run_report") or {}), "model_selection": selection_report}
+    elif state["forecast_model"] == "llm":
+        # Use LLM-based forecasting, batching every series into a few requests
+        series_forecasts, llm_report = llm_forecast(model_frames, horizon_days, metrics)
+        state["run_report"] = {**(state.get("run_report") or {}), "llm": llm_report}
+    elif state["forecast_model"] == "global":
+        # One model trained across every series, with batched inference
+        series_forecasts, global_report = global_forecast(model_frames, horizon_days, metrics)
+        state["run_report"] = {**(state.get("run_report") or {}), "global_model": global_report}
+    elif state["forecast_model"] == "statistical" and cost_mode == "fitted" and (state.get("reconciliation") or "none") == "none":
+        # Keep each model's Holt-Winters states so new days can be filtered in until the next refit
+        filter_states = {model_name: {} for model_name in dense_frames}
+        series_forecasts = {
+            model_name: statistical_forecast(model_df, horizon_days, metrics, filter_states[model_name])
+            for model_name, model_df in dense_frames.items()
+        }
+        
+        # Routed series keep their closed-form forecast until the next full fit
+        for model_name, values in fast_forecasts.items():
+            last_day = model_frames[model_name]["timestamp"].iloc[-1].strftime("%Y-%m-%d")
+            filter_states[model_name] = {metric: frozen_filter_state(metric_values, last_day) for metric, metric_values in zip(metrics, values)}
+        state["filter_states"] = filter_states
+    else:
+        # Holt-Winters, Prophet or an ensemble of both
+        series_forecasts = {
+            model_name: FORECASTERS[state["forecast_model"]](model_df, horizon_days, metrics)
+            for model_name, model_df in dense_frames.items()
+        }
     
-    return input_forecast, output_forecast, cost_forecast
+    if fast_forecasts:
+        series_forecasts = {
+            model_name: tuple(values[:horizon_days] for values in fast_forecasts[model_name]) if model_name in fast_forecasts else series_forecasts[model_name]
+            for model_name in model_frames
+        }
+    
+    if cost_mode == "derived":
+        # Price the token forecasts instead of forecasting cost separately
+        series_forecasts, cost_report = derive_cost_forecasts(model_frames, series_forecasts, horizon_days, load_price_table(), series_models)
+        state["run_report"] = {**(state.get("run_report") or {}), "cost_derivation": cost_report}
+    
+    return series_forecasts
+
+def series_demand_class(df) -> str:
+    """Demand class of a series, on total tokens or on cost for series that don't report tokens"""
+    demand = df["tokens_input"].to_numpy(dtype=float) + df["tokens_output"].to_numpy(dtype=float)
+    if not demand.any():
+        demand = df["cost_in_usd"].to_numpy(dtype=float)
+    return classify_demand(demand)
+
+def closed_form_forecast(df, horizon_days, metrics=FORECAST_METRICS):
+    """Croston forecast of a sparse series, seasonal naive forecast of any other, per metric"""
+    forecaster = croston_sba_forecast if DEMAND_PATHS[series_demand_class(df)] == "croston_sba" else seasonal_naive_forecast
+    return tuple(forecaster(df[metric].to_numpy(dtype=float), horizon_days) for metric in metrics)
 
-def prophet_forecast(df, horizon_days):
-    """Generate forecast using Facebook Prophet"""
-    # Prepare dataframes in Prophet format
-    prophet_input_df = df[["timestamp", "tokens_input"]].rename(columns={"timestamp": "ds", "tokens_input": "y"})
-    prophet_output_df = df[["timestamp", "tokens_output"]].rename(columns={"timestamp": "ds", "tokens_output": "y"})
-    prophet_cost_df = df[["timestamp", "cost_in_usd"]].rename(columns={"timestamp": "ds", "cost_in_usd": "y"})
+def route_series(model_frames, horizon_days, metrics=FORECAST_METRICS):
+    """Classify every series by its demand and forecast the sparse and short ones in closed form.
     
-    # Fit Prophet models and generate forecasts
-    input_model = Prophet(daily_seasonality=True).fit(prophet_input_df)
-    output_model = Prophet(daily_seasonality=True).fit(prophet_output_df)
-    cost_model = Prophet(daily_seasonality=True).fit(prophet_cost_df)
+    Returns the frames left for the fitted models, the closed-form forecasts (at
+    least SEASONAL_PERIOD days long, for frozen filter states) and a report of
+    how many series took each path.
+    """
+    started = time.perf_counter()
+    fast_days = max(horizon_days, SEASONAL_PERIOD)
+    dense_frames, fast_forecasts = {}, {}
+    classes, paths = defaultdict(int), defaultdict(int)
+    for model_name, df in model_frames.items():
+        demand_class = series_demand_class(df)
+        path = DEMAND_PATHS[demand_class]
+        classes[demand_class] += 1
+        paths[path] += 1
+        
+        if path == "model":
+            dense_frames[model_name] = df
+        else:
+            forecaster = croston_sba_forecast if path == "croston_sba" else seasonal_naive_forecast
+            fast_forecasts[model_name] = tuple(forecaster(df[metric].to_numpy(dtype=float), fast_days) for metric in metrics)
+    
+    return dense_frames, fast_forecasts, {
+        "paths": dict(paths),
+        "classes": dict(classes),
+        "seconds": time.perf_counter() - started
+    }
+
+def forecast_entry(forecast_dates, input_forecast, output_forecast, cost_forecast) -> Dict[str, Any]:
+    """Forecast values of one series in the shape stored and returned by the agent"""
+    return {
+        "dates": forecast_dates,
+        "tokens_input": [float(val) for val in input_forecast],
+        "tokens_output": [float(val) for val in output_forecast],
+        "cost_in_usd": [float(val) for val in cost_forecast],
+        "total_forecast_cost": float(sum(cost_forecast)),
+        "total_forecast_tokens": float(sum(input_forecast) + sum(output_forecast))
+    }
+
+def hierarchy_series_name(label) -> str:
+    """Series name of a hierarchy node, its field values joined with '|'"""
+    return "|".join(str(part or "*") for part in label)
+
+def hierarchical_forecast(state: ForecastState, horizon_days, forecast_dates):
+    """Forecast the bottom-level (user, project, key, model) series and reconcile every level.
     
-    # Make forecasts
-    input_future = input_model.make_future_dataframe(periods=horizon_days)
-    output_future = output_model.make_future_dataframe(periods=horizon_days)
-    cost_future = cost_model.make_future_dataframe(periods=horizon_days)
+    Returns the reconciled per-model forecasts, which replace independently fitted
+    ones, and the forecasts of every level keyed by node name.
+    """
+    cube = state["hierarchy_cube"]
+    models = set(state["models_to_forecast"])
+    bottom_labels = [label for label in cube.series if label[-1] in models]
+    if not bottom_labels:
+        return {}, None
     
-    input_forecast = input_model.predict(input_future)
-    output_forecast = output_model.predict(output_future)
-    cost_forecast = cost_model.predict(cost_future)
+    bottom_names = [hierarchy_series_name(label) for label in bottom_labels]
+    frames = {name: cube.frame(label) for name, label in zip(bottom_names, bottom_labels)}
+    bottom_forecasts = forecast_series(state, frames, horizon_days, {name: label[-1] for name, label in zip(bottom_names, bottom_labels)})
     
-    # Extract just the forecast values for new dates
-    input_values = input_forecast["yhat"].iloc[-horizon_days:].values
-    output_values = output_forecast["yhat"].iloc[-horizon_days:].values
-    cost_values = cost_forecast["yhat"].iloc[-horizon_days:].values
+    hierarchy = Hierarchy(bottom_labels)
+    history = cube.values[[cube.index[label] for label in bottom_labels]]
+    stacked = np.stack([np.column_stack(bottom_forecasts[name]) for name in bottom_names])
+    levels, report = reconcile(hierarchy, stacked, history, state["reconciliation"])
     
-    # Ensure non-negative values
-    input_values = np.maximum(input_values, 0)
-    output_values = np.maximum(output_values, 0)
-    cost_values = np.maximum(cost_values, 0)
+    hierarchy_results = {"reconciliation": report, "levels": {}}
+    for level, values in levels.items():
+        if level == "bottom":
+            labels, fields = bottom_labels, HIERARCHY_FIELDS
+        else:
+            labels, fields = hierarchy.levels[level][0], HIERARCHY_LEVELS[level]
+        hierarchy_results["levels"][level] = {
+            hierarchy_series_name(label) or "total": {
+                "labels": dict(zip(fields, label)),
+                **forecast_entry(forecast_dates, *node_values.T)
+            }
+            for label, node_values in zip(labels, values)
+        }
+    
+    model_labels = hierarchy.levels["model"][0]
+    model_forecasts = {label[0]: tuple(values.T) for label, values in zip(model_labels, levels["model"])}
+    state["run_report"] = {**(state.get("run_report") or {}), "hierarchy": report}
+    return model_forecasts, hierarchy_results
+
+def holt_winters_fit(series):
+    """Fit Holt-Winters exponential smoothing to a single daily series"""
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing
+    
+    return ExponentialSmoothing(
+        series,
+        trend="add",
+        seasonal="add" if len(series) >= 14 else None,
+        seasonal_periods=7 if len(series) >= 14 else None
+    ).fit()
+
+def holt_winters_forecast(series, horizon_days, non_negative=True):
+    """Forecast a single daily series with Holt-Winters exponential smoothing"""
+    forecast = np.asarray(holt_winters_fit(series).forecast(horizon_days), dtype=float)
+    
+    # Usage can't be negative, but cost residuals can
+    return np.maximum(forecast, 0) if non_negative else forecast
+
+def statistical_forecast(df, horizon_days, metrics=FORECAST_METRICS, filter_states=None):
+    """Generate forecast using Holt-Winters exponential smoothing, one fit per metric
+    
+    When a filter_states dict is passed, each metric's fitted parameters and final
+    states are recorded in it for online updates (see online_holt_winters.py).
+    """
+    if filter_states is None:
+        return tuple(holt_winters_forecast(df[metric], horizon_days) for metric in metrics)
+    
+    last_day = df["timestamp"].iloc[-1].strftime("%Y-%m-%d")
+    values = []
+    for metric in metrics:
+        results = holt_winters_fit(df[metric])
+        filter_states[metric] = filter_state_from_fit(results, last_day)
+        values.append(np.maximum(np.asarray(results.forecast(horizon_days), dtype=float), 0))
+    return tuple(values)
+
+def prophet_forecast(df, horizon_days, metrics=FORECAST_METRICS):
+    """Generate forecast using Facebook Prophet, one fit per metric"""
+    from prophet import Prophet
+    
+    # Prophet rejects timezone-aware timestamps
+    if getattr(df["timestamp"].dt, "tz", None) is not None:
+        df = df.assign(timestamp=df["timestamp"].dt.tz_localize(None))
+    
+    values = []
+    for metric in metrics:
+        # Fit a Prophet model on the metric in Prophet's ds/y format
+        prophet_df = df[["timestamp", metric]].rename(columns={"timestamp": "ds", metric: "y"})
+        model = Prophet(daily_seasonality=False).fit(prophet_df)
+        forecast = model.predict(model.make_future_dataframe(periods=horizon_days))
+        
+        # Keep just the forecast values for new dates, ensuring they are non-negative
+        values.append(np.maximum(forecast["yhat"].iloc[-horizon_days:].values, 0))
     
-    return input_values, output_values, cost_values
+    return tuple(values)
 
-def ensemble_forecast(df, horizon_days):
+def ensemble_forecast(df, horizon_days, metrics=FORECAST_METRICS):
     """Generate forecast using an ensemble of methods"""
     # Get forecasts from multiple methods
-    statistical_input, statistical_output, statistical_cost = statistical_forecast(df, horizon_days)
+    statistical = statistical_forecast(df, horizon_days, metrics)
     
     try:
-        prophet_input, prophet_output, prophet_cost = prophet_forecast(df, horizon_days)
+        prophet = prophet_forecast(df, horizon_days, metrics)
     except:
         # If Prophet fails, use only statistical
-        return statistical_input, statistical_output, statistical_cost
+        return statistical
     
     # Simple average ensemble
-    input_forecast = (statistical_input + prophet_input) / 2
-    output_forecast = (statistical_output + prophet_output) / 2
-    cost_forecast = (statistical_cost + prophet_cost) / 2
-    
-    return input_forecast, output_forecast, cost_forecast
-
-def llm_forecast(df, horizon_days, model_name, openai_api_key):
-    """Use LLM to generate forecasts based on historical data and trends"""
-    # Last 14 days of data for context (or all if less than 14 days)
-    context_df = df.tail(min(14, len(df)))
-    
-    # Calculate basic statistics
-    avg_input = context_df["tokens_input"].mean()
-    avg_output = context_df["tokens_output"].mean()
-    avg_cost = context_df["cost_in_usd"].mean()
-    
-    # Calculate trend
-    if len(context_df) > 3:
-        input_trend = (context_df["tokens_input"].iloc[-1] / context_df["tokens_input"].iloc[0] - 1) * 100 if context_df["tokens_input"].iloc[0] > 0 else 0
-        output_trend = (context_df["tokens_output"].iloc[-1] / context_df["tokens_output"].iloc[0] - 1) * 100 if context_df["tokens_output"].iloc[0] > 0 else 0
-        cost_trend = (context_df["cost_in_usd"].iloc[-1] / context_df["cost_in_usd"].iloc[0] - 1) * 100 if context_df["cost_in_usd"].iloc[0] > 0 else 0
-    else:
-        input_trend = output_trend = cost_trend = 0
-    
-    # Format data for the LLM
-    daily_data = context_df.to_dict(orient="records")
-    formatted_data = "\n".join([
-        f"Date: {row['timestamp'].strftime('%Y-%m-%d')}, Input Tokens: {row['tokens_input']:.1f}, Output Tokens: {row['tokens_output']:.1f}, Cost: ${row['cost_in_usd']:.2f}"
-        for row in daily_data
-    ])
-    
-    # Create prompt for the LLM
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", """You are an expert AI data scientist specializing in API usage forecasting.
-        You're going to forecast future daily API usage based on historical data.
-        Give your answer ONLY as a JSON array of dictionaries, with each dictionary containing
-        'input_tokens', 'output_tokens', and 'cost_in_usd' for each future day.
-        No explanation or other text, just the JSON. Ensure values are reasonable and follow trends."""),
-        
-        ("user", f"""
-        I need a forecast for API usage of the '{model_name}' model for the next {horizon_days} days.
-        
-        Here is the recent daily usage data:
-        {formatted_data}
-        
-        Summary statistics:
-        - Average daily input tokens: {avg_input:.1f}
-        - Average daily output tokens: {avg_output:.1f}
-        - Average daily cost: ${avg_cost:.2f}
-        - Input tokens trend: {input_trend:.1f}% change
-        - Output tokens trend: {output_trend:.1f}% change
-        - Cost trend: {cost_trend:.1f}% change
-        
-        Based on this data, forecast the next {horizon_days} days of usage as a JSON array.
-        Each element should be a dictionary with keys 'input_tokens', 'output_tokens', and 'cost_in_usd'.
-        Factor in day-of-week patterns if they exist. Be realistic with your forecasts.
-        """
-        )
-    ])
+    return tuple((statistical_values + prophet_values) / 2 for statistical_values, prophet_values in zip(statistical, prophet))
+
+LLM_SYSTEM_PROMPT = """You are an expert AI data scientist specializing in API usage forecasting.
+You will receive a JSON object with a forecast horizon and a list of API usage series.
+Each series has an "id", the "model" it tracks, and "history": its most recent daily
+[input_tokens, output_tokens, cost_in_usd] values, oldest first.
+
+Forecast the next horizon_days days for every series. Answer ONLY with a JSON object
+mapping each series id to an object with "input_tokens", "output_tokens" and
+"cost_in_usd" arrays of length horizon_days. No explanation or other text, just the JSON.
+Factor in day-of-week patterns if they exist. Ensure values are reasonable and follow trends."""
+
+class OpenAIForecastBackend:
+    """Chat model backend; one client is created on first use and reused for every batch"""
+    name = "openai"
+    
+    def __init__(self, api_key: Optional[str]):
+        self.api_key = api_key
+        self._llm = None
+        self._lock = threading.Lock()
+    
+    def complete(self, system_prompt: str, user_prompt: str) -> str:
+        with self._lock:
+            if self._llm is None:
+                from langchain_openai import ChatOpenAI
+                self._llm = ChatOpenAI(temperature=0, api_key=self.api_key)
+        return self._llm.invoke([("system", system_prompt), ("user", user_prompt)]).content
+
+class StubForecastBackend:
+    """Offline stand-in that answers batched prompts with seasonal-naive forecasts.
+    
+    Used to benchmark and test the LLM path without network access.
+    """
+    name = "stub"
+    
+    def complete(self, system_prompt: str, user_prompt: str) -> str:
+        request = json.loads(user_prompt)
+        horizon = request["horizon_days"]
+        response = {}
+        for series in request["series"]:
+            history = np.asarray(series["history"], dtype=float)
+            season = history[-7:] if len(history) else np.zeros((1, 3))
+            path = np.resize(season, (horizon, 3))
+            response[series["id"]] = {
+                "input_tokens": path[:, 0].tolist(),
+                "output_tokens": path[:, 1].tolist(),
+                "cost_in_usd": path[:, 2].tolist()
+            }
+        return json.dumps(response)
+
+_llm_backends = {}
+
+def get_llm_backend(name: Optional[str] = None):
+    """Return the shared LLM backend instance for the configured backend name"""
+    name = name or LLM_BACKEND
+    if name not in _llm_backends:
+        _llm_backends[name] = StubForecastBackend() if name == "stub" else OpenAIForecastBackend(openai_api_key)
+    return _llm_backends[name]
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for prompt packing (about four characters per token)"""
+    return len(text) // 4 + 1
+
+def pack_llm_batches(payloads: List[Dict[str, Any]], horizon_days: int) -> List[List[Dict[str, Any]]]:
+    """Greedily pack series payloads into batches that fit LLM_TOKEN_BUDGET.
     
-    # Generate forecast using LLM
-    llm = ChatOpenAI(temperature=0, api_key=openai_api_key)
-    response = llm.invoke(prompt)
+    Each series costs its serialized history plus the tokens its answer will need.
+    """
+    answer_tokens = horizon_days * 3 * 3
+    batches, batch, batch_tokens = [], [], estimate_tokens(LLM_SYSTEM_PROMPT)
+    for payload in payloads:
+        tokens = estimate_tokens(json.dumps(payload)) + answer_tokens
+        if batch and batch_tokens + tokens > LLM_TOKEN_BUDGET:
+            batches.append(batch)
+            batch, batch_tokens = [], estimate_tokens(LLM_SYSTEM_PROMPT)
+        batch.append(payload)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+def cached_llm_completion(backend, system_prompt: str, user_prompt: str):
+    """Complete a prompt, reusing the on-disk response for an identical prompt.
     
+    Returns (response text, whether it came from the cache).
+    """
+    digest = hashlib.sha256(f"{backend.name}\n{system_prompt}\n{user_prompt}".encode("utf-8")).hexdigest()
+    path = os.path.join(CACHE_DIR, "llm", f"{digest}.json")
     try:
-        # Parse the response
-        forecast_data = json.loads(response.content)
-        
-        # Extract forecast values
-        input_forecast = np.array([day["input_tokens"] for day in forecast_data])
-        output_forecast = np.array([day["output_tokens"] for day in forecast_data])
-        cost_forecast = np.array([day["cost_in_usd"] for day in forecast_data])
-        
-        # Truncate or pad to match horizon_days
-        if len(input_forecast) > horizon_days:
-            input_forecast = input_forecast[:horizon_days]
-            output_forecast = output_forecast[:horizon_days]
-            cost_forecast = cost_forecast[:horizon_days]
-        elif len(input_forecast) < horizon_days:
-            # Pad with the last value repeated
-            input_forecast = np.pad(input_forecast, (0, horizon_days - len(input_forecast)), 'edge')
-            output_forecast = np.pad(output_forecast, (0, horizon_days - len(output_forecast)), 'edge')
-            cost_forecast = np.pad(cost_forecast, (0, horizon_days - len(cost_forecast)), 'edge')
-        
-        return input_forecast, output_forecast, cost_forecast
-    except Exception as e:
-        # Fallback to statistical forecast if LLM fails
-        print(f"LLM forecast failed: {str(e)}. Falling back to statistical method.")
-        return statistical_forecast(df, horizon_days)
+        with open(path) as f:
+            return json.load(f)["response"], True
+    except (OSError, ValueError, KeyError):
+        pass
+    
+    response = backend.complete(system_prompt, user_prompt)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"response": response}, f)
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        print(f"Could not cache LLM response: {str(e)}")
+    return response, False
+
+def fit_to_horizon(values, horizon_days):
+    """Truncate a forecast to the horizon, or pad it by repeating the last value"""
+    values = np.asarray(values, dtype=float)
+    if len(values) >= horizon_days:
+        return values[:horizon_days]
+    return np.pad(values, (0, horizon_days - len(values)), "edge")
+
+def llm_forecast(model_frames, horizon_days, metrics=FORECAST_METRICS, backend=None):
+    """Use an LLM to forecast many series with a few batched, cached requests.
+    
+    Series are packed into structured prompts up to LLM_TOKEN_BUDGET and the batches
+    run concurrently (at most LLM_MAX_CONCURRENCY at a time). Series the LLM fails to
+    answer fall back to the statistical method.
+    
+    Returns forecasts of the requested metrics per series and a report of the requests made.
+    """
+    backend = backend or get_llm_backend()
+    payloads = []
+    for model_name, df in model_frames.items():
+        context_df = df.tail(LLM_CONTEXT_DAYS)
+        payloads.append({
+            "id": model_name,
+            "model": model_name,
+            "history": [
+                [round(float(row.tokens_input), 1), round(float(row.tokens_output), 1), round(float(row.cost_in_usd), 4)]
+                for row in context_df.itertuples()
+            ]
+        })
+    batches = pack_llm_batches(payloads, horizon_days)
+    
+    def run_batch(batch):
+        user_prompt = json.dumps({"horizon_days": horizon_days, "series": batch})
+        try:
+            response, cached = cached_llm_completion(backend, LLM_SYSTEM_PROMPT, user_prompt)
+            return json.loads(response), cached
+        except Exception as e:
+            print(f"LLM forecast batch failed: {str(e)}")
+            return {}, False
+    
+    with ThreadPoolExecutor(max_workers=LLM_MAX_CONCURRENCY) as executor:
+        results = list(executor.map(run_batch, batches))
+    
+    answers = {}
+    for answer, _ in results:
+        if isinstance(answer, dict):
+            answers.update(answer)
+    
+    forecasts = {}
+    fallbacks = 0
+    for model_name, df in model_frames.items():
+        try:
+            answer = answers[model_name]
+            forecasts[model_name] = tuple(
+                np.maximum(fit_to_horizon(answer[key], horizon_days), 0)
+                for key in ("input_tokens", "output_tokens", "cost_in_usd")[:len(metrics)]
+            )
+        except Exception as e:
+            # Fallback to statistical forecast if the LLM didn't answer for this series
+            print(f"LLM forecast failed for {model_name}: {str(e)}. Falling back to statistical method.")
+            forecasts[model_name] = statistical_forecast(df, horizon_days, metrics)
+            fallbacks += 1
+    
+    return forecasts, {
+        "backend": backend.name,
+        "series": len(payloads),
+        "batches": len(batches),
+        "cache_hits": sum(1 for _, cached in results if cached),
+        "fallbacks": fallbacks
+    }
+
+def global_forecast(model_frames, horizon_days, metrics=FORECAST_METRICS):
+    """Forecast every series with a single model trained across all of them (see global_model.py).
+    
+    Each series' metrics become rows of one matrix, aligned on the series' last day.
+    The model is trained once, without the last GLOBAL_VALIDATION_DAYS, and series
+    where it forecasts those held-out days worse than closed_form_forecast get
+    their closed-form forecast instead. Returns forecasts of the requested
+    metrics per series and a report of the fit and the validation.
+    """
+    names = list(model_frames)
+    days = max((len(df) for df in model_frames.values()), default=0)
+    values = np.full((len(names) * len(metrics), days), np.nan)
+    last_weekday = np.zeros(len(names) * len(metrics), dtype=int)
+    for i, name in enumerate(names):
+        df = model_frames[name]
+        rows = slice(i * len(metrics), (i + 1) * len(metrics))
+        values[rows, days - len(df):] = df[metrics].to_numpy(dtype=float).T
+        last_weekday[rows] = df["timestamp"].iloc[-1].weekday()
+    
+    # Hold out the last days only when some series is long enough to be scored on them
+    validation_days = min(GLOBAL_VALIDATION_DAYS, horizon_days)
+    validated = [i for i, name in enumerate(names) if len(model_frames[name]) >= validation_days + SHORT_SERIES_DAYS]
+    if not validated:
+        validation_days = 0
+    
+    metric = np.tile(np.arange(len(metrics)), len(names))
+    forecasts, held_out, report = forecast_global(values, last_weekday, metric, horizon_days, len(metrics), validation_days=validation_days)
+    series_forecasts = {
+        name: tuple(forecasts[i * len(metrics):(i + 1) * len(metrics)])
+        for i, name in enumerate(names)
+    }
+    
+    # Keep the global forecast only where it beats the closed-form one on the held-out days
+    fallbacks, global_scores, baseline_scores = [], [], []
+    if validation_days > 0:
+        for i in validated:
+            rows = slice(i * len(metrics), (i + 1) * len(metrics))
+            df = model_frames[names[i]]
+            actual = values[rows, -validation_days:]
+            global_scores.append(smape(actual, held_out[rows]))
+            baseline_scores.append(smape(actual, np.array(closed_form_forecast(df.iloc[:-validation_days], validation_days, metrics))))
+            if global_scores[-1] >= baseline_scores[-1]:
+                fallbacks.append(names[i])
+                series_forecasts[names[i]] = closed_form_forecast(df, horizon_days, metrics)
+    
+    return series_forecasts, {
+        **report,
+        "series": len(names),
+        "validation": {
+            "days": validation_days,
+            "series": len(global_scores),
+            "global_smape": float(np.mean(global_scores)) if global_scores else None,
+            "closed_form_smape": float(np.mean(baseline_scores)) if baseline_scores else None,
+            "fallbacks": len(fallbacks)
+        }
+    }
+
+# Per-series forecasters selectable through forecast_model
+FORECASTERS = {
+    "statistical": statistical_forecast,
+    "prophet": prophet_forecast,
+    "ensemble": ensemble_forecast
+}
+
+class ComputeBudget:
+    """Wall-clock or CPU time budget shared by every series in a run"""
+    def __init__(self, seconds: float, mode: str = "wall"):
+        self.seconds = float(seconds)
+        self.mode = mode
+        self.clock = time.process_time if mode == "cpu" else time.perf_counter
+        self.started = self.clock()
+        self._fit_seconds = {}  # candidate -> observed seconds per forecast
+    
+    def record(self, candidate: str, seconds: float, fits: int = 1):
+        """Note that fits forecasts of candidate took seconds, for later estimates"""
+        self._fit_seconds.setdefault(candidate, []).append(seconds / max(fits, 1))
+    
+    def estimate(self, candidate: str, fits: int = 1, default: float = 0.0) -> float:
+        """Expected seconds for fits forecasts of candidate, from this run's timings or default"""
+        observed = self._fit_seconds.get(candidate)
+        return fits * (float(np.mean(observed)) if observed else default)
+    
+    def affords(self, seconds: float) -> bool:
+        return seconds < self.remaining()
+    
+    def used(self) -> float:
+        return self.clock() - self.started
+    
+    def remaining(self) -> float:
+        return max(self.seconds - self.used(), 0.0)
+    
+    def exhausted(self) -> bool:
+        return self.remaining() <= 0
+
+def smape(actual, predicted) -> float:
+    """Symmetric mean absolute percentage error on a 0-200 scale (0 where both values are zero)"""
+    actual = np.asarray(actual, dtype=float)
+    predicted = np.asarray(predicted, dtype=float)
+    denominator = np.abs(actual) + np.abs(predicted)
+    errors = np.divide(2 * np.abs(actual - predicted), denominator, out=np.zeros_like(denominator), where=denominator > 0)
+    return float(errors.mean() * 100) if errors.size else 0.0
+
+def backtest_fold_count(days: int, horizon_days: int, folds: int = SELECTION_FOLDS, min_train: int = SELECTION_MIN_TRAIN_DAYS) -> int:
+    """Number of folds rolling_origin_backtest runs on a series of the given length"""
+    test_horizon = max(1, min(horizon_days, 7))
+    return sum(1 for k in range(folds, 0, -1) if days - k * test_horizon >= min_train)
+
+def rolling_origin_backtest(df, horizon_days, forecaster, metrics=FORECAST_METRICS, folds=SELECTION_FOLDS, min_train=SELECTION_MIN_TRAIN_DAYS):
+    """Forecast the tail of a series from several rolling origins.
+    
+    Returns one (actual, predicted) pair of (days x metrics) arrays per fold. Folds
+    that would leave fewer than min_train days of history are skipped, so short
+    series return an empty list.
+    """
+    test_horizon = max(1, min(horizon_days, 7))
+    results = []
+    for k in range(folds, 0, -1):
+        origin = len(df) - k * test_horizon
+        if origin < min_train:
+            continue
+        actual = df[metrics].iloc[origin:origin + test_horizon].to_numpy(dtype=float)
+        predicted = np.column_stack(forecaster(df.iloc[:origin], test_horizon, metrics))
+        results.append((actual, predicted))
+    return results
+
+def backtest_score(folds) -> Optional[float]:
+    """Mean sMAPE across backtest folds, or None when nothing could be held out"""
+    if not folds:
+        return None
+    return float(np.mean([smape(actual, predicted) for actual, predicted in folds]))
+
+def series_key(state: ForecastState, model_name: str) -> str:
+    """Stable identifier of a forecast series across runs"""
+    return "|".join(str(part or "*") for part in (state["user_id"], state["project_id"], state["provider"], model_name))
+
+def load_selection_memory() -> Dict[str, Any]:
+    """Load the winners remembered from previous model selection runs"""
+    try:
+        with open(os.path.join(CACHE_DIR, "model_selection.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_selection_memory(memory: Dict[str, Any]) -> None:
+    """Persist model selection winners, replacing the file atomically"""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        path = os.path.join(CACHE_DIR, "model_selection.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(memory, f)
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        print(f"Could not save model selection memory: {str(e)}")
+
+def select_and_forecast(model_frames, horizon_days, budget: ComputeBudget, state: ForecastState, metrics=FORECAST_METRICS):
+    """Choose a forecasting method per series with cheap backtests, then forecast.
+    
+    Series are handled in descending cost order so the budget goes to the series
+    that matter most. Holt-Winters is always backtested; Prophet (and the ensemble,
+    scored from the same backtest predictions) is only tried when the remaining
+    budget covers its estimated cost, and only wins when it beats Holt-Winters by
+    SELECTION_MARGIN. A Prophet or ensemble winner is likewise only fitted when
+    its estimated cost fits, and the Holt-Winters backtest is skipped when it
+    doesn't; either way the series falls back to a Holt-Winters forecast.
+    Estimates come from the timings of the run so far, starting from
+    SELECTION_PROPHET_SECONDS per Prophet forecast. Winners are remembered for
+    SELECTION_TTL_DAYS.
+    
+    Returns the forecasts per series and a report of the accuracy/compute trade-off.
+    """
+    memory = load_selection_memory()
+    now = datetime.datetime.now()
+    forecasts = {}
+    series_report = {}
+    
+    ordered = sorted(model_frames.items(), key=lambda item: float(item[1]["cost_in_usd"].sum()), reverse=True)
+    for model_name, df in ordered:
+        started = budget.clock()
+        key = series_key(state, model_name)
+        remembered = memory.get(key)
+        expensive_seconds = 0.0
+        
+        if remembered and remembered.get("method") in FORECASTERS and \
+                now - datetime.datetime.fromisoformat(remembered["selected_at"]) < datetime.timedelta(days=SELECTION_TTL_DAYS):
+            method = remembered["method"]
+            scores = remembered.get("scores", {})
+            source = "memory"
+        elif not budget.affords(budget.estimate("statistical", backtest_fold_count(len(df), horizon_days))):
+            # Not even the Holt-Winters backtest fits, so there is nothing to choose between
+            method = "statistical"
+            scores = {}
+            source = "budget"
+        else:
+            backtest_started = budget.clock()
+            statistical_folds = rolling_origin_backtest(df, horizon_days, statistical_forecast, metrics)
+            if statistical_folds:
+                budget.record("statistical", budget.clock() - backtest_started, len(statistical_folds))
+            scores = {"statistical": backtest_score(statistical_folds)}
+            method = "statistical"
+            source = "backtest"
+            
+            if scores["statistical"] is None:
+                source = "short_series"
+            elif not budget.affords(budget.estimate("prophet", len(statistical_folds), SELECTION_PROPHET_SECONDS)):
+                source = "budget"
+            else:
+                prophet_started = budget.clock()
+                try:
+                    prophet_folds = rolling_origin_backtest(df, horizon_days, prophet_forecast, metrics)
+                    scores["prophet"] = backtest_score(prophet_folds)
+                    scores["ensemble"] = backtest_score([
+                        (actual, (statistical + prophet) / 2)
+                        for (actual, statistical), (_, prophet) in zip(statistical_folds, prophet_folds)
+                    ])
+                    best = min(("prophet", "ensemble"), key=lambda name: scores[name])
+                    if scores[best] <= scores["statistical"] * (1 - SELECTION_MARGIN):
+                        method = best
+                except Exception as e:
+                    print(f"Prophet backtest failed for {model_name}: {str(e)}")
+                expensive_seconds += budget.clock() - prophet_started
+                budget.record("prophet", expensive_seconds, len(statistical_folds))
+            
+            if source != "budget":
+                memory[key] = {"method": method, "scores": scores, "selected_at": now.isoformat()}
+        
+        # Expensive final fits only start if their estimated cost fits in what is left of the budget
+        if method != "statistical" and not budget.affords(budget.estimate("prophet", 1, SELECTION_PROPHET_SECONDS)):
+            method = "statistical"
+            source = "budget"
+        
+        fit_started = budget.clock()
+        try:
+            forecasts[model_name] = FORECASTERS[method](df, horizon_days, metrics)
+        except Exception as e:
+            print(f"{method} forecast failed for {model_name}: {str(e)}. Falling back to statistical method.")
+            method = "statistical"
+            forecasts[model_name] = statistical_forecast(df, horizon_days, metrics)
+        if method != "statistical":
+            expensive_seconds += budget.clock() - fit_started
+            budget.record("prophet", budget.clock() - fit_started)
+        
+        series_report[model_name] = {
+            "selected": method,
+            "source": source,
+            "backtest_smape": scores,
+            "compute_seconds": budget.clock() - started,
+            "expensive_compute_seconds": expensive_seconds
+        }
+    
+    save_selection_memory(memory)
+    
+    # Summarize what the extra compute bought relative to a statistical-only run
+    scored = [
+        report for report in series_report.values()
+        if report["backtest_smape"].get("statistical") is not None
+        and report["backtest_smape"].get(report["selected"]) is not None
+    ]
+    selected_counts = {}
+    for report in series_report.values():
+        selected_counts[report["selected"]] = selected_counts.get(report["selected"], 0) + 1
+    
+    return forecasts, {
+        "budget": {
+            "mode": budget.mode,
+            "seconds": budget.seconds,
+            "used_seconds": budget.used(),
+            "exhausted": budget.exhausted()
+        },
+        "selected_counts": selected_counts,
+        "statistical_only_smape": float(np.mean([r["backtest_smape"]["statistical"] for r in scored])) if scored else None,
+        "selected_smape": float(np.mean([r["backtest_smape"][r["selected"]] for r in scored])) if scored else None,
+        "expensive_compute_seconds": float(sum(r["expensive_compute_seconds"] for r in series_report.values())),
+        "series": series_report
+    }
+
+def load_price_table(as_of: Optional[datetime.date] = None) -> Dict[str, Any]:
+    """Load the price table version in effect on the given date (today by default)"""
+    as_of = (as_of or datetime.date.today()).isoformat()
+    with open(PRICE_TABLE_PATH) as f:
+        versions = json.load(f)["versions"]
+    
+    effective = [version for version in versions if version["effective_from"] <= as_of]
+    return max(effective or versions, key=lambda version: version["effective_from"])
+
+def resolve_model_price(price_table: Dict[str, Any], model_name: str) -> Optional[Dict[str, float]]:
+    """Find a model's per-token prices, matching dated variants by their longest known prefix"""
+    prices = price_table["prices"]
+    if model_name in prices:
+        return prices[model_name]
+    
+    matches = [name for name in prices if model_name.startswith(name)]
+    return prices[max(matches, key=len)] if matches else None
+
+def derive_cost_forecasts(model_frames, token_forecasts, horizon_days, price_table: Dict[str, Any], series_models=None):
+    """Compute cost forecasts as forecast tokens x model price.
+    
+    Where a series' observed cost diverges from its price-implied cost by more than
+    COST_DIVERGENCE_TOLERANCE (discounts, unpriced line items, unknown models), the
+    residual is forecast with Holt-Winters and added to the priced forecast.
+    
+    series_models maps series names to the model they're priced as (default: the name).
+    
+    Returns (input, output, cost) forecasts per series and a report of the derivation.
+    """
+    per_token = 1_000_000 if price_table.get("unit") == "per_1m_tokens" else 1_000
+    forecasts = {}
+    series_report = {}
+    
+    for model_name, (input_forecast, output_forecast) in token_forecasts.items():
+        df = model_frames[model_name]
+        priced_model = (series_models or {}).get(model_name, model_name)
+        price = resolve_model_price(price_table, priced_model) or {"input": 0.0, "output": 0.0}
+        
+        implied_cost = (df["tokens_input"] * price["input"] + df["tokens_output"] * price["output"]) / per_token
+        implied_forecast = (np.asarray(input_forecast) * price["input"] + np.asarray(output_forecast) * price["output"]) / per_token
+        
+        observed_total = float(df["cost_in_usd"].sum())
+        divergence = abs(observed_total - float(implied_cost.sum())) / observed_total if observed_total > 0 else 0.0
+        
+        cost_forecast = implied_forecast
+        if divergence > COST_DIVERGENCE_TOLERANCE:
+            cost_forecast = implied_forecast + holt_winters_forecast(df["cost_in_usd"] - implied_cost, horizon_days, non_negative=False)
+        
+        forecasts[model_name] = (input_forecast, output_forecast, np.maximum(cost_forecast, 0))
+        series_report[model_name] = {
+            "price_known": resolve_model_price(price_table, priced_model) is not None,
+            "divergence": divergence,
+            "residual_corrected": divergence > COST_DIVERGENCE_TOLERANCE
+        }
+    
+    residual_fits = sum(1 for report in series_report.values() if report["residual_corrected"])
+    return forecasts, {
+        "price_table_version": price_table["version"],
+        "cost_fits": residual_fits,
+        "cost_fits_avoided": len(series_report) - residual_fits,
+        "series": series_report
+    }
+
+def forecast_scope_key(user_id: Optional[str], project_id: Optional[str]) -> str:
+    """Scope whose latest forecast run a store replaces"""
+    return f"{user_id}:{project_id or '*'}"
 
 def store_forecasts(state: ForecastState) -> ForecastState:
-    """Store forecast results in Supabase"""
+    """Store forecast results in Supabase as a new run and publish it as the scope's latest.
+    
+    Rows are written under a fresh forecast_runs row and only become visible to
+    readers (through latest_forecasts) once publish_forecast_run swaps the scope's
+    pointer, so readers never see a partial run and older rows are never rewritten.
+    Superseded runs beyond FORECAST_RUN_RETENTION are pruned afterwards.
+    
+    With the compact storage layout each series is a single forecast_series row
+    holding the dates and metric vectors as arrays.
+    """
     try:
         state = state.copy()
         state["status"] = "storing_results"
@@ -461,37 +1176,88 @@ def store_forecasts(state: ForecastState) -> ForecastState:
             state["error"] = "No forecast results to store"
             state["status"] = "error"
             return state
-            
-        # Prepare data to store in the forecasts table
-        forecast_data = []
         
-        for model_name, forecast in state["forecast_results"]["forecasts"].items():
-            for i, date_str in enumerate(forecast["dates"]):
-                forecast_data.append({
+        # Preliminary forecasts only answer the request; the refined run is the one published
+        if state.get("quality_tier") == "preliminary":
+            state["status"] = "completed"
+            return state
+            
+        forecasts = state["forecast_results"]["forecasts"]
+        if forecasts:
+            scope_key = forecast_scope_key(state["user_id"], state["project_id"])
+            storage_layout = state.get("storage_layout") or FORECAST_STORAGE_LAYOUT
+            created_at = datetime.datetime.now().isoformat()
+            
+            # Register the run first so its rows can reference it
+            run_response = get_supabase().table("forecast_runs").insert({
+                "user_id": state["user_id"],
+                "project_id": state["project_id"],
+                "scope_key": scope_key,
+                "provider": state["provider"],
+                "forecast_model": state["forecast_model"],
+                "forecast_horizon": state["forecast_horizon"],
+                "series_count": len(forecasts),
+                "row_count": len(forecasts) if storage_layout == "compact" else sum(len(forecast["dates"]) for forecast in forecasts.values()),
+                "storage_layout": storage_layout,
+                "quality_tier": state.get("quality_tier") or "final",
+                "created_at": created_at
+            }).execute()
+            run_id = run_response.data[0]["id"]
+            
+            if storage_layout == "compact":
+                # One row per series with the horizon packed into arrays
+                series_data = [{
+                    "run_id": run_id,
                     "user_id": state["user_id"],
                     "project_id": state["project_id"],
                     "provider": state["provider"],
                     "model": model_name,
-                    "forecast_date": date_str,
-                    "tokens_input_forecast": forecast["tokens_input"][i],
-                    "tokens_output_forecast": forecast["tokens_output"][i],
-                    "cost_forecast": forecast["cost_in_usd"][i],
                     "forecast_model": state["forecast_model"],
-                    "created_at": datetime.datetime.now().isoformat(),
+                    "created_at": created_at,
                     "confidence_level": 0.8,  # Default confidence level
-                    "is_latest": True,  # Mark as the latest forecast
-                })
-        
-        if forecast_data:
-            # First, mark previous forecasts as not latest
-            if state["user_id"]:
-                query = supabase.table("forecasts").update({"is_latest": False}).eq("user_id", state["user_id"]).eq("is_latest", True)
-                if state["project_id"]:
-                    query = query.eq("project_id", state["project_id"])
-                query.execute()
+                    "dates": forecast["dates"],
+                    "tokens_input_forecast": [round(val) for val in forecast["tokens_input"]],
+                    "tokens_output_forecast": [round(val) for val in forecast["tokens_output"]],
+                    "cost_forecast": forecast["cost_in_usd"]
+                } for model_name, forecast in forecasts.items()]
+                get_supabase().table("forecast_series").insert(series_data).execute()
+            else:
+                # Prepare data to store in the forecasts table
+                forecast_data = []
+                for model_name, forecast in forecasts.items():
+                    for i, date_str in enumerate(forecast["dates"]):
+                        forecast_data.append({
+                            "run_id": run_id,
+                            "user_id": state["user_id"],
+                            "project_id": state["project_id"],
+                            "provider": state["provider"],
+                            "model": model_name,
+                            "forecast_date": date_str,
+                            "tokens_input_forecast": forecast["tokens_input"][i],
+                            "tokens_output_forecast": forecast["tokens_output"][i],
+                            "cost_forecast": forecast["cost_in_usd"][i],
+                            "forecast_model": state["forecast_model"],
+                            "created_at": created_at,
+                            "confidence_level": 0.8,  # Default confidence level
+                        })
+                get_supabase().table("forecasts").insert(forecast_data).execute()
+            
+            # Atomically point the scope at the new run
+            get_supabase().rpc("publish_forecast_run", {"p_run_id": run_id}).execute()
+            state["forecast_results"] = {**state["forecast_results"], "run_id": run_id}
+            
+            # Retention doesn't affect readers, so a failure here isn't fatal
+            try:
+                get_supabase().rpc("prune_forecast_runs", {"p_scope_key": scope_key, "p_keep": FORECAST_RUN_RETENTION}).execute()
+            except Exception as prune_error:
+                print(f"Error pruning forecast runs: {str(prune_error)}")
             
-            # Then, store new forecasts
-            supabase.table("forecasts").insert(forecast_data).execute()
+            # Without saved states the next online update just waits for a refit, so this isn't fatal either
+            if state.get("filter_states"):
+                try:
+                    save_filter_states(state, state["filter_states"], created_at)
+                except Exception as state_error:
+                    print(f"Error saving filter states: {str(state_error)}")
         
         # Update state
         state["status"] = "completed"
@@ -501,6 +1267,44 @@ def store_forecasts(state: ForecastState) -> ForecastState:
         state["status"] = "error"
         return state
 
+def save_filter_states(state: ForecastState, filter_states: Dict[str, Dict[str, Any]], fitted_at: Optional[str] = None) -> None:
+    """Upsert each model's Holt-Winters filter states, one forecast_filter_states row per series"""
+    updated_at = datetime.datetime.now().isoformat()
+    rows = []
+    for model_name, metric_states in filter_states.items():
+        if set(metric_states) != set(FORECAST_METRICS):
+            continue
+        row = {
+            "series_key": series_key(state, model_name),
+            "scope_key": forecast_scope_key(state["user_id"], state["project_id"]),
+            "user_id": state["user_id"],
+            "project_id": state["project_id"],
+            "provider": state["provider"],
+            "model": model_name,
+            "states": metric_states,
+            "last_day": min(metric_state["last_day"] for metric_state in metric_states.values()),
+            "updated_at": updated_at
+        }
+        if fitted_at:
+            row["fitted_at"] = fitted_at
+        rows.append(row)
+    if rows:
+        get_supabase().table("forecast_filter_states").upsert(rows, on_conflict="series_key").execute()
+
+def latest_forecast_model(user_id: Optional[str], project_id: Optional[str]) -> Optional[str]:
+    """forecast_model of the run currently published for a forecast scope, None if there is none"""
+    latest = get_supabase().table("forecast_latest").select("run_id").eq("scope_key", forecast_scope_key(user_id, project_id)).execute().data
+    if not latest:
+        return None
+    run = get_supabase().table("forecast_runs").select("forecast_model").eq("id", latest[0]["run_id"]).execute().data
+    return run[0]["forecast_model"] if run else None
+
+def load_filter_states(user_id: Optional[str], project_id: Optional[str], provider: Optional[str]) -> List[Dict[str, Any]]:
+    """The saved filter state rows of a forecast scope"""
+    query = get_supabase().table("forecast_filter_states").select("*").eq("scope_key", forecast_scope_key(user_id, project_id))
+    query = query.eq("provider", provider) if provider else query.is_("provider", "null")
+    return query.execute().data or []
+
 def check_thresholds(state: ForecastState) -> ForecastState:
     """Check if any forecasted usage exceeds thresholds and prepare alerts"""
     try:
@@ -510,7 +1314,7 @@ def check_thresholds(state: ForecastState) -> ForecastState:
             return state
             
         # Get thresholds from the database or use defaults
-        thresholds_query = supabase.table("thresholds").select("*")
+        thresholds_query = get_supabase().table("thresholds").select("*")
         if state["user_id"]:
             thresholds_query = thresholds_query.eq("user_id", state["user_id"])
         
@@ -520,31 +1324,55 @@ def check_thresholds(state: ForecastState) -> ForecastState:
         # Default thresholds if none are set
         default_threshold = 0.8  # 80% of monthly budget or expected usage
         
-        alerts = []
-        
-        for model_name, forecast in state["forecast_results"]["forecasts"].items():
-            total_forecast_cost = forecast["total_forecast_cost"]
-            
-            # Find the threshold for this model, or use default
-            model_threshold = next(
+        forecasts = state["forecast_results"]["forecasts"]
+        model_thresholds = {
+            model_name: next(
                 (t for t in thresholds if t["model"] == model_name), 
                 {"cost_threshold": default_threshold * 1000}  # Default $1000 * 80%
-            )
+            )["cost_threshold"]
+            for model_name in forecasts
+        }
+        
+        # Probability and timing of crossing each threshold, from simulated cost paths
+        simulation = simulate_threshold_crossings(state, forecasts, model_thresholds)
+        
+        # Alerts for every horizon up to the fitted one, so a forecast sliced to a
+        # shorter horizon carries the alerts for that horizon
+        fitted_days = TIMEFRAME_DAYS.get(state["forecast_horizon"], 90)
+        alerts_by_horizon = {}
+        for horizon, horizon_days in TIMEFRAME_DAYS.items():
+            if horizon_days > fitted_days:
+                continue
             
-            # Check if forecast exceeds threshold
-            if total_forecast_cost > model_threshold["cost_threshold"]:
-                alerts.append({
-                    "model": model_name,
-                    "forecast_cost": total_forecast_cost,
-                    "threshold": model_threshold["cost_threshold"],
-                    "percentage": (total_forecast_cost / model_threshold["cost_threshold"]) * 100,
-                    "message": f"Forecasted cost for {model_name} exceeds threshold by {(total_forecast_cost / model_threshold['cost_threshold'] - 1) * 100:.1f}%"
-                })
+            alerts = []
+            for model_name, forecast in forecasts.items():
+                total_forecast_cost = float(sum(forecast["cost_in_usd"][:horizon_days]))
+                cost_threshold = model_thresholds[model_name]
+                
+                # Check if forecast exceeds threshold
+                if total_forecast_cost > cost_threshold:
+                    alert = {
+                        "model": model_name,
+                        "forecast_cost": total_forecast_cost,
+                        "threshold": cost_threshold,
+                        "percentage": (total_forecast_cost / cost_threshold) * 100,
+                        "message": f"Forecasted cost for {model_name} exceeds threshold by {(total_forecast_cost / cost_threshold - 1) * 100:.1f}%"
+                    }
+                    if model_name in simulation:
+                        alert["probability"] = simulation[model_name]["probability_by_horizon"].get(horizon)
+                        alert["days_to_crossing"] = simulation[model_name]["days_to_crossing"]
+                    alerts.append(alert)
+            
+            alerts_by_horizon[horizon] = {
+                "alerts": alerts,
+                "total_alerts": len(alerts)
+            }
         
         # Update state with any alerts
         state["threshold_alerts"] = {
-            "alerts": alerts,
-            "total_alerts": len(alerts)
+            **alerts_by_horizon.get(state["forecast_horizon"], {"alerts": [], "total_alerts": 0}),
+            "by_horizon": alerts_by_horizon,
+            "simulation": simulation
         }
         
         return state
@@ -554,9 +1382,40 @@ def check_thresholds(state: ForecastState) -> ForecastState:
         state["threshold_alerts"] = {"alerts": [], "total_alerts": 0, "error": str(e)}
         return state
 
+def simulate_threshold_crossings(state: ForecastState, forecasts: Dict[str, Any], model_thresholds: Dict[str, float]) -> Dict[str, Any]:
+    """Simulate every model's cost paths together and summarize when each crosses its threshold.
+    
+    Residuals come from each model's daily cost history in the usage cube. A
+    failed simulation leaves the point-forecast alerts unaffected.
+    """
+    try:
+        cube = state.get("usage_cube")
+        models = [model_name for model_name in forecasts if cube is not None and model_name in cube]
+        if not models:
+            return {}
+        
+        rows = [cube.index[model_name] for model_name in models]
+        history = cube.values[rows, :, cube.metric_index["cost_in_usd"]]
+        residuals, counts = trailing_mean_residuals(history, cube.first_day[rows], cube.last_day[rows])
+        simulation = simulate_budget_exhaustion(
+            np.array([forecasts[model_name]["cost_in_usd"] for model_name in models], dtype=float),
+            residuals,
+            counts,
+            np.array([model_thresholds[model_name] for model_name in models], dtype=float)
+        )
+        return {
+            model_name: {"threshold": model_thresholds[model_name], **summarize_simulation(simulation, i)}
+            for i, model_name in enumerate(models)
+        }
+    except Exception as e:
+        print(f"Error simulating threshold crossings: {str(e)}")
+        return {}
+
 # Build the LangGraph
 def build_graph():
     """Build the LangGraph for the forecasting agent"""
+    from langgraph.graph import StateGraph, END
+    
     workflow = StateGraph(ForecastState)
     
     # Add nodes to the graph
@@ -567,11 +1426,7 @@ def build_graph():
     workflow.add_node("store_forecasts", store_forecasts)
     
     # Define the edges
-    workflow.add_edge("fetch_historical_data", "analyze_data")
-    workflow.add_edge("analyze_data", "generate_forecast")
-    workflow.add_edge("generate_forecast", "check_thresholds")
     workflow.add_edge("check_thresholds", "store_forecasts")
-    workflow.add_edge("store_forecasts", END)
     
     # Add conditional edges for error handling
     workflow.add_conditional_edges(
@@ -605,13 +1460,307 @@ def build_graph():
         "store_forecasts",
         lambda x: "error" if x["status"] == "error" else END,
         {
-            "error": END
+            "error": END,
+            END: END
         }
     )
     
+    # Set the entry point
+    workflow.set_entry_point("fetch_historical_data")
+    
     # Compile the graph
     return workflow.compile()
 
+@lru_cache(maxsize=None)
+def get_graph():
+    """Return the compiled graph, building it once per process"""
+    return build_graph()
+
+def slice_forecast(forecast: Dict[str, Any], horizon_days: int) -> Dict[str, Any]:
+    """The first horizon_days days of a forecast entry, with its totals recomputed"""
+    return {
+        **forecast,
+        **forecast_entry(
+            forecast["dates"][:horizon_days],
+            forecast["tokens_input"][:horizon_days],
+            forecast["tokens_output"][:horizon_days],
+            forecast["cost_in_usd"][:horizon_days]
+        )
+    }
+
+def slice_forecast_result(result: Dict[str, Any], forecast_horizon: str, timeframe: str = None) -> Dict[str, Any]:
+    """Serve a shorter horizon and timeframe from a run_forecast result fitted for longer ones"""
+    horizon_days = TIMEFRAME_DAYS[forecast_horizon]
+    sliced = {
+        **result,
+        "forecast_horizon": forecast_horizon,
+        "forecasts": {name: slice_forecast(forecast, horizon_days) for name, forecast in result.get("forecasts", {}).items()}
+    }
+    
+    data_analysis = result.get("data_analysis") or {}
+    if timeframe:
+        sliced["timeframe"] = timeframe
+    if timeframe in data_analysis.get("by_timeframe", {}):
+        sliced["data_analysis"] = {**data_analysis, **data_analysis["by_timeframe"][timeframe]}
+    
+    threshold_alerts = result.get("threshold_alerts") or {}
+    if forecast_horizon in threshold_alerts.get("by_horizon", {}):
+        sliced["threshold_alerts"] = {**threshold_alerts, **threshold_alerts["by_horizon"][forecast_horizon]}
+    
+    if result.get("hierarchy"):
+        sliced["hierarchy"] = {
+            **result["hierarchy"],
+            "levels": {
+                level: {name: slice_forecast(forecast, horizon_days) for name, forecast in nodes.items()}
+                for level, nodes in result["hierarchy"]["levels"].items()
+            }
+        }
+    return sliced
+
+class ForecastResultCache:
+    """Size-bounded LRU cache of run_forecast results.
+    
+    Entries are keyed by the run parameters plus the version of the usage data
+    the run read, so new usage_metrics rows make older entries unreachable; they
+    age out of the LRU or are dropped early with invalidate().
+    """
+    def __init__(self, max_entries: int = FORECAST_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["result"]
+    
+    def peek(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look up an entry without counting a hit or miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry["result"] if entry else None
+    
+    def put(self, key: str, scope: Dict[str, Any], result: Dict[str, Any]):
+        with self._lock:
+            self._entries[key] = {"scope": scope, "result": result}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def invalidate(self, user_id: Optional[str] = None, project_id: Optional[str] = None) -> int:
+        """Drop entries for a user (and project), or every entry when no user is given"""
+        with self._lock:
+            stale = [
+                key for key, entry in self._entries.items()
+                if user_id is None or (
+                    entry["scope"]["user_id"] in (user_id, None)
+                    and (project_id is None or entry["scope"]["project_id"] in (project_id, None))
+                )
+            ]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+            return len(stale)
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
+forecast_cache = ForecastResultCache()
+
+def invalidate_forecast_cache(user_id: Optional[str] = None, project_id: Optional[str] = None) -> Dict[str, Any]:
+    """Drop cached forecasts after new usage lands for a scope"""
+    return {"success": True, "invalidated": forecast_cache.invalidate(user_id, project_id)}
+
+class SingleFlight:
+    """Runs one computation per key at a time; concurrent callers with the same key wait for it and share its result"""
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+    
+    def run(self, key: str, compute):
+        """Return (result, whether it came from another caller's computation)"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = {"done": threading.Event(), "result": None, "error": None}
+            else:
+                self.coalesced += 1
+        
+        if not leader:
+            flight["done"].wait()
+            if flight["error"] is not None:
+                raise flight["error"]
+            return flight["result"], True
+        
+        try:
+            flight["result"] = compute()
+            return flight["result"], False
+        except Exception as e:
+            flight["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight["done"].set()
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"in_flight": len(self._flights), "coalesced": self.coalesced}
+
+class ForecastAdmission:
+    """Caps concurrent forecast runs per tenant and per process, with a bounded wait queue"""
+    def __init__(self, tenant_limit: int = FORECAST_TENANT_CONCURRENCY, process_limit: int = FORECAST_MAX_CONCURRENCY,
+                 queue_limit: int = FORECAST_QUEUE_LIMIT, timeout: float = FORECAST_QUEUE_TIMEOUT):
+        self.tenant_limit = tenant_limit
+        self.queue_limit = queue_limit
+        self.timeout = timeout
+        self._process = threading.BoundedSemaphore(process_limit)
+        self._tenants = {}  # tenant -> [semaphore, runs waiting or running], dropped when no run holds it
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.rejected = 0
+    
+    def acquire(self, tenant: Optional[str]) -> bool:
+        """Wait for a tenant and a process slot; False if the queue is full or the wait times out"""
+        with self._lock:
+            if self.queued >= self.queue_limit:
+                self.rejected += 1
+                return False
+            self.queued += 1
+            entry = self._tenants.setdefault(tenant, [threading.BoundedSemaphore(self.tenant_limit), 0])
+            entry[1] += 1
+            tenant_slots = entry[0]
+        
+        deadline = time.monotonic() + self.timeout
+        admitted = tenant_slots.acquire(timeout=self.timeout)
+        if admitted and not self._process.acquire(timeout=max(deadline - time.monotonic(), 0)):
+            tenant_slots.release()
+            admitted = False
+        
+        with self._lock:
+            self.queued -= 1
+            if admitted:
+                self.running += 1
+            else:
+                self.rejected += 1
+                self._leave(tenant)
+        return admitted
+    
+    def release(self, tenant: Optional[str]):
+        self._process.release()
+        with self._lock:
+            self._tenants[tenant][0].release()
+            self.running -= 1
+            self._leave(tenant)
+    
+    def _leave(self, tenant: Optional[str]):
+        # Called with the lock held; a tenant with no run waiting or running has all its slots free
+        entry = self._tenants[tenant]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._tenants[tenant]
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"running": self.running, "queued": self.queued, "rejected": self.rejected}
+
+class ForecastRefinements:
+    """Background runs behind progressive forecasts, tracked by job id until they age out"""
+    def __init__(self, workers: int = FORECAST_REFINE_WORKERS, max_jobs: int = FORECAST_CACHE_SIZE):
+        self.max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="forecast-refine")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def submit(self, job_id: str, user_id: Optional[str], compute) -> Dict[str, Any]:
+        """Start compute in the background unless the job is already running or completed"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] == "error":
+                job = self._jobs[job_id] = {
+                    "job_id": job_id,
+                    "user_id": user_id,
+                    "status": "running",
+                    "result": None,
+                    "error": None,
+                    "submitted_at": datetime.datetime.now().isoformat(),
+                    "finished_at": None
+                }
+                self._executor.submit(self._run, job, compute)
+                
+                # Forget the oldest finished jobs beyond max_jobs
+                finished = [key for key, entry in self._jobs.items() if entry["status"] != "running"]
+                for key in finished[:max(len(self._jobs) - self.max_jobs, 0)]:
+                    del self._jobs[key]
+            return {"job_id": job_id, "status": job["status"]}
+    
+    def _run(self, job: Dict[str, Any], compute):
+        try:
+            result = compute()
+            error = None if result["success"] else result.get("error")
+        except Exception as e:
+            result, error = None, str(e)
+        with self._lock:
+            job["status"] = "error" if error else "completed"
+            job["result"] = result
+            job["error"] = error
+            job["finished_at"] = datetime.datetime.now().isoformat()
+    
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            statuses = [job["status"] for job in self._jobs.values()]
+            return {status: statuses.count(status) for status in ("running", "completed", "error")}
+
+forecast_flights = SingleFlight()
+forecast_admission = ForecastAdmission()
+forecast_refinements = ForecastRefinements()
+
+# Preliminary forecasts run off the request thread so the wait for them can be bounded
+preliminary_executor = ThreadPoolExecutor(max_workers=FORECAST_MAX_CONCURRENCY, thread_name_prefix="forecast-preliminary")
+
+def usage_data_version(user_id: Optional[str], project_id: Optional[str], provider: Optional[str], timeframe: str) -> str:
+    """Version of the usage rows a forecast reads: their count and latest update time"""
+    start_date = datetime.date.today() - datetime.timedelta(days=TIMEFRAME_DAYS.get(timeframe, 90))
+    query = get_supabase().table("usage_metrics").select("updated_at", count="exact").gte("timestamp", start_date.isoformat())
+    if user_id:
+        query = query.eq("user_id", user_id)
+    if project_id:
+        query = query.eq("project_id", project_id)
+    if provider:
+        query = query.eq("provider", provider)
+    
+    response = query.order("updated_at", desc=True).limit(1).execute()
+    latest_update = response.data[0]["updated_at"] if response.data else None
+    return f"{response.count}:{latest_update}"
+
 def run_forecast(
     user_id: str = None, 
     project_id: str = None, 
@@ -619,28 +1768,198 @@ def run_forecast(
     timeframe: str = "30d",
     forecast_horizon: str = "14d",
     forecast_model: str = "ensemble",
-    models_to_forecast: List[str] = None
+    models_to_forecast: List[str] = None,
+    compute_budget_seconds: float = None,
+    budget_mode: str = "wall",
+    cost_mode: str = "fitted",
+    storage_layout: str = None,
+    reconciliation: str = "none",
+    use_cache: bool = True,
+    progressive: bool = False
 ) -> Dict[str, Any]:
-    """Run the forecasting agent with the given parameters"""
+    """Run the forecasting agent with the given parameters
+    
+    With forecast_model="auto", compute_budget_seconds caps the wall-clock
+    (budget_mode="wall") or CPU (budget_mode="cpu") time spent selecting and
+    fitting models across all series.
+    
+    forecast_model="global" trains one model across every series and metric
+    (FORECAST_GLOBAL_ESTIMATOR "gbm" or "linear") instead of one per series.
+    
+    cost_mode="derived" fits only the token series and prices them with the
+    versioned price table, instead of fitting a separate cost model.
+    
+    storage_layout overrides FORECAST_STORAGE_LAYOUT ("rows" or "compact").
+    
+    Series are always fitted on FIT_TIMEFRAME of history for FIT_HORIZON days
+    (when those are at least as long as the request), and the requested
+    forecast_horizon is sliced from that forecast, so every timeframe and
+    horizon shares one fit per series. data_analysis still covers the requested
+    timeframe; fitted_timeframe reports the history the models were fitted on.
+    
+    reconciliation="bottom_up" or "mint" fits only the (user, project, key, model)
+    series and returns coherent forecasts for every level under "hierarchy".
+    
+    Results are cached per parameters and usage data version; a repeat call
+    before new usage lands returns the cached result with "cached": True.
+    Pass use_cache=False to always run the graph.
+    
+    Concurrent calls with the same parameters share one run ("coalesced": True
+    for the ones that attached to it). Runs are capped per tenant and per
+    process, and calls beyond FORECAST_QUEUE_LIMIT waiting runs are rejected
+    with status "rejected".
+    
+    With progressive=True, prophet, ensemble, llm and auto requests return a
+    statistical forecast (quality_tier "preliminary") within
+    FORECAST_PRELIMINARY_SECONDS, or status "pending" if even that takes
+    longer, and run the requested model in the background. The refined run is
+    stored and cached as usual with quality_tier "final"; "refinement" holds
+    the job id to poll with forecast_refinement_status.
+    """
+    # Fit on the longest history and horizon; the request's horizon is sliced out
+    fit_timeframe = max(timeframe, FIT_TIMEFRAME, key=lambda value: TIMEFRAME_DAYS[value])
+    fit_horizon = max(forecast_horizon, FIT_HORIZON, key=lambda value: TIMEFRAME_DAYS[value])
+    params = {
+        "user_id": user_id, "project_id": project_id, "provider": provider,
+        "timeframe": fit_timeframe, "forecast_horizon": fit_horizon, "forecast_model": forecast_model,
+        "models_to_forecast": sorted(models_to_forecast or []), "compute_budget_seconds": compute_budget_seconds,
+        "budget_mode": budget_mode, "cost_mode": cost_mode, "reconciliation": reconciliation or "none",
+        "storage_layout": storage_layout or FORECAST_STORAGE_LAYOUT, "quality_tier": "final",
+        "date": datetime.date.today().isoformat()
+    }
+    
+    if progressive and forecast_model in PROGRESSIVE_MODELS:
+        return progressive_forecast(params, forecast_horizon, timeframe, use_cache)
+    return serve_forecast(params, forecast_horizon, timeframe, use_cache)
+
+def forecast_params_key(params: Dict[str, Any]) -> str:
+    """Identity of a run's resolved parameters, shared by its cache entries and in-flight run"""
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+def forecast_cache_key(params: Dict[str, Any], params_key: str) -> Optional[str]:
+    """Cache key of a run over the current usage data, or None if the data version can't be read"""
+    try:
+        data_version = usage_data_version(params["user_id"], params["project_id"], params["provider"], params["timeframe"])
+        return f"{params_key}|{data_version}"
+    except Exception as e:
+        print(f"Could not check the forecast cache: {str(e)}")
+        return None
+
+def serve_forecast(params: Dict[str, Any], forecast_horizon: str, timeframe: str = None, use_cache: bool = True) -> Dict[str, Any]:
+    """Serve run_forecast's resolved parameters from the cache, an identical in-flight run or a new run"""
+    user_id, project_id = params["user_id"], params["project_id"]
+    params_key = forecast_params_key(params)
+    
+    # Reuse the result of an identical run over the same usage data
+    cache_key = forecast_cache_key(params, params_key) if use_cache else None
+    if cache_key:
+        cached = forecast_cache.get(cache_key)
+        if cached is not None:
+            return {**slice_forecast_result(cached, forecast_horizon, timeframe), "cached": True}
+    
+    def compute():
+        # Queue behind the tenant's and the machine's concurrency caps
+        if not forecast_admission.acquire(user_id):
+            return {
+                "success": False,
+                "error": "Too many forecasts queued, try again shortly",
+                "status": "rejected"
+            }
+        try:
+            # A run that finished while this one was queued may already hold the result
+            if cache_key:
+                cached = forecast_cache.peek(cache_key)
+                if cached is not None:
+                    return cached
+            
+            result = execute_forecast(params)
+            if cache_key and result["success"]:
+                forecast_cache.put(cache_key, {"user_id": user_id, "project_id": project_id}, result)
+            return result
+        finally:
+            forecast_admission.release(user_id)
+    
+    # Identical concurrent requests share one computation
+    result, coalesced = forecast_flights.run(params_key, compute)
+    if not result["success"]:
+        return result
+    return {**slice_forecast_result(result, forecast_horizon, timeframe), "cached": False, "coalesced": coalesced}
+
+def progressive_forecast(params: Dict[str, Any], forecast_horizon: str, timeframe: str = None, use_cache: bool = True) -> Dict[str, Any]:
+    """Answer quickly with a statistical forecast and refine with the requested model in the background"""
+    # Once the refined run for the current usage data is cached, it's served directly
+    params_key = forecast_params_key(params)
+    cache_key = forecast_cache_key(params, params_key) if use_cache else None
+    if cache_key:
+        cached = forecast_cache.get(cache_key)
+        if cached is not None:
+            return {**slice_forecast_result(cached, forecast_horizon, timeframe), "cached": True}
+    
+    # Wait at most FORECAST_PRELIMINARY_SECONDS for the statistical forecast; if it
+    # runs over, it still finishes and is cached for the next poll
+    preliminary_params = {**params, "forecast_model": "statistical", "quality_tier": "preliminary"}
+    preliminary = preliminary_executor.submit(serve_forecast, preliminary_params, forecast_horizon, timeframe, use_cache)
+    try:
+        result = preliminary.result(timeout=FORECAST_PRELIMINARY_SECONDS)
+    except FutureTimeoutError:
+        result = {"success": True, "status": "pending", "quality_tier": None, "forecasts": {}}
+    if not result["success"]:
+        return result
+    
+    job_id = hashlib.sha256((cache_key or f"{params_key}|{os.urandom(8).hex()}").encode("utf-8")).hexdigest()
+    refinement = forecast_refinements.submit(
+        job_id, params["user_id"], lambda: serve_forecast(params, params["forecast_horizon"], use_cache=use_cache)
+    )
+    return {**result, "refinement": refinement}
+
+def forecast_refinement_status(job_id: str, user_id: str = None, forecast_horizon: str = None, timeframe: str = None) -> Dict[str, Any]:
+    """Status of a progressive forecast's background refinement, with its result once completed"""
+    job = forecast_refinements.get(job_id)
+    if job is None or (user_id and job["user_id"] != user_id):
+        return {"success": False, "error": "Unknown forecast job", "status": "error"}
+    if job["status"] == "error":
+        return {"success": False, "error": job["error"], "status": "error", "job_id": job_id}
+    
+    response = {key: job[key] for key in ("job_id", "status", "submitted_at", "finished_at")}
+    if job["status"] == "completed":
+        result = job["result"]
+        if result["success"] and (forecast_horizon or timeframe):
+            result = slice_forecast_result(result, forecast_horizon or result["fitted_horizon"], timeframe)
+        response["result"] = result
+    return {"success": True, **response}
+
+def execute_forecast(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Run the forecasting graph for run_forecast's resolved parameters"""
     # Initialize state
     state = ForecastState(
-        user_id=user_id,
-        project_id=project_id,
-        provider=provider,
-        usage_data=None,
+        user_id=params["user_id"],
+        project_id=params["project_id"],
+        provider=params["provider"],
+        usage_cube=None,
+        hierarchy_cube=None,
+        data_analysis={},
         forecast_results=None,
         error=None,
         status="initialized",
-        timeframe=timeframe,
-        forecast_horizon=forecast_horizon,
-        forecast_model=forecast_model,
-        models_to_forecast=models_to_forecast or [],
-        threshold_alerts={}
+        timeframe=params["timeframe"],
+        forecast_horizon=params["forecast_horizon"],
+        forecast_model=params["forecast_model"],
+        models_to_forecast=params["models_to_forecast"],
+        threshold_alerts={},
+        compute_budget={
+            "seconds": params["compute_budget_seconds"] or DEFAULT_COMPUTE_BUDGET_SECONDS,
+            "mode": params["budget_mode"]
+        },
+        cost_mode=params["cost_mode"],
+        storage_layout=params["storage_layout"],
+        reconciliation=params["reconciliation"],
+        filter_states=None,
+        quality_tier=params["quality_tier"],
+        run_report={}
     )
     
-    # Build and run the graph
-    graph = build_graph()
-    result = graph.invoke(state)
+    # Run the compiled graph
+    result = get_graph().invoke(state)
     
     # Return the relevant portions of the result
     if result["status"] == "error":
@@ -655,14 +1974,152 @@ def run_forecast(
             "status": result["status"],
             "forecasts": result.get("forecast_results", {}).get("forecasts", {}),
             "data_analysis": result.get("data_analysis", {}),
-            "threshold_alerts": result.get("threshold_alerts", {})
+            "threshold_alerts": result.get("threshold_alerts", {}),
+            "hierarchy": result.get("forecast_results", {}).get("hierarchy"),
+            "run_report": result.get("run_report", {}),
+            "run_id": result.get("forecast_results", {}).get("run_id"),
+            "fitted_horizon": params["forecast_horizon"],
+            "fitted_timeframe": params["timeframe"],
+            "quality_tier": params["quality_tier"]
+        }
+
+def run_online_update(
+    user_id: str = None,
+    project_id: str = None,
+    provider: str = None,
+    forecast_horizon: str = FIT_HORIZON,
+    storage_layout: str = None
+) -> Dict[str, Any]:
+    """Filter the days ingested since the last fit into the saved Holt-Winters states and republish the forecasts
+    
+    Works from the filter states a statistical run_forecast saved for the scope:
+    each series' level, trend and seasonal states are advanced through every
+    complete day after the day they were last updated, with the fitted smoothing
+    parameters unchanged, and the advanced states forecast the next
+    forecast_horizon days. No model is refitted, so this is cheap enough to run
+    as each day lands; parameters only change with the next full run_forecast,
+    which is also when models that started getting usage since are picked up.
+    
+    Scopes whose published run came from another model are skipped, so an
+    ensemble or global forecast isn't replaced by one from older saved states.
+    """
+    try:
+        latest_model = latest_forecast_model(user_id, project_id)
+        if latest_model not in ONLINE_UPDATE_MODELS:
+            return {
+                "success": True,
+                "status": "skipped",
+                "reason": f"Latest forecast run is {latest_model or 'missing'}, not statistical"
+            }
+        
+        rows = load_filter_states(user_id, project_id, provider)
+        if not rows:
+            return {
+                "success": False,
+                "error": "No saved filter states for this scope; run a statistical forecast first",
+                "status": "error"
+            }
+        
+        # Only complete UTC days are filtered in; today's usage is still arriving
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+        start_day = min(datetime.date.fromisoformat(str(row["last_day"])[:10]) for row in rows) + datetime.timedelta(days=1)
+        days = np.arange(np.datetime64(start_day), np.datetime64(today))
+        
+        # Each series only takes the days after its own last update
+        last_days = np.array([str(row["last_day"])[:10] for row in rows], dtype="datetime64[D]")
+        mask = days[None, :] > last_days[:, None]
+        if not mask.any():
+            return {"success": True, "status": "up_to_date", "series": len(rows), "days_filtered": 0}
+        
+        query = get_supabase().table("usage_metrics").select(USAGE_COLUMNS) \
+            .gte("timestamp", start_day.isoformat()).lt("timestamp", today.isoformat())
+        if user_id:
+            query = query.eq("user_id", user_id)
+        if project_id:
+            query = query.eq("project_id", project_id)
+        if provider:
+            query = query.eq("provider", provider)
+        usage_rows = query.execute().data or []
+        
+        # (series x days x metrics) observations on the update's day axis, zero on days without usage
+        observations = np.zeros((len(rows), len(days), len(FORECAST_METRICS)))
+        if usage_rows:
+            cube = UsageCube.from_rows(usage_rows)
+            offset = int((cube.days[0] - days[0]).astype(int))
+            for i, row in enumerate(rows):
+                if row["model"] in cube:
+                    values = cube.values[cube.index[row["model"]]][:, [cube.metric_index[metric] for metric in FORECAST_METRICS]]
+                    observations[i, offset:offset + len(values)] = values
+        
+        # Forecasts start the day after the newest state; a series whose state is older skips its extra steps
+        new_last_days = np.maximum(last_days, days[-1])
+        anchor_day = new_last_days.max()
+        lags = (anchor_day - new_last_days).astype(int)
+        horizon_days = TIMEFRAME_DAYS.get(forecast_horizon, 90)
+        steps = lags[:, None] + np.arange(horizon_days)[None, :]
+        metric_forecasts, metric_states = [], {}
+        for m, metric in enumerate(FORECAST_METRICS):
+            arrays = advance_filter_states(stack_filter_states([row["states"][metric] for row in rows]), observations[:, :, m], mask)
+            values = forecast_filter_states(arrays, horizon_days + int(lags.max()))
+            metric_forecasts.append(np.take_along_axis(values, steps, axis=1))
+            metric_states[metric] = unstack_filter_states(arrays, [str(last_day) for last_day in new_last_days])
+        
+        forecast_start = anchor_day.astype(datetime.date)
+        forecast_dates = [(forecast_start + datetime.timedelta(days=i)).strftime("%Y-%m-%d") for i in range(1, horizon_days + 1)]
+        forecasts = {
+            row["model"]: forecast_entry(forecast_dates, *(values[i] for values in metric_forecasts))
+            for i, row in enumerate(rows)
+        }
+        
+        # Publish the refreshed forecasts as a new run and save the advanced states
+        state = {
+            "user_id": user_id,
+            "project_id": project_id,
+            "provider": provider,
+            "forecast_model": "statistical_online",
+            "forecast_horizon": forecast_horizon,
+            "storage_layout": storage_layout or FORECAST_STORAGE_LAYOUT,
+            "forecast_results": {"forecasts": forecasts}
+        }
+        stored = store_forecasts(state)
+        if stored["status"] == "error":
+            return {"success": False, "error": stored["error"], "status": "error"}
+        save_filter_states(state, {
+            row["model"]: {metric: metric_states[metric][i] for metric in FORECAST_METRICS}
+            for i, row in enumerate(rows)
+        })
+        invalidate_forecast_cache(user_id, project_id)
+        
+        return {
+            "success": True,
+            "status": "completed",
+            "forecasts": forecasts,
+            "run_id": stored["forecast_results"].get("run_id"),
+            "series": len(rows),
+            "days_filtered": int(mask.sum())
         }
+    except Exception as e:
+        return {"success": False, "error": f"Error in online update: {str(e)}", "status": "error"}
 
 if __name__ == "__main__":
-    # Example usage
-    result = run_forecast(
-        timeframe="30d",
-        forecast_horizon="14d",
-        forecast_model="ensemble"
-    )
+    parser = argparse.ArgumentParser(description="Run the Teiden forecasting agent")
+    parser.add_argument("--user_id")
+    parser.add_argument("--project_id")
+    parser.add_argument("--provider")
+    parser.add_argument("--timeframe", default="30d", choices=["7d", "14d", "30d", "90d"])
+    parser.add_argument("--forecast_horizon", default="14d", choices=["7d", "14d", "30d", "90d"])
+    parser.add_argument("--forecast_model", default="ensemble", choices=["statistical", "prophet", "ensemble", "llm", "auto", "global"])
+    parser.add_argument("--compute_budget_seconds", type=float)
+    parser.add_argument("--budget_mode", default="wall", choices=["wall", "cpu"])
+    parser.add_argument("--cost_mode", default="fitted", choices=["fitted", "derived"])
+    parser.add_argument("--storage_layout", choices=["rows", "compact"])
+    parser.add_argument("--reconciliation", default="none", choices=["none", "bottom_up", "mint"])
+    parser.add_argument("--no_cache", dest="use_cache", action="store_false", help="Skip the forecast result cache")
+    parser.add_argument("--online", action="store_true", help="Filter new days into the saved states instead of refitting")
+    args = parser.parse_args()
+    
+    if args.online:
+        result = run_online_update(args.user_id, args.project_id, args.provider, args.forecast_horizon, args.storage_layout)
+    else:
+        result = run_forecast(**{name: value for name, value in vars(args).items() if name != "online"})
     print(json.dumps(result, indent=2)) 
\ No newline at end of file
@@ -0,0 +1,136 @@
+"""
+Global forecasting model for the Teiden forecasting agent
+
+Instead of one model per series, a single regressor is trained on every series
+and metric at once. Each series is scaled by its mean, so one model learns the
+shapes shared across the fleet and short or new series borrow strength from
+long ones. Lag, trailing-window and weekday features are computed for all
+series together as NumPy arrays, and forecasts are made recursively with one
+batched prediction per day of the horizon.
+"""
+
+import os
+import time
+from typing import Dict, Any, Tuple
+import numpy as np
+
+# "gbm" (histogram gradient boosting) or "linear" (ridge regression)
+GLOBAL_ESTIMATOR = os.environ.get("FORECAST_GLOBAL_ESTIMATOR", "gbm")
+
+# Training rows beyond this are subsampled, so the one fit stays bounded for large fleets
+GLOBAL_MAX_TRAIN_ROWS = int(os.environ.get("FORECAST_GLOBAL_MAX_TRAIN_ROWS", 200_000))
+
+GLOBAL_LAGS = (1, 2, 3, 7, 14)
+GLOBAL_WINDOWS = (7, 28)
+HISTORY_DAYS = max(GLOBAL_LAGS + GLOBAL_WINDOWS)
+
+def window_stats(window: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Mean and standard deviation of each row's non-NaN values (NaN when there are too few)"""
+    counts = (~np.isnan(window)).sum(axis=1)
+    sums = np.nansum(window, axis=1)
+    squares = np.nansum(window ** 2, axis=1)
+    mean = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+    variance = np.where(counts > 1, squares / np.maximum(counts, 1) - mean ** 2, np.nan)
+    return mean, np.sqrt(np.maximum(variance, 0))
+
+def step_features(recent: np.ndarray, age: np.ndarray, weekday: np.ndarray, metric: np.ndarray, metric_count: int) -> np.ndarray:
+    """Features for predicting the next day of each row.
+
+    recent holds the last HISTORY_DAYS scaled values per row (NaN before a
+    series starts), age the number of days the series has so far, weekday the
+    predicted day's weekday (Monday = 0) and metric the row's metric index.
+    """
+    features = [recent[:, -lag] for lag in GLOBAL_LAGS]
+    for window in GLOBAL_WINDOWS:
+        mean, std = window_stats(recent[:, -window:])
+        features += [mean, std]
+    features.append(np.minimum(age, 365))
+
+    # One-hot weekday and metric, usable by both estimators
+    features += [(weekday == day).astype(float) for day in range(7)]
+    features += [(metric == index).astype(float) for index in range(metric_count)]
+    return np.column_stack(features).astype(float)
+
+def build_estimator(estimator: str = GLOBAL_ESTIMATOR):
+    """The regressor trained across all series"""
+    if estimator == "linear":
+        from sklearn.pipeline import make_pipeline
+        from sklearn.impute import SimpleImputer
+        from sklearn.linear_model import Ridge
+        return make_pipeline(SimpleImputer(strategy="constant", fill_value=0), Ridge(alpha=1.0))
+
+    from sklearn.ensemble import HistGradientBoostingRegressor
+    return HistGradientBoostingRegressor(max_iter=200, learning_rate=0.05, min_samples_leaf=20, random_state=0)
+
+def predict_recursive(model, recent: np.ndarray, age: np.ndarray, last_weekday: np.ndarray, metric: np.ndarray,
+                      metric_count: int, steps: int) -> np.ndarray:
+    """Predict steps days of every row one day at a time, feeding predictions back as history"""
+    recent, age = recent.copy(), age.copy()
+    predictions = np.zeros((len(recent), steps))
+    for step in range(steps):
+        weekday = (last_weekday + step + 1) % 7
+        predicted = np.maximum(model.predict(step_features(recent, age, weekday, metric, metric_count)), 0)
+        predictions[:, step] = predicted
+        recent = np.concatenate([recent[:, 1:], predicted[:, None]], axis=1)
+        age += 1
+    return predictions
+
+def forecast_global(values: np.ndarray, last_weekday: np.ndarray, metric: np.ndarray, horizon_days: int,
+                    metric_count: int, estimator: str = GLOBAL_ESTIMATOR, seed: int = 0,
+                    validation_days: int = 0) -> Tuple[np.ndarray, np.ndarray, Dict[str, Any]]:
+    """Train one model on every row of values and forecast all rows horizon_days ahead.
+
+    values is (rows x days) daily usage aligned on each row's last day, with
+    NaN before a row's first day; last_weekday is the weekday of that last day.
+    With validation_days, the model is trained without the last validation_days,
+    which it also forecasts from the history before them, and the horizon is
+    then forecast from the full history with the same model.
+    Returns the (rows x horizon) non-negative forecasts, the (rows x
+    validation_days) forecasts of the held-out days and a report.
+    """
+    rows, days = values.shape
+    train_days = days - validation_days
+    started = time.perf_counter()
+
+    # Scale every row by its mean over the training days so one model fits large and small series alike
+    counts = (~np.isnan(values[:, :train_days])).sum(axis=1)
+    mean = np.nansum(values[:, :train_days], axis=1) / np.maximum(counts, 1)
+    scale = np.where(mean > 0, mean, 1.0)
+    padded = np.concatenate([np.full((rows, HISTORY_DAYS), np.nan), values / scale[:, None]], axis=1)
+    ages = np.concatenate([np.zeros((rows, 1)), np.cumsum(~np.isnan(values), axis=1)], axis=1)
+
+    # One training example per (row, training day) with a known previous day
+    features, targets = [], []
+    for day in range(1, train_days):
+        target = values[:, day]
+        valid = ~np.isnan(target) & ~np.isnan(values[:, day - 1])
+        if not valid.any():
+            continue
+        weekday = (last_weekday[valid] - (days - 1 - day)) % 7
+        recent = padded[valid, day:day + HISTORY_DAYS]
+        features.append(step_features(recent, ages[valid, day], weekday, metric[valid], metric_count))
+        targets.append(target[valid] / scale[valid])
+
+    report = {"estimator": estimator, "rows": rows, "training_rows": 0}
+    if not features:
+        # Nothing to learn from: carry each row's mean forward
+        return np.repeat(mean[:, None], horizon_days, axis=1), np.repeat(mean[:, None], validation_days, axis=1), report
+
+    X, y = np.concatenate(features), np.concatenate(targets)
+    if len(y) > GLOBAL_MAX_TRAIN_ROWS:
+        keep = np.random.default_rng(seed).choice(len(y), GLOBAL_MAX_TRAIN_ROWS, replace=False)
+        X, y = X[keep], y[keep]
+
+    model = build_estimator(estimator)
+    model.fit(X, y)
+    report["training_rows"] = len(y)
+    report["fit_seconds"] = time.perf_counter() - started
+
+    held_out = predict_recursive(
+        model, padded[:, train_days:train_days + HISTORY_DAYS], ages[:, train_days],
+        (last_weekday - validation_days) % 7, metric, metric_count, validation_days
+    )
+    forecasts = predict_recursive(model, padded[:, -HISTORY_DAYS:], ages[:, -1], last_weekday, metric, metric_count, horizon_days)
+
+    report["seconds"] = time.perf_counter() - started
+    return forecasts * scale[:, None], held_out * scale[:, None], report
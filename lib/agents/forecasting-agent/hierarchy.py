@@ -0,0 +1,112 @@
+"""
+Hierarchical forecast reconciliation for the Teiden forecasting agent
+
+Only the bottom-level series (one per user, project, API key and model) are
+fitted. Every aggregate level is derived from them in one vectorized pass,
+either by summing (bottom-up) or by MinT reconciliation with structural
+weights, so the levels always add up.
+"""
+
+import os
+from typing import Dict, List, Tuple
+import numpy as np
+from usage_cube import unique_labels
+
+# Fields identifying a bottom-level series, most aggregate first
+HIERARCHY_FIELDS = ("user_id", "project_id", "api_key_id", "model")
+
+# Aggregate levels served from the bottom series, by the fields they group on
+HIERARCHY_LEVELS = {
+    "total": (),
+    "user": ("user_id",),
+    "project": ("user_id", "project_id"),
+    "key": ("user_id", "project_id", "api_key_id"),
+    "model": ("model",)
+}
+
+# MinT solves a (bottom x bottom) system; larger hierarchies are reconciled bottom-up
+MINT_MAX_SERIES = int(os.environ.get("FORECAST_MINT_MAX_SERIES", 2000))
+
+class Hierarchy:
+    """Maps bottom-level series to the nodes of every aggregate level"""
+
+    def __init__(self, bottom_labels: List[Tuple]):
+        self.bottom = list(bottom_labels)
+        self.levels = {}
+        for level, fields in HIERARCHY_LEVELS.items():
+            positions = [HIERARCHY_FIELDS.index(field) for field in fields]
+            labels, group = unique_labels([tuple(label[p] for p in positions) for label in self.bottom])
+            self.levels[level] = (labels, group)
+
+    def aggregate(self, bottom_values: np.ndarray) -> Dict[str, np.ndarray]:
+        """Sum (bottom x ...) values into each aggregate level"""
+        aggregated = {}
+        for level, (labels, group) in self.levels.items():
+            values = np.zeros((len(labels),) + bottom_values.shape[1:])
+            np.add.at(values, group, bottom_values)
+            aggregated[level] = values
+        return aggregated
+
+    def summing_matrix(self) -> np.ndarray:
+        """S with one row per aggregate node (in level order) followed by the bottom identity"""
+        blocks = []
+        for labels, group in self.levels.values():
+            block = np.zeros((len(labels), len(self.bottom)))
+            block[group, np.arange(len(self.bottom))] = 1
+            blocks.append(block)
+        blocks.append(np.eye(len(self.bottom)))
+        return np.vstack(blocks)
+
+def seasonal_naive(history: np.ndarray, horizon_days: int) -> np.ndarray:
+    """Forecast (series x days x metrics) history by repeating the average of the last two weeks by weekday"""
+    days = history.shape[1]
+    if days == 0:
+        return np.zeros((history.shape[0], horizon_days) + history.shape[2:])
+    if days < 7:
+        return np.repeat(history.mean(axis=1, keepdims=True), horizon_days, axis=1)
+
+    weekday = np.arange(horizon_days) % 7
+    week = history[:, days - 7 + weekday]
+    if days >= 14:
+        week = (week + history[:, days - 14 + weekday]) / 2
+    return week
+
+def reconcile(hierarchy: Hierarchy, bottom_forecasts: np.ndarray, bottom_history: np.ndarray, method: str = "mint"):
+    """Reconcile bottom-level forecasts into coherent forecasts for every level.
+
+    bottom_forecasts is (bottom x horizon x metrics) and bottom_history the
+    bottom series' (bottom x days x metrics) daily usage. With method="mint"
+    the aggregate nodes get cheap seasonal-naive base forecasts from their
+    summed history, and all base forecasts are combined with WLS structural
+    weights (each node weighted by the number of bottom series under it).
+    The reconciled bottom forecasts are clipped at zero and summed into
+    every level, so each level adds up to the one above it.
+
+    Returns the forecasts per level (including "bottom") and a report.
+    """
+    bottom_count, horizon_days = bottom_forecasts.shape[:2]
+    report = {"method": method, "bottom_series": bottom_count}
+
+    if method == "mint" and bottom_count > MINT_MAX_SERIES:
+        report["method"] = "bottom_up"
+        report["note"] = f"More than {MINT_MAX_SERIES} bottom series, reconciled bottom-up"
+
+    reconciled = bottom_forecasts
+    if report["method"] == "mint":
+        aggregate_history = hierarchy.aggregate(bottom_history)
+        base = np.concatenate(
+            [seasonal_naive(aggregate_history[level], horizon_days) for level in hierarchy.levels] + [bottom_forecasts]
+        )
+
+        # P = (S' W^-1 S)^-1 S' W^-1, applied to every day and metric at once
+        S = hierarchy.summing_matrix()
+        inverse_weights = 1 / S.sum(axis=1)
+        weighted = S.T * inverse_weights
+        P = np.linalg.solve(weighted @ S, weighted)
+        reconciled = (P @ base.reshape(len(base), -1)).reshape(bottom_forecasts.shape)
+        report["aggregate_nodes"] = len(base) - bottom_count
+
+    reconciled = np.maximum(reconciled, 0)
+    levels = hierarchy.aggregate(reconciled)
+    levels["bottom"] = reconciled
+    return levels, report
@@ -0,0 +1,82 @@
+"""
+Demand classification and closed-form forecasts for the Teiden forecasting agent
+
+Many usage series are mostly zeros (an occasional image or audio call) or only
+a few days old. Fitting trended Holt-Winters or Prophet models to them costs a
+lot and forecasts them poorly. Each series is classified before fitting by the
+average interval between days with demand (ADI) and the squared coefficient of
+variation of its demand sizes (CV²), following Syntetos and Boylan. Intermittent
+and lumpy series are forecast with Croston's method using the Syntetos-Boylan
+approximation (SBA), very short ones with a seasonal naive forecast, and only
+smooth and erratic series go on to the fitted models.
+"""
+
+import os
+from typing import Tuple
+import numpy as np
+
+# Syntetos-Boylan cut-offs between smooth, erratic, intermittent and lumpy demand
+ADI_THRESHOLD = 1.32
+CV2_THRESHOLD = 0.49
+
+# Series with fewer days than this get a seasonal naive forecast (Holt-Winters needs two weeks for seasonality)
+SHORT_SERIES_DAYS = int(os.environ.get("FORECAST_SHORT_SERIES_DAYS", 14))
+
+# Smoothing of Croston's demand size and interval estimates
+CROSTON_ALPHA = 0.1
+
+SEASONAL_PERIOD = 7
+
+# Forecast path of each demand class
+DEMAND_PATHS = {
+    "no_demand": "croston_sba",
+    "intermittent": "croston_sba",
+    "lumpy": "croston_sba",
+    "short": "seasonal_naive",
+    "smooth": "model",
+    "erratic": "model"
+}
+
+def demand_statistics(demand: np.ndarray) -> Tuple[float, float]:
+    """ADI and CV² of a daily series (inf ADI when it has no demand)"""
+    sizes = demand[demand > 0]
+    if not len(sizes):
+        return float("inf"), 0.0
+    adi = len(demand) / len(sizes)
+    cv2 = float(np.var(sizes) / np.mean(sizes) ** 2) if len(sizes) > 1 else 0.0
+    return adi, cv2
+
+def classify_demand(demand: np.ndarray) -> str:
+    """Demand class of a daily series, one of the DEMAND_PATHS keys"""
+    adi, cv2 = demand_statistics(demand)
+    if adi == float("inf"):
+        return "no_demand"
+    if len(demand) < SHORT_SERIES_DAYS:
+        return "short"
+    if adi >= ADI_THRESHOLD:
+        return "lumpy" if cv2 >= CV2_THRESHOLD else "intermittent"
+    return "erratic" if cv2 >= CV2_THRESHOLD else "smooth"
+
+def croston_sba_forecast(values: np.ndarray, horizon_days: int, alpha: float = CROSTON_ALPHA) -> np.ndarray:
+    """Flat Croston forecast with the Syntetos-Boylan bias correction.
+
+    Demand sizes and the intervals between them are smoothed separately, each
+    starting from its first observation, and the daily forecast is their ratio
+    scaled by (1 - alpha / 2).
+    """
+    days = np.flatnonzero(values > 0)
+    if not len(days):
+        return np.zeros(horizon_days)
+
+    intervals = np.diff(days, prepend=-1)
+    size, interval = float(values[days[0]]), float(intervals[0])
+    for day, gap in zip(days[1:], intervals[1:]):
+        size += alpha * (values[day] - size)
+        interval += alpha * (gap - interval)
+    return np.full(horizon_days, (1 - alpha / 2) * size / interval)
+
+def seasonal_naive_forecast(values: np.ndarray, horizon_days: int, period: int = SEASONAL_PERIOD) -> np.ndarray:
+    """Repeat the last period days, or the mean when the series is shorter than that"""
+    if len(values) < period:
+        return np.full(horizon_days, float(np.mean(values)) if len(values) else 0.0)
+    return np.resize(values[-period:], horizon_days).astype(float)
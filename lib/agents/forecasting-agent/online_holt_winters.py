@@ -0,0 +1,108 @@
+"""
+Online Holt-Winters updates for the Teiden forecasting agent
+
+Holt-Winters (additive trend and weekly seasonality) is a state-space model:
+with its smoothing parameters fixed, one new day of usage moves the level,
+trend and seasonal states forward in O(1). This module captures those states
+from a statsmodels fit and advances many series at once as NumPy arrays, so
+forecasts can be refreshed as each day lands and full refits can run less often.
+"""
+
+from typing import Dict, List, Any
+import numpy as np
+
+SEASONAL_PERIODS = 7
+
+def filter_state_from_fit(results, last_day: str) -> Dict[str, Any]:
+    """Capture a fitted statsmodels Holt-Winters model's parameters and final states.
+
+    season holds the seasonal states of the last SEASONAL_PERIODS days, oldest
+    first, so season[0] applies to the day after last_day.
+    """
+    season = np.asarray(results.season, dtype=float)[-SEASONAL_PERIODS:]
+    if len(season) < SEASONAL_PERIODS:
+        season = np.zeros(SEASONAL_PERIODS)
+    return {
+        "alpha": float(results.params["smoothing_level"]),
+        "beta": float(results.params.get("smoothing_trend") or 0.0),
+        "gamma": float(results.params.get("smoothing_seasonal") or 0.0),
+        "level": float(np.asarray(results.level)[-1]),
+        "trend": float(np.asarray(results.trend)[-1]),
+        "season": season.tolist(),
+        "last_day": last_day
+    }
+
+def frozen_filter_state(season, last_day: str) -> Dict[str, Any]:
+    """States that repeat a weekly pattern unchanged as new days are filtered in.
+
+    With zero smoothing parameters, level and trend stay at zero and the
+    seasonal states only rotate, so series forecast in closed form (see
+    intermittent_demand.py) keep their forecast until the next full fit.
+    season holds the forecast of the SEASONAL_PERIODS days after last_day.
+    """
+    return {
+        "alpha": 0.0,
+        "beta": 0.0,
+        "gamma": 0.0,
+        "level": 0.0,
+        "trend": 0.0,
+        "season": [float(value) for value in season[:SEASONAL_PERIODS]],
+        "last_day": last_day
+    }
+
+def stack_filter_states(states: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """Turn a list of per-series filter states into arrays with one row per series"""
+    return {
+        "alpha": np.array([state["alpha"] for state in states], dtype=float),
+        "beta": np.array([state["beta"] for state in states], dtype=float),
+        "gamma": np.array([state["gamma"] for state in states], dtype=float),
+        "level": np.array([state["level"] for state in states], dtype=float),
+        "trend": np.array([state["trend"] for state in states], dtype=float),
+        "season": np.array([state["season"] for state in states], dtype=float).reshape(len(states), SEASONAL_PERIODS)
+    }
+
+def unstack_filter_states(arrays: Dict[str, np.ndarray], last_days: List[str]) -> List[Dict[str, Any]]:
+    """Inverse of stack_filter_states"""
+    return [{
+        "alpha": float(arrays["alpha"][i]),
+        "beta": float(arrays["beta"][i]),
+        "gamma": float(arrays["gamma"][i]),
+        "level": float(arrays["level"][i]),
+        "trend": float(arrays["trend"][i]),
+        "season": arrays["season"][i].tolist(),
+        "last_day": last_day
+    } for i, last_day in enumerate(last_days)]
+
+def advance_filter_states(arrays: Dict[str, np.ndarray], observations: np.ndarray, mask: np.ndarray = None) -> Dict[str, np.ndarray]:
+    """Advance every series' states through (series x days) new observations.
+
+    mask marks which (series, day) entries are new for that series; the others
+    leave the series' states unchanged, so series that are behind by different
+    numbers of days can be advanced together. Returns new state arrays.
+    """
+    alpha, beta, gamma = arrays["alpha"], arrays["beta"], arrays["gamma"]
+    level, trend, season = arrays["level"].copy(), arrays["trend"].copy(), arrays["season"].copy()
+    if mask is None:
+        mask = np.ones(observations.shape, dtype=bool)
+
+    for day in range(observations.shape[1]):
+        y = observations[:, day]
+        step = mask[:, day]
+        previous_season = season[:, 0]
+
+        new_level = alpha * (y - previous_season) + (1 - alpha) * (level + trend)
+        new_trend = beta * (new_level - level) + (1 - beta) * trend
+        new_season = gamma * (y - level - trend) + (1 - gamma) * previous_season
+
+        level = np.where(step, new_level, level)
+        trend = np.where(step, new_trend, trend)
+        season = np.where(step[:, None], np.column_stack([season[:, 1:], new_season]), season)
+
+    return {**arrays, "level": level, "trend": trend, "season": season}
+
+def forecast_filter_states(arrays: Dict[str, np.ndarray], horizon_days: int, non_negative: bool = True) -> np.ndarray:
+    """(series x horizon) forecasts from the current states"""
+    steps = np.arange(1, horizon_days + 1)
+    season = arrays["season"][:, (steps - 1) % SEASONAL_PERIODS]
+    forecast = arrays["level"][:, None] + steps[None, :] * arrays["trend"][:, None] + season
+    return np.maximum(forecast, 0) if non_negative else forecast
@@ -0,0 +1,161 @@
+"""
+Usage Cube for the Teiden forecasting agent
+
+A dense, read-only (series x day x metric) array of daily usage built once from
+the fetched usage_metrics rows. Every node of the forecasting graph reads this
+cube instead of re-parsing and re-grouping the raw rows, so a run's memory and
+CPU scale with series x days rather than with rows x nodes.
+"""
+
+from typing import Dict, List, Any, Iterable, Optional, Sequence, Tuple
+import numpy as np
+
+# Metrics held for every series and day, in cube order
+CUBE_METRICS = ("tokens_input", "tokens_output", "cost_in_usd")
+
+class UsageCube:
+    """Daily usage totals per series with zero-filled gaps.
+
+    values[s, d, m] is the total of metric m for series s on day d, where days
+    run contiguously from the first to the last day seen in any series. Series
+    are labelled by the value of series_fields on each row (a tuple when there
+    is more than one field). first_day/last_day bound the days each series
+    actually has rows, and observed marks every (series, day) with a row.
+    """
+
+    def __init__(self, series: Sequence[Any], days: np.ndarray, values: np.ndarray, observed: np.ndarray,
+                 row_count: int, series_fields: Tuple[str, ...] = ("model",), metrics: Tuple[str, ...] = CUBE_METRICS):
+        self.series = tuple(series)
+        self.series_fields = tuple(series_fields)
+        self.metrics = tuple(metrics)
+        self.index = {label: i for i, label in enumerate(self.series)}
+        self.metric_index = {metric: i for i, metric in enumerate(self.metrics)}
+        self.row_count = row_count
+
+        # Freeze the arrays so nodes can share the cube without copying it
+        self.days = days
+        self.values = values
+        self.observed = observed
+        for array in (self.days, self.values, self.observed):
+            array.setflags(write=False)
+
+        # An empty cube has no days to search, and argmax rejects empty rows
+        any_observed = observed.any(axis=1)
+        if observed.shape[1]:
+            self.first_day = np.where(any_observed, observed.argmax(axis=1), 0)
+            self.last_day = np.where(any_observed, observed.shape[1] - 1 - observed[:, ::-1].argmax(axis=1), -1)
+        else:
+            self.first_day = np.zeros(len(observed), dtype=int)
+            self.last_day = np.full(len(observed), -1)
+        for array in (self.first_day, self.last_day):
+            array.setflags(write=False)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict[str, Any]], series_fields: Tuple[str, ...] = ("model",),
+                  metrics: Tuple[str, ...] = CUBE_METRICS) -> "UsageCube":
+        """Aggregate usage_metrics rows into a cube with one pass over the rows"""
+        rows = list(rows)
+        if not rows:
+            return cls([], np.array([], dtype="datetime64[D]"), np.zeros((0, 0, len(metrics))),
+                       np.zeros((0, 0), dtype=bool), 0, series_fields, metrics)
+
+        if len(series_fields) == 1:
+            labels = [row[series_fields[0]] for row in rows]
+        else:
+            labels = [tuple(row[field] for field in series_fields) for row in rows]
+        series, series_idx = unique_labels(labels)
+
+        # The date part of each ISO timestamp is the day the usage is counted on
+        row_days = np.array([str(row["timestamp"])[:10] for row in rows], dtype="datetime64[D]")
+        start = row_days.min()
+        days = np.arange(start, row_days.max() + 1)
+        day_idx = (row_days - start).astype(int)
+
+        row_values = np.array([[float(row.get(metric) or 0) for metric in metrics] for row in rows], dtype=float)
+        values = np.zeros((len(series), len(days), len(metrics)), dtype=float)
+        np.add.at(values, (series_idx, day_idx), row_values)
+        observed = np.zeros((len(series), len(days)), dtype=bool)
+        observed[series_idx, day_idx] = True
+
+        return cls(list(series), days, values, observed, len(rows), series_fields, metrics)
+
+    def __contains__(self, label) -> bool:
+        return label in self.index
+
+    def __len__(self) -> int:
+        return len(self.series)
+
+    def span(self, label) -> slice:
+        """Days from a series' first to last row"""
+        i = self.index[label]
+        return slice(int(self.first_day[i]), int(self.last_day[i]) + 1)
+
+    def series_values(self, label, metrics: Optional[Sequence[str]] = None) -> np.ndarray:
+        """Read-only (days x metrics) view of one series over its span"""
+        values = self.values[self.index[label], self.span(label)]
+        if metrics is None:
+            return values
+        return values[:, [self.metric_index[metric] for metric in metrics]]
+
+    def series_days(self, label) -> np.ndarray:
+        """Days covered by series_values for a series"""
+        return self.days[self.span(label)]
+
+    def frame(self, label):
+        """One series as a gap-free daily DataFrame with a timestamp column and one column per metric"""
+        import pandas as pd
+
+        values = self.series_values(label)
+        frame = pd.DataFrame({"timestamp": pd.to_datetime(self.series_days(label))})
+        for metric, column in zip(self.metrics, values.T):
+            frame[metric] = column
+        return frame
+
+    def aggregate(self, fields: Tuple[str, ...]) -> "UsageCube":
+        """Sum series into a cube labelled by a subset of this cube's series fields"""
+        positions = [self.series_fields.index(field) for field in fields]
+        keys = [
+            tuple(label[p] for p in positions) if len(self.series_fields) > 1 else label
+            for label in self.series
+        ]
+        if len(fields) == 1:
+            keys = [key[0] if isinstance(key, tuple) else key for key in keys]
+        series, group = unique_labels(keys)
+
+        values = np.zeros((len(series),) + self.values.shape[1:])
+        np.add.at(values, group, self.values)
+        observed = np.zeros((len(series), self.observed.shape[1]), dtype=bool)
+        np.logical_or.at(observed, group, self.observed)
+        return UsageCube(series, self.days.copy(), values, observed, self.row_count, tuple(fields), self.metrics)
+
+    def totals(self, metric: str) -> np.ndarray:
+        """Total of a metric per series over every day"""
+        return self.values[:, :, self.metric_index[metric]].sum(axis=1)
+
+    def observed_days(self) -> int:
+        """Number of days with at least one row in any series"""
+        return int(self.observed.any(axis=0).sum())
+
+    def nbytes(self) -> int:
+        return int(self.values.nbytes + self.observed.nbytes + self.days.nbytes)
+
+def _sort_key(label) -> Tuple[str, ...]:
+    parts = label if isinstance(label, tuple) else (label,)
+    return tuple("" if part is None else str(part) for part in parts)
+
+def unique_labels(labels: List[Any]) -> Tuple[List[Any], np.ndarray]:
+    """Sorted unique labels and each label's position, like np.unique(return_inverse=True)
+    but for tuple or None labels, which numpy can't sort as objects"""
+    index = {}
+    order = []
+    inverse = np.empty(len(labels), dtype=int)
+    for i, label in enumerate(labels):
+        if label not in index:
+            index[label] = len(order)
+            order.append(label)
+        inverse[i] = index[label]
+
+    ranked = sorted(range(len(order)), key=lambda j: _sort_key(order[j]))
+    remap = np.empty(len(order), dtype=int)
+    remap[ranked] = np.arange(len(order))
+    return [order[j] for j in ranked], remap[inverse]
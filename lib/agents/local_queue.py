@@ -0,0 +1,121 @@
+"""
+Local durable queue shared by the Teiden agents
+
+A small SQLite-backed queue for work that has to survive the agent server being
+down or restarting: messages are put under a topic, claimed with a lease, and
+acknowledged once handled. A claimed message that isn't acknowledged before its
+lease runs out (its consumer crashed) becomes claimable again, and a failed one
+can be released with a delay for a later retry.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Any, Optional
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# SQLite file of the queue, shared by the processes on one host
+QUEUE_PATH = os.environ.get(
+    "AGENT_QUEUE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "agent_queue.sqlite3")
+)
+
+# Seconds a claimed message stays invisible to other consumers
+QUEUE_LEASE_SECONDS = 60
+
+class LocalQueue:
+    """Topic-based message queue in a SQLite file"""
+    def __init__(self, path: str = QUEUE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._transaction() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    topic TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    available_at REAL NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS messages_topic_available ON messages (topic, available_at)")
+
+    @contextmanager
+    def _transaction(self):
+        # One short-lived connection per operation, so threads and processes can share the file
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def put(self, topic: str, payloads: List[Any], delay_seconds: float = 0.0) -> int:
+        """Add one message per payload; returns how many were added"""
+        now = time.time()
+        with self._lock, self._transaction() as connection:
+            connection.executemany(
+                "INSERT INTO messages (topic, payload, available_at, created_at) VALUES (?, ?, ?, ?)",
+                [(topic, json.dumps(payload, default=str), now + delay_seconds, now) for payload in payloads]
+            )
+        return len(payloads)
+
+    def claim(self, topic: str, limit: int = 100, lease_seconds: float = QUEUE_LEASE_SECONDS) -> List[Dict[str, Any]]:
+        """Lease up to limit available messages, oldest first, as {"id", "payload", "attempts"} dicts"""
+        now = time.time()
+        with self._lock, self._transaction() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            rows = connection.execute(
+                "SELECT id, payload, attempts FROM messages WHERE topic = ? AND available_at <= ? ORDER BY id LIMIT ?",
+                (topic, now, limit)
+            ).fetchall()
+            connection.executemany(
+                "UPDATE messages SET available_at = ?, attempts = attempts + 1 WHERE id = ?",
+                [(now + lease_seconds, row[0]) for row in rows]
+            )
+        return [{"id": row[0], "payload": json.loads(row[1]), "attempts": row[2] + 1} for row in rows]
+
+    def ack(self, message_ids: List[int]) -> None:
+        """Remove handled messages"""
+        with self._lock, self._transaction() as connection:
+            connection.executemany("DELETE FROM messages WHERE id = ?", [(message_id,) for message_id in message_ids])
+
+    def release(self, message_id: int, delay_seconds: float = 0.0) -> None:
+        """Make a claimed message available again after delay_seconds"""
+        with self._lock, self._transaction() as connection:
+            connection.execute("UPDATE messages SET available_at = ? WHERE id = ?", (time.time() + delay_seconds, message_id))
+
+    def topics(self, prefix: str = "") -> List[str]:
+        """Topics starting with prefix that have messages available now"""
+        with self._lock, self._transaction() as connection:
+            rows = connection.execute(
+                "SELECT DISTINCT topic FROM messages WHERE substr(topic, 1, ?) = ? AND available_at <= ?",
+                (len(prefix), prefix, time.time())
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def size(self, topic: Optional[str] = None) -> int:
+        """Messages waiting or leased, for one topic or all"""
+        with self._lock, self._transaction() as connection:
+            if topic is None:
+                return connection.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+            return connection.execute("SELECT COUNT(*) FROM messages WHERE topic = ?", (topic,)).fetchone()[0]
+
+_queue = None
+
+def get_local_queue() -> LocalQueue:
+    """Return the shared queue, creating it on first use"""
+    global _queue
+    if _queue is None:
+        _queue = LocalQueue()
+    return _queue
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 import os
+import sys
 import json
 import time
 import datetime
@@ -13,6 +14,11 @@ import base64
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.backends import default_backend
 
+# Statistics shared with the other agents live in lib/agents
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from series_stats import update_series_statistics
+from usage_events import publish_usage_events, usage_events_from_rows
+
 # Load environment variables
 load_dotenv()
 
@@ -713,6 +719,20 @@ async def store_usage_data(state: State) -> State:
                 metrics_stored = len(usage_metrics)
                 total_metrics_stored_globally += metrics_stored  # Update global counter
                 print(f"Successfully stored {metrics_stored} usage metrics for user {user_id}")
+                
+                # Fold the new days into the per-series statistics the agents read
+                try:
+                    stats_result = update_series_statistics(supabase, usage_metrics)
+                    print(f"Updated statistics for {stats_result['series']} series")
+                except Exception as stats_error:
+                    print(f"Error updating series statistics: {stats_error}")
+                
+                # Have the prevention agent check the keys that just got new usage
+                try:
+                    publish_result = publish_usage_events(usage_events_from_rows(usage_metrics))
+                    print(f"Published {publish_result['published']} usage events via {publish_result['via']}")
+                except Exception as publish_error:
+                    print(f"Error publishing usage events: {publish_error}")
             except Exception as insert_error:
                 print(f"Error inserting metrics: {insert_error}")
         else:
@@ -0,0 +1,90 @@
+"""
+Alert fingerprints for the Teiden prevention agent
+
+A threshold that stays crossed raises the same alert on every check. Each alert
+is fingerprinted by its type, scope (the API key and the threshold level that
+matched), model and severity band, and the time a fingerprint was last sent is
+kept in the alert_fingerprints table. An alert is sent again only once its
+cooldown has passed or its severity band rises, so the notification content,
+Slack posts and notification rows of a run scale with new alerts only.
+"""
+
+import datetime
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+
+# Percentages of the cost threshold where the severity band rises: below 100%
+# (warning), then 100%, 150% and 200% of the threshold
+SEVERITY_BANDS = (100, 150, 200)
+
+def severity_band(percentage: float) -> int:
+    """Number of band edges an alert's percentage of its threshold has reached"""
+    return sum(1 for edge in SEVERITY_BANDS if (percentage or 0) >= edge)
+
+def alert_key(alert: Dict[str, Any]) -> str:
+    """Identity of an alert across runs: type, key, threshold scope and model.
+
+    Forecast alerts for different days of the same key and model share one
+    key, so a forecast that keeps crossing is one standing alert.
+    """
+    return "|".join([
+        alert.get("type") or "",
+        alert.get("api_key_id") or "*",
+        alert.get("threshold_scope") or "default",
+        alert.get("model") or "*"
+    ])
+
+def alert_fingerprint(alert: Dict[str, Any]) -> str:
+    """An alert's key with its severity band"""
+    return f"{alert_key(alert)}|{severity_band(alert.get('percentage'))}"
+
+def parse_timestamp(value: Any) -> Optional[datetime.datetime]:
+    if not value:
+        return None
+    if isinstance(value, datetime.datetime):
+        timestamp = value
+    else:
+        timestamp = datetime.datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=datetime.timezone.utc)
+
+def select_alerts_to_send(alerts: List[Dict[str, Any]], sent: Dict[str, Dict[str, Any]], now: datetime.datetime,
+                          cooldown_seconds: float) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Split alerts into those to send and those suppressed.
+
+    sent maps alert keys to their stored alert_fingerprints rows. An alert is
+    sent when its key has no row, the row's cooldown has passed, or its
+    severity band is above the one last sent.
+    """
+    to_send, suppressed = [], []
+    for alert in alerts:
+        record = sent.get(alert_key(alert))
+        last_sent_at = parse_timestamp(record.get("last_sent_at")) if record else None
+        if (
+            last_sent_at is None
+            or (now - last_sent_at).total_seconds() >= cooldown_seconds
+            or severity_band(alert.get("percentage")) > int(record.get("severity_band") or 0)
+        ):
+            to_send.append(alert)
+        else:
+            suppressed.append(alert)
+    return to_send, suppressed
+
+def fingerprint_records(alerts: Iterable[Dict[str, Any]], key_users: Dict[str, Any], now: datetime.datetime) -> List[Dict[str, Any]]:
+    """alert_fingerprints rows for sent alerts, one per key with its highest band"""
+    records = {}
+    for alert in alerts:
+        key, band = alert_key(alert), severity_band(alert.get("percentage"))
+        if key in records and records[key]["severity_band"] >= band:
+            continue
+        records[key] = {
+            "alert_key": key,
+            "fingerprint": f"{key}|{band}",
+            "user_id": key_users.get(alert.get("api_key_id")),
+            "api_key_id": alert.get("api_key_id"),
+            "alert_type": alert.get("type"),
+            "threshold_scope": alert.get("threshold_scope"),
+            "model": alert.get("model"),
+            "severity": alert.get("severity"),
+            "severity_band": band,
+            "last_sent_at": now.isoformat()
+        }
+    return list(records.values())
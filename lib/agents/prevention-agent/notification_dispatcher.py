@@ -0,0 +1,268 @@
+"""
+Notification dispatcher for the Teiden prevention agent
+
+Prevention checks don't send notifications themselves: they put them on the
+local queue (local_queue.py), one topic per channel and destination (a Slack
+webhook or an email address, named by its hash so neither is stored or logged
+outside the message itself), and return. A background thread starts a lane
+for every destination with notifications waiting, on a shared thread pool, and
+each lane sends its notifications in batches through the channel's sender
+with a timeout. A failed batch is retried with exponential backoff and set
+aside after NOTIFY_MAX_ATTEMPTS, so a slow or failing destination only delays
+its own lane and never the checks.
+
+Senders are plain functions registered per channel with register_sender. With
+NOTIFY_BACKEND=local, Slack and email are written to JSON Lines files under
+NOTIFY_OUTBOX_DIR instead of being sent.
+"""
+
+import os
+import sys
+import json
+import hashlib
+import time
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Any, Optional
+from dotenv import load_dotenv
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from local_queue import get_local_queue
+
+# Load environment variables
+load_dotenv()
+
+NOTIFICATIONS_TOPIC = "notifications"
+DEAD_NOTIFICATIONS_TOPIC = "notifications_dead"
+
+# "live" sends through Slack webhooks and SMTP, "local" writes to NOTIFY_OUTBOX_DIR instead
+NOTIFY_BACKEND = os.environ.get("NOTIFY_BACKEND", "live")
+NOTIFY_OUTBOX_DIR = os.environ.get(
+    "NOTIFY_OUTBOX_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "outbox")
+)
+
+# Seconds a sender may take per batch, and notifications per batch
+NOTIFY_TIMEOUT_SECONDS = float(os.environ.get("NOTIFY_TIMEOUT_SECONDS", 10))
+NOTIFY_BATCH_SIZE = int(os.environ.get("NOTIFY_BATCH_SIZE", 10))
+
+# Lanes sending at once, in total and per channel
+NOTIFY_MAX_WORKERS = int(os.environ.get("NOTIFY_MAX_WORKERS", 8))
+NOTIFY_CHANNEL_CONCURRENCY = int(os.environ.get("NOTIFY_CHANNEL_CONCURRENCY", 4))
+
+# Sends per notification before it is set aside, and the delay before the first retry (doubling after)
+NOTIFY_MAX_ATTEMPTS = int(os.environ.get("NOTIFY_MAX_ATTEMPTS", 5))
+NOTIFY_RETRY_SECONDS = float(os.environ.get("NOTIFY_RETRY_SECONDS", 30))
+
+# Seconds between checks of the queue for retries and notifications queued by other processes
+NOTIFY_POLL_SECONDS = float(os.environ.get("NOTIFY_POLL_SECONDS", 5))
+
+SMTP_HOST = os.environ.get("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", 25))
+SMTP_USERNAME = os.environ.get("SMTP_USERNAME")
+SMTP_PASSWORD = os.environ.get("SMTP_PASSWORD")
+NOTIFY_EMAIL_FROM = os.environ.get("NOTIFY_EMAIL_FROM", "alerts@teiden.local")
+
+def lane_topic(channel: str, destination: str) -> str:
+    """Queue topic of a destination's lane; webhook URLs are secrets, so it names the lane by a hash"""
+    digest = hashlib.sha256(f"{channel}\0{destination}".encode("utf-8")).hexdigest()[:32]
+    return f"{NOTIFICATIONS_TOPIC}:{channel}:{digest}"
+
+def slack_payload(contents: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """One Slack message with a section per notification"""
+    blocks = []
+    for content in contents:
+        blocks += [
+            {"type": "header", "text": {"type": "plain_text", "text": content["title"][:150]}},
+            {"type": "section", "text": {"type": "mrkdwn", "text": content["message"]}},
+            {"type": "divider"}
+        ]
+    blocks.append({
+        "type": "context",
+        "elements": [{
+            "type": "mrkdwn",
+            "text": f"*Teiden Prevention Agent* | {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+        }]
+    })
+    return {"text": contents[0]["summary"] if len(contents) == 1 else f"{len(contents)} API usage notifications", "blocks": blocks}
+
+def send_slack(webhook_url: str, contents: List[Dict[str, Any]]) -> None:
+    """Post a batch to a Slack incoming webhook"""
+    import requests
+
+    try:
+        response = requests.post(webhook_url, json=slack_payload(contents), timeout=NOTIFY_TIMEOUT_SECONDS)
+    except requests.RequestException as e:
+        # Request errors quote the webhook URL, which is a secret
+        raise RuntimeError(f"Slack request failed ({type(e).__name__})") from None
+    if response.status_code != 200:
+        raise RuntimeError(f"Slack returned {response.status_code} {response.text}")
+
+def email_message(address: str, contents: List[Dict[str, Any]]):
+    from email.message import EmailMessage
+
+    message = EmailMessage()
+    message["From"] = NOTIFY_EMAIL_FROM
+    message["To"] = address
+    message["Subject"] = contents[0]["title"] if len(contents) == 1 else f"{len(contents)} API usage notifications"
+    message.set_content("\n\n".join(f"{content['title']}\n\n{content['message']}" for content in contents))
+    return message
+
+def send_email(address: str, contents: List[Dict[str, Any]]) -> None:
+    """Send a batch as one email through SMTP_HOST"""
+    import smtplib
+
+    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=NOTIFY_TIMEOUT_SECONDS) as smtp:
+        if SMTP_USERNAME:
+            smtp.starttls()
+            smtp.login(SMTP_USERNAME, SMTP_PASSWORD)
+        smtp.send_message(email_message(address, contents))
+
+def write_outbox(channel: str, destination: str, payload: Any) -> None:
+    os.makedirs(NOTIFY_OUTBOX_DIR, exist_ok=True)
+    with open(os.path.join(NOTIFY_OUTBOX_DIR, f"{channel}.jsonl"), "a") as outbox:
+        outbox.write(json.dumps({"destination": destination, "sent_at": time.time(), "payload": payload}, default=str) + "\n")
+
+def send_slack_local(webhook_url: str, contents: List[Dict[str, Any]]) -> None:
+    """Stand-in for send_slack that writes the Slack payload to the outbox"""
+    write_outbox("slack", webhook_url, slack_payload(contents))
+
+def send_email_local(address: str, contents: List[Dict[str, Any]]) -> None:
+    """Stand-in for send_email that writes the email to the outbox"""
+    write_outbox("email", address, email_message(address, contents).as_string())
+
+SENDERS: Dict[str, Callable[[str, List[Dict[str, Any]]], None]] = (
+    {"slack": send_slack_local, "email": send_email_local} if NOTIFY_BACKEND == "local"
+    else {"slack": send_slack, "email": send_email}
+)
+
+def register_sender(channel: str, sender: Callable[[str, List[Dict[str, Any]]], None]) -> None:
+    """Send a channel's notifications with sender(destination, contents), which raises on failure"""
+    SENDERS[channel] = sender
+
+class NotificationDispatcher:
+    """Sends queued notifications in per-destination lanes on a thread pool"""
+    def __init__(self, max_workers: int = NOTIFY_MAX_WORKERS, channel_concurrency: int = NOTIFY_CHANNEL_CONCURRENCY,
+                 batch_size: int = NOTIFY_BATCH_SIZE, poll_seconds: float = NOTIFY_POLL_SECONDS):
+        self.max_workers = max_workers
+        self.channel_concurrency = channel_concurrency
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self._lanes = set()  # topics of the lanes sending now
+        self._channel_lanes = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._executor = None
+        self._thread = None
+        self.sending = True  # False in processes that only queue, like fleet run workers
+        self.counters = {"queued": 0, "sent": 0, "batches": 0, "failed_batches": 0, "retried": 0, "dead": 0}
+
+    def enqueue(self, channel: str, destination: str, content: Dict[str, Any], user_id: Optional[str] = None) -> None:
+        """Persist a notification for a destination and wake the dispatcher"""
+        get_local_queue().put(lane_topic(channel, destination), [{
+            "channel": channel,
+            "destination": destination,
+            "user_id": user_id,
+            "content": content
+        }])
+        with self._lock:
+            self.counters["queued"] += 1
+        self._wake.set()
+
+    def start(self):
+        """Start the dispatcher thread once"""
+        with self._lock:
+            if self._thread is None and self.sending:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="notify")
+                self._thread = threading.Thread(target=self._run, name="notification-dispatcher", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.dispatch()
+            except Exception as e:
+                print(f"Error dispatching notifications: {str(e)}")
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def dispatch(self):
+        """Start a lane for each destination with notifications waiting, within the concurrency limits"""
+        for topic in get_local_queue().topics(f"{NOTIFICATIONS_TOPIC}:"):
+            channel = topic.split(":", 2)[1]
+            with self._lock:
+                if topic in self._lanes or self._channel_lanes.get(channel, 0) >= self.channel_concurrency:
+                    continue
+                self._lanes.add(topic)
+                self._channel_lanes[channel] = self._channel_lanes.get(channel, 0) + 1
+            self._executor.submit(self._run_lane, topic, channel)
+
+    def _run_lane(self, topic: str, channel: str):
+        try:
+            queue = get_local_queue()
+            # Keep a batch leased for longer than its sender may take
+            while True:
+                batch = queue.claim(topic, limit=self.batch_size, lease_seconds=NOTIFY_TIMEOUT_SECONDS * 3)
+                # Leave the rest of a failing destination's notifications for their retry
+                if not batch or not self._send_batch(channel, batch):
+                    break
+        except Exception as e:
+            print(f"Error in notification lane {channel}: {str(e)}")
+        finally:
+            with self._lock:
+                self._lanes.discard(topic)
+                self._channel_lanes[channel] -= 1
+            self._wake.set()
+
+    def _send_batch(self, channel: str, batch: List[Dict[str, Any]]) -> bool:
+        queue = get_local_queue()
+        destination = batch[0]["payload"]["destination"]
+        try:
+            sender = SENDERS.get(channel)
+            if sender is None:
+                raise RuntimeError(f"No sender registered for channel {channel}")
+            sender(destination, [message["payload"]["content"] for message in batch])
+        except Exception as e:
+            print(f"Error sending {len(batch)} {channel} notifications: {str(e)}")
+            retries = [message for message in batch if message["attempts"] < NOTIFY_MAX_ATTEMPTS]
+            dead = [message for message in batch if message["attempts"] >= NOTIFY_MAX_ATTEMPTS]
+            for message in retries:
+                queue.release(message["id"], NOTIFY_RETRY_SECONDS * 2 ** (message["attempts"] - 1))
+            if dead:
+                queue.put(DEAD_NOTIFICATIONS_TOPIC, [{**message["payload"], "error": str(e)} for message in dead])
+                queue.ack([message["id"] for message in dead])
+            with self._lock:
+                self.counters["failed_batches"] += 1
+                self.counters["retried"] += len(retries)
+                self.counters["dead"] += len(dead)
+            return False
+        queue.ack([message["id"] for message in batch])
+        with self._lock:
+            self.counters["batches"] += 1
+            self.counters["sent"] += len(batch)
+        return True
+
+    def flush(self, timeout_seconds: float) -> bool:
+        """Wait until no notification is waiting or being sent; False if some still are after timeout_seconds"""
+        self.start()
+        self._wake.set()
+        deadline = time.monotonic() + timeout_seconds
+        while time.monotonic() < deadline:
+            with self._lock:
+                busy = bool(self._lanes)
+            if not busy and not get_local_queue().topics(f"{NOTIFICATIONS_TOPIC}:"):
+                return True
+            time.sleep(0.05)
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.counters,
+                "sending_lanes": len(self._lanes),
+                "running": self._thread is not None
+            }
+
+# Shared by every check in the process
+notification_dispatcher = NotificationDispatcher()
@@ -8,17 +8,31 @@ notifications to Slack or other configured channels.
 """
 
 import os
+import sys
 import json
+import argparse
 import datetime
 import time
+import threading
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from typing import Dict, List, Any, Optional, TypedDict, Literal
 from dotenv import load_dotenv
-import pandas as pd
-import requests
-from supabase import create_client
-from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
-from langgraph.graph import StateGraph, END
+import numpy as np
+from threshold_index import ThresholdIndex, THRESHOLD_SCOPES
+from alert_fingerprints import alert_key, fingerprint_records, parse_timestamp, select_alerts_to_send
+from notification_dispatcher import NOTIFY_TIMEOUT_SECONDS, notification_dispatcher
+
+# Statistics shared with the other agents live in lib/agents
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from series_stats import SeriesStats, query_series_statistics
+from local_queue import get_local_queue
+from usage_events import USAGE_EVENTS_TOPIC
+
+# requests, supabase, langchain and langgraph are imported where they are first
+# needed, so a check that sends no notifications never loads the LLM stack
+# (see benchmarks/cold_start.py)
 
 # Load environment variables
 load_dotenv()
@@ -27,14 +41,75 @@ supabase_key = os.environ.get("SUPABASE_SERVICE_KEY", os.environ.get("NEXT_PUBLI
 openai_api_key = os.environ.get("OPENAI_API_KEY")
 slack_webhook_url = os.environ.get("SLACK_WEBHOOK_URL")
 
-# Initialize Supabase client
-supabase = create_client(supabase_url, supabase_key)
+# Supabase client, created on first use
+_supabase = None
+
+def get_supabase():
+    """Return the shared Supabase client, creating it on first use"""
+    global _supabase
+    if _supabase is None:
+        from supabase import create_client
+        _supabase = create_client(supabase_url, supabase_key)
+    return _supabase
+
+# Event-driven checks wait this long for a burst of usage events to settle, and
+# drain events fetchers queued locally at least this often
+PREVENTION_EVENT_DEBOUNCE_SECONDS = float(os.environ.get("PREVENTION_EVENT_DEBOUNCE_SECONDS", 1))
+PREVENTION_EVENT_POLL_SECONDS = float(os.environ.get("PREVENTION_EVENT_POLL_SECONDS", 10))
+
+# Events of a failed check are retried after this delay (doubling each time), up to this many checks
+PREVENTION_EVENT_RETRY_SECONDS = float(os.environ.get("PREVENTION_EVENT_RETRY_SECONDS", 60))
+PREVENTION_EVENT_MAX_ATTEMPTS = int(os.environ.get("PREVENTION_EVENT_MAX_ATTEMPTS", 5))
+
+# Hours an unchanged alert is not sent again, unless its severity band rises
+ALERT_COOLDOWN_HOURS = float(os.environ.get("PREVENTION_ALERT_COOLDOWN_HOURS", 24))
+
+# Worker processes ("process") or threads ("thread") of a fleet run, and how many (default: CPU count)
+PREVENTION_FLEET_EXECUTOR = os.environ.get("PREVENTION_FLEET_EXECUTOR", "process")
+PREVENTION_FLEET_WORKERS = int(os.environ.get("PREVENTION_FLEET_WORKERS", os.cpu_count() or 1))
+
+# Days ahead of today whose forecasts are checked; stored runs forecast FORECAST_FIT_HORIZON (90 days)
+PREVENTION_FORECAST_DAYS = int(os.environ.get("PREVENTION_FORECAST_DAYS", 14))
+
+# Key and user ids per in_ filter, and rows per page of a batched query
+QUERY_CHUNK_SIZE = int(os.environ.get("PREVENTION_QUERY_CHUNK_SIZE", 200))
+QUERY_PAGE_SIZE = int(os.environ.get("PREVENTION_QUERY_PAGE_SIZE", 1000))
+
+def select_in_chunks(table: str, column: str, values: List[Any], refine=None, columns: str = "*") -> List[Dict[str, Any]]:
+    """All rows of table whose column is one of values, with the given columns.
+    
+    values are split into QUERY_CHUNK_SIZE in_ filters and each chunk is read
+    in QUERY_PAGE_SIZE pages, so any number of keys takes a bounded number of
+    round trips per chunk. refine adds the query's other filters and an order
+    that makes the pages stable.
+    """
+    rows = []
+    values = list(dict.fromkeys(values))
+    for start in range(0, len(values), QUERY_CHUNK_SIZE):
+        chunk = values[start:start + QUERY_CHUNK_SIZE]
+        offset = 0
+        while True:
+            query = get_supabase().table(table).select(columns).in_(column, chunk)
+            if refine:
+                query = refine(query)
+            response = query.range(offset, offset + QUERY_PAGE_SIZE - 1).execute()
+            
+            if hasattr(response, 'error') and response.error:
+                raise RuntimeError(f"Error fetching {table}: {response.error.message}")
+            
+            page = response.data or []
+            rows.extend(page)
+            if len(page) < QUERY_PAGE_SIZE:
+                break
+            offset += QUERY_PAGE_SIZE
+    return rows
 
 # Define state types
 class PreventionState(TypedDict):
     user_id: Optional[str]
     project_id: Optional[str]
     provider: Optional[str]
+    api_key_ids: Optional[List[str]]
     api_keys: Optional[List[Dict[str, Any]]]
     usage_data: Optional[Dict[str, Any]]
     forecast_data: Optional[Dict[str, Any]]
@@ -54,19 +129,23 @@ def fetch_api_keys(state: PreventionState) -> PreventionState:
         state = state.copy()
         state["status"] = "fetching_keys"
         
-        # Build query
-        query = supabase.table("user_api_keys").select("*")
-        
         # Apply filters if provided
-        if state["user_id"]:
-            query = query.eq("user_id", state["user_id"])
-        if state["project_id"]:
-            query = query.eq("project_id", state["project_id"])
-        if state["provider"]:
-            query = query.eq("provider", state["provider"])
-            
+        def apply_filters(query):
+            if state["user_id"]:
+                query = query.eq("user_id", state["user_id"])
+            if state["project_id"]:
+                query = query.eq("project_id", state["project_id"])
+            if state["provider"]:
+                query = query.eq("provider", state["provider"])
+            return query
+        
+        # Event-driven checks only look at the keys that just got new usage
+        if state.get("api_key_ids"):
+            state["api_keys"] = select_in_chunks("user_api_keys", "id", state["api_key_ids"], apply_filters)
+            return state
+        
         # Execute query
-        response = query.execute()
+        response = apply_filters(get_supabase().table("user_api_keys").select("*")).execute()
         
         # Check for errors
         if hasattr(response, 'error') and response.error:
@@ -101,30 +180,90 @@ def fetch_usage_data(state: PreventionState) -> PreventionState:
         start_date_str = start_date.isoformat()
         end_date_str = end_date.isoformat()
         
-        # Fetch usage data for each key
-        usage_data = {}
+        # Series statistics stand in for a series' raw rows when their window holds the 8 calendar
+        # days the 7-day range touches and no usage row of the series was stored after them
+        today = datetime.date.today()
+        try:
+            statistics = query_series_statistics(get_supabase(), api_key_ids=[key["id"] for key in state["api_keys"]])
+        except Exception as e:
+            print(f"Could not read series statistics: {str(e)}")
+            statistics = []
+        series_statistics = {}
+        for row in statistics:
+            stats = SeriesStats.from_dict(row["stats"])
+            if stats.last_day is not None and (stats.last_day - today).days + 8 <= len(stats.window):
+                series_statistics[(row["api_key_id"], row["provider"], row["model"])] = (stats, parse_timestamp(row["updated_at"]))
+        
+        # A series is stale when it has usage in the range but no statistics, or a row stored after
+        # them; one narrow query over the range's rows of the keys with statistics finds those
+        stale_series = set()
+        statistics_key_ids = list({key_id for key_id, _, _ in series_statistics})
+        if statistics_key_ids:
+            try:
+                stored_rows = select_in_chunks(
+                    "usage_metrics", "api_key_id", statistics_key_ids,
+                    lambda query: query.gte("timestamp", start_date_str).lte("timestamp", end_date_str).order("id"),
+                    columns="id, api_key_id, provider, model, updated_at"
+                )
+            except Exception as e:
+                print(f"Could not check series statistics against usage data: {str(e)}")
+                stored_rows = None
+            if stored_rows is None:
+                series_statistics = {}
+            for row in stored_rows or []:
+                series = (row["api_key_id"], row.get("provider"), row.get("model"))
+                if series not in series_statistics or parse_timestamp(row.get("updated_at")) > series_statistics[series][1]:
+                    stale_series.add(series)
+        for series in stale_series:
+            series_statistics.pop(series, None)
+        key_statistics = defaultdict(list)
+        for (key_id, _, _), (stats, _) in series_statistics.items():
+            key_statistics[key_id].append(stats)
+        
+        # Keys without current statistics get all their raw rows, and the others their stale series' rows
+        raw_key_ids = {key["id"] for key in state["api_keys"] if not key_statistics.get(key["id"])}
+        stale_key_ids = {key_id for key_id, _, _ in stale_series if key_statistics.get(key_id)}
+        key_metrics = defaultdict(list)
+        try:
+            rows = [
+                row for row in select_in_chunks(
+                    "usage_metrics", "api_key_id", sorted(raw_key_ids | stale_key_ids),
+                    lambda query: query.gte("timestamp", start_date_str).lte("timestamp", end_date_str)
+                        .order("timestamp", desc=True).order("id")
+                )
+                if row["api_key_id"] in raw_key_ids or (row["api_key_id"], row.get("provider"), row.get("model")) in stale_series
+            ]
+        except Exception as e:
+            print(f"Error fetching usage data: {str(e)}")
+            rows = None
+        for row in rows or []:
+            key_metrics[row["api_key_id"]].append(row)
         
+        usage_data = {}
         for key in state["api_keys"]:
             key_id = key["id"]
             
-            # Query usage metrics
-            query = supabase.table("usage_metrics") \
-                .select("*") \
-                .eq("api_key_id", key_id) \
-                .gte("timestamp", start_date_str) \
-                .lte("timestamp", end_date_str) \
-                .order("timestamp", desc=True)
-                
-            response = query.execute()
-            
-            if hasattr(response, 'error') and response.error:
-                print(f"Error fetching usage data for key {key_id}: {response.error.message}")
-                continue
-                
-            usage_data[key_id] = {
-                "metrics": response.data,
-                "key_details": key
-            }
+            if key_statistics.get(key_id):
+                if rows is None and key_id in stale_key_ids:
+                    continue
+                # Days with usage among the 8 calendar days the 7-day range touches, summed over the key's series
+                daily_costs = defaultdict(float)
+                for stats in key_statistics[key_id]:
+                    for day, values in stats.daily_values(today, 8).items():
+                        if values.any():
+                            daily_costs[day] += float(values[2])
+                for metric in key_metrics.get(key_id, []):
+                    daily_costs[metric.get("timestamp", "").split("T")[0]] += metric.get("cost_in_usd", 0) or 0
+                usage_data[key_id] = {
+                    "metrics": key_metrics.get(key_id, []),
+                    "daily_costs": dict(daily_costs),
+                    "key_details": key
+                }
+            elif rows is not None:
+                usage_data[key_id] = {
+                    "metrics": key_metrics.get(key_id, []),
+                    "key_details": key
+                }
             
         # Update state with usage data
         state["usage_data"] = usage_data
@@ -140,32 +279,35 @@ def fetch_forecasts(state: PreventionState) -> PreventionState:
         state = state.copy()
         state["status"] = "fetching_forecasts"
         
-        # Fetch the latest forecasts for the relevant API keys/projects
+        # Fetch the latest forecasts of every key's user in batched queries, within the check's window
         forecasts = {}
+        today = datetime.date.today()
+        window_end = today + datetime.timedelta(days=PREVENTION_FORECAST_DAYS)
         
         if state["api_keys"]:
+            user_ids = [key["user_id"] for key in state["api_keys"]]
+            try:
+                rows = select_in_chunks(
+                    "latest_forecasts", "user_id", user_ids,
+                    lambda query: (query.eq("project_id", state["project_id"]) if state["project_id"] else query)
+                        .gte("forecast_date", today.isoformat()).lte("forecast_date", window_end.isoformat())
+                        .order("id")
+                )
+            except Exception as e:
+                print(f"Error fetching forecasts: {str(e)}")
+                rows = []
+            
+            # Keys that share a user and project share the same forecasts
+            scope_forecasts = defaultdict(list)
+            for row in rows:
+                scope_forecasts[(row["user_id"], None)].append(row)
+                if row.get("project_id"):
+                    scope_forecasts[(row["user_id"], row["project_id"])].append(row)
+            
             for key in state["api_keys"]:
-                key_id = key["id"]
-                user_id = key["user_id"]
-                project_id = key.get("project_id")
-                
-                # Build query for forecasts
-                query = supabase.table("forecasts") \
-                    .select("*") \
-                    .eq("user_id", user_id) \
-                    .eq("is_latest", True)
-                    
-                if project_id:
-                    query = query.eq("project_id", project_id)
-                    
-                response = query.execute()
-                
-                if hasattr(response, 'error') and response.error:
-                    print(f"Error fetching forecasts for key {key_id}: {response.error.message}")
-                    continue
-                    
-                if response.data:
-                    forecasts[key_id] = response.data
+                key_forecasts = scope_forecasts.get((key["user_id"], key.get("project_id") or None))
+                if key_forecasts:
+                    forecasts[key["id"]] = key_forecasts
         
         # Update state with forecast data
         state["forecast_data"] = forecasts
@@ -181,7 +323,7 @@ def fetch_thresholds(state: PreventionState) -> PreventionState:
         state = state.copy()
         
         # Query thresholds table
-        query = supabase.table("thresholds").select("*")
+        query = get_supabase().table("thresholds").select("*")
         
         if state["user_id"]:
             query = query.eq("user_id", state["user_id"])
@@ -196,35 +338,16 @@ def fetch_thresholds(state: PreventionState) -> PreventionState:
             # Convert to dictionary for easier lookup
             thresholds = {item["id"]: item for item in response.data}
             
-        # Get notification settings
-        settings_query = supabase.table("notification_settings").select("*")
-        
-        if state["user_id"]:
-            settings_query = settings_query.eq("user_id", state["user_id"])
-            
-        settings_response = settings_query.execute()
-        
-        if not hasattr(settings_response, 'error') and settings_response.data:
-            notification_settings = settings_response.data[0]
-        else:
-            # Default settings if none found
-            notification_settings = {
-                "channels": ["slack"],
-                "frequency": "immediate",
-                "enabled": True
-            }
-            
-        # Update state
+        # Update state, with the thresholds compiled once for the run's lookups
         state["thresholds"] = {
             "thresholds": thresholds,
-            "notification_settings": notification_settings,
             "default_cost_threshold": 100,  # Default $100
             "default_usage_threshold": 0.8,  # Default 80% of capacity
             "default_balance_threshold": 0.2  # Alert when 20% balance remaining
         }
+        state["thresholds"]["index"] = ThresholdIndex(thresholds.values(), 100, 0.8)
         
-        state["notification_channels"] = notification_settings.get("channels", ["slack"])
-        
+        # Channels and destinations come from each user's notification_settings in send_notifications
         return state
     except Exception as e:
         print(f"Error in fetch_thresholds: {str(e)}")
@@ -234,9 +357,35 @@ def fetch_thresholds(state: PreventionState) -> PreventionState:
             "default_usage_threshold": 0.8,
             "default_balance_threshold": 0.2
         }
-        state["notification_channels"] = ["slack"]
         return state
 
+def daily_cost_matrix(usage_data: Dict[str, Any]):
+    """Every key's daily costs as a (keys x days) array, with a mask of the days each key has usage on"""
+    key_ids = list(usage_data)
+    counts, dates, costs = [], [], []
+    for key_id in key_ids:
+        key_data = usage_data[key_id]
+        daily_costs = key_data.get("daily_costs")
+        if daily_costs is None:
+            # Sum the raw rows by day
+            metrics = key_data.get("metrics", [])
+            daily_costs = {}
+            for metric in metrics:
+                date = metric.get("timestamp", "").split("T")[0]
+                daily_costs[date] = daily_costs.get(date, 0) + (metric.get("cost_in_usd", 0) or 0)
+        counts.append(len(daily_costs))
+        dates.extend(daily_costs)
+        costs.extend(daily_costs.values())
+    
+    day_index = {day: d for d, day in enumerate(sorted(set(dates)))}
+    rows = np.repeat(np.arange(len(key_ids)), counts)
+    columns = [day_index[day] for day in dates]
+    matrix = np.zeros((len(key_ids), len(day_index)))
+    observed = np.zeros((len(key_ids), len(day_index)), dtype=bool)
+    matrix[rows, columns] = costs
+    observed[rows, columns] = True
+    return key_ids, matrix, observed
+
 def analyze_thresholds(state: PreventionState) -> PreventionState:
     """Check if any usage metrics have crossed thresholds"""
     try:
@@ -245,115 +394,114 @@ def analyze_thresholds(state: PreventionState) -> PreventionState:
         
         alerts = []
         
-        # Get default thresholds
+        # Resolve thresholds through the index compiled by fetch_thresholds
         thresholds = state.get("thresholds", {})
-        default_cost_threshold = thresholds.get("default_cost_threshold", 100)
-        default_usage_threshold = thresholds.get("default_usage_threshold", 0.8)
-        default_balance_threshold = thresholds.get("default_balance_threshold", 0.2)
+        index = thresholds.get("index") or ThresholdIndex(
+            thresholds.get("thresholds", {}).values(),
+            thresholds.get("default_cost_threshold", 100),
+            thresholds.get("default_usage_threshold", 0.8)
+        )
+        api_keys = {key["id"]: key for key in state.get("api_keys") or []}
+        usage_data = state.get("usage_data") or {}
+        forecast_data = state.get("forecast_data") or {}
         
-        # First, check current usage against thresholds
-        usage_data = state.get("usage_data", {})
+        # Keys in the same scope share their forecast rows, so each distinct list is flattened once
+        forecast_keys, key_lists, lists, list_index = [], [], [], {}
+        for key_id, forecasts in forecast_data.items():
+            # Skip if we don't have the key details
+            if key_id in api_keys and forecasts:
+                if id(forecasts) not in list_index:
+                    list_index[id(forecasts)] = len(lists)
+                    lists.append(forecasts)
+                forecast_keys.append(key_id)
+                key_lists.append(list_index[id(forecasts)])
+        forecast_rows = [forecast for forecasts in lists for forecast in forecasts]
+        model_ids = {}
+        model_index = np.fromiter(
+            (model_ids.setdefault(forecast.get("model", "unknown"), len(model_ids)) for forecast in forecast_rows),
+            dtype=int, count=len(forecast_rows)
+        )
         
+        # Resolve every key's thresholds in one pass: column 0 for its usage, then one per forecast model
+        key_rows = dict(api_keys)
         for key_id, key_data in usage_data.items():
-            metrics = key_data.get("metrics", [])
-            key_details = key_data.get("key_details", {})
-            
-            if not metrics:
-                continue
-                
-            # Calculate aggregated metrics for this key
-            total_cost = sum(metric.get("cost_in_usd", 0) for metric in metrics)
-            daily_costs = {}
+            key_rows.setdefault(key_id, key_data.get("key_details") or {"id": key_id})
+        key_position = {key_id: position for position, key_id in enumerate(key_rows)}
+        key_details = list(key_rows.values())
+        cost_thresholds, usage_thresholds, scopes = index.resolve_keys(key_details, [None] + [str(model) for model in model_ids])
+        limits = cost_thresholds * usage_thresholds
+        
+        # First, check current usage against thresholds, every key at once
+        key_ids, costs, observed = daily_cost_matrix(usage_data)
+        if observed.any():
+            rows = np.arange(len(key_ids))
+            total_cost = costs.sum(axis=1)
+            days_with_usage = observed.sum(axis=1)
+            daily_avg = total_cost / np.maximum(days_with_usage, 1)
             
-            for metric in metrics:
-                date = metric.get("timestamp", "").split("T")[0]
-                daily_costs[date] = daily_costs.get(date, 0) + metric.get("cost_in_usd", 0)
-                
-            # Calculate daily average and trend
-            if daily_costs:
-                dates = sorted(daily_costs.keys())
-                if len(dates) >= 2:
-                    first_day = dates[0]
-                    last_day = dates[-1]
-                    daily_trend = daily_costs[last_day] / daily_costs[first_day] if daily_costs[first_day] > 0 else 1
-                else:
-                    daily_trend = 1
-                    
-                daily_avg = sum(daily_costs.values()) / len(daily_costs)
-            else:
-                daily_avg = 0
-                daily_trend = 1
-                
-            # Get model-specific threshold if available
-            # This would be extended in a real implementation to check per model/provider
-            specific_threshold = next(
-                (t for t in thresholds.get("thresholds", {}).values() 
-                 if t.get("api_key_id") == key_id),
-                None
+            # Trend from the first to the last day with usage
+            first_cost = costs[rows, observed.argmax(axis=1)]
+            last_cost = costs[rows, costs.shape[1] - 1 - observed[:, ::-1].argmax(axis=1)]
+            daily_trend = np.where(
+                (days_with_usage >= 2) & (first_cost > 0),
+                last_cost / np.where(first_cost > 0, first_cost, 1),
+                1.0
             )
+            positions = np.fromiter((key_position[key_id] for key_id in key_ids), dtype=int, count=len(key_ids))
             
-            cost_threshold = specific_threshold.get("cost_threshold", default_cost_threshold) if specific_threshold else default_cost_threshold
-            
-            # Check if we're approaching the threshold
-            if total_cost > cost_threshold * default_usage_threshold:
+            # Alert when the cost is approaching the threshold
+            for k in np.flatnonzero((days_with_usage > 0) & (total_cost > limits[positions, 0])):
+                details = key_details[positions[k]]
+                total, threshold = float(total_cost[k]), float(cost_thresholds[positions[k], 0])
                 alerts.append({
                     "type": "cost_threshold",
-                    "severity": "warning" if total_cost < cost_threshold else "critical",
-                    "api_key_id": key_id,
-                    "api_key_name": key_details.get("name", "Unknown"),
-                    "provider": key_details.get("provider", "Unknown"),
-                    "current_cost": total_cost,
-                    "threshold": cost_threshold,
-                    "percentage": (total_cost / cost_threshold) * 100,
-                    "daily_avg": daily_avg,
-                    "trend": daily_trend,
-                    "message": f"API usage cost is {(total_cost / cost_threshold) * 100:.1f}% of threshold (${total_cost:.2f} / ${cost_threshold:.2f})"
+                    "severity": "warning" if total < threshold else "critical",
+                    "api_key_id": key_ids[k],
+                    "api_key_name": details.get("name", "Unknown"),
+                    "provider": details.get("provider", "Unknown"),
+                    "current_cost": total,
+                    "threshold": threshold,
+                    "threshold_scope": THRESHOLD_SCOPES[scopes[positions[k], 0]],
+                    "percentage": (total / threshold) * 100,
+                    "daily_avg": float(daily_avg[k]),
+                    "trend": float(daily_trend[k]),
+                    "message": f"API usage cost is {(total / threshold) * 100:.1f}% of threshold (${total:.2f} / ${threshold:.2f})"
                 })
                 
-        # Next, check forecasts against thresholds
-        forecast_data = state.get("forecast_data", {})
-        
-        for key_id, forecasts in forecast_data.items():
-            key_details = next((k for k in state.get("api_keys", []) if k["id"] == key_id), {})
-            
-            # Skip if we don't have the key details
-            if not key_details:
-                continue
-                
-            # Get model-specific thresholds
-            specific_threshold = next(
-                (t for t in thresholds.get("thresholds", {}).values() 
-                 if t.get("api_key_id") == key_id),
-                None
-            )
+        # Next, check forecasts against thresholds, every (key, forecast row) pair at once
+        if forecast_keys:
+            cost_forecast = np.array([float(forecast.get("cost_forecast") or 0) for forecast in forecast_rows])
             
-            cost_threshold = specific_threshold.get("cost_threshold", default_cost_threshold) if specific_threshold else default_cost_threshold
+            # Pair each key with every row of its list, in key then row order
+            lengths = np.array([len(forecasts) for forecasts in lists])
+            starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+            key_lists = np.array(key_lists)
+            pair_counts = lengths[key_lists]
+            pair_key = np.repeat(np.fromiter((key_position[key_id] for key_id in forecast_keys), dtype=int, count=len(forecast_keys)), pair_counts)
+            pair_row = np.arange(pair_counts.sum()) + np.repeat(starts[key_lists] - (np.cumsum(pair_counts) - pair_counts), pair_counts)
+            pair_cost = cost_forecast[pair_row]
+            pair_column = model_index[pair_row] + 1
             
-            # Process forecasts for each model
-            for forecast in forecasts:
-                model = forecast.get("model", "unknown")
-                forecast_date = forecast.get("forecast_date")
-                cost_forecast = forecast.get("cost_forecast", 0)
-                
-                # Skip very small forecasts to reduce noise
-                if cost_forecast < 1:
-                    continue
-                    
-                # If forecast is approaching threshold, add an alert
-                if cost_forecast > cost_threshold * default_usage_threshold:
-                    alerts.append({
-                        "type": "forecast_threshold",
-                        "severity": "warning" if cost_forecast < cost_threshold else "critical",
-                        "api_key_id": key_id,
-                        "api_key_name": key_details.get("name", "Unknown"),
-                        "provider": key_details.get("provider", "Unknown"),
-                        "model": model,
-                        "forecast_date": forecast_date,
-                        "forecast_cost": cost_forecast,
-                        "threshold": cost_threshold,
-                        "percentage": (cost_forecast / cost_threshold) * 100,
-                        "message": f"Forecasted cost for {model} on {forecast_date} is {(cost_forecast / cost_threshold) * 100:.1f}% of threshold (${cost_forecast:.2f} / ${cost_threshold:.2f})"
-                    })
+            # Skip very small forecasts to reduce noise
+            for pair in np.flatnonzero((pair_cost >= 1) & (pair_cost > limits[pair_key, pair_column])):
+                details, forecast = key_details[pair_key[pair]], forecast_rows[pair_row[pair]]
+                model, forecast_date = forecast.get("model", "unknown"), forecast.get("forecast_date")
+                cost = float(pair_cost[pair])
+                threshold = float(cost_thresholds[pair_key[pair], pair_column[pair]])
+                alerts.append({
+                    "type": "forecast_threshold",
+                    "severity": "warning" if cost < threshold else "critical",
+                    "api_key_id": details["id"],
+                    "api_key_name": details.get("name", "Unknown"),
+                    "provider": details.get("provider", "Unknown"),
+                    "model": model,
+                    "forecast_date": forecast_date,
+                    "forecast_cost": cost,
+                    "threshold": threshold,
+                    "threshold_scope": THRESHOLD_SCOPES[scopes[pair_key[pair], pair_column[pair]]],
+                    "percentage": (cost / threshold) * 100,
+                    "message": f"Forecasted cost for {model} on {forecast_date} is {(cost / threshold) * 100:.1f}% of threshold (${cost:.2f} / ${threshold:.2f})"
+                })
                     
         # Update state with alerts
         state["alerts"] = alerts
@@ -367,7 +515,7 @@ def analyze_thresholds(state: PreventionState) -> PreventionState:
         return state
 
 def send_notifications(state: PreventionState) -> PreventionState:
-    """Send notifications for any alerts that were triggered"""
+    """Queue notifications for any alerts that were triggered"""
     try:
         state = state.copy()
         state["status"] = "sending_notifications"
@@ -379,44 +527,102 @@ def send_notifications(state: PreventionState) -> PreventionState:
             state["notification_sent"] = False
             state["status"] = "completed"
             return state
-            
-        # Generate notification content using LLM for better messaging
-        notification_content = generate_notification_content(alerts, state.get("api_keys", []))
         
-        # Send to configured channels
-        notification_channels = state.get("notification_channels", ["slack"])
-        notification_details = {}
+        # Drop alerts that were already sent within their cooldown at the same or a higher severity band
+        now = datetime.datetime.now(datetime.timezone.utc)
+        try:
+            sent = {
+                record["alert_key"]: record
+                for record in select_in_chunks("alert_fingerprints", "alert_key", sorted({alert_key(alert) for alert in alerts}))
+            }
+        except Exception as e:
+            # Sending a repeat is better than missing an alert
+            print(f"Error fetching alert fingerprints, sending every alert: {str(e)}")
+            sent = {}
+        alerts, suppressed = select_alerts_to_send(alerts, sent, now, ALERT_COOLDOWN_HOURS * 3600)
         
-        if "slack" in notification_channels and slack_webhook_url:
-            # Send to Slack
-            slack_response = send_slack_notification(notification_content)
-            notification_details["slack"] = slack_response
+        if not alerts:
+            print(f"All {len(suppressed)} alerts were already sent within the cooldown")
+            state["notification_sent"] = False
+            state["notification_details"] = {"alerts_sent": 0, "alerts_suppressed": len(suppressed)}
+            state["status"] = "completed"
+            return state
+            
+        # Each user gets their own notification, on the channels and destinations in their settings
+        key_users = {key["id"]: key.get("user_id") for key in state.get("api_keys") or []}
+        user_alerts = defaultdict(list)
+        for alert in alerts:
+            user_alerts[key_users.get(alert["api_key_id"], state.get("user_id"))].append(alert)
+        try:
+            settings = {row["user_id"]: row for row in select_in_chunks("notification_settings", "user_id", [user_id for user_id in user_alerts if user_id])}
+        except Exception as e:
+            print(f"Error fetching notification settings, using the defaults: {str(e)}")
+            settings = {}
+        
+        notification_details = {"alerts_sent": 0, "alerts_suppressed": len(suppressed), "queued": defaultdict(int)}
+        notification_rows = []
+        enqueued_alerts = []
+        for user_id, alerts_of_user in user_alerts.items():
+            user_settings = settings.get(user_id, {})
+            if not user_settings.get("enabled", True):
+                continue
+            
+            # Resolve the destinations first, so users with nowhere to send to cost no LLM call or notification row
+            notification_channels = state.get("notification_channels") or user_settings.get("channels") or ["slack"]
+            destinations = {
+                "slack": user_settings.get("slack_webhook_url") or slack_webhook_url,
+                "email": user_settings.get("email_address")
+            }
+            queued_channels = [channel for channel in notification_channels if destinations.get(channel)]
+            if not queued_channels:
+                continue
+            
+            # Generate notification content using LLM for better messaging
+            notification_content = generate_notification_content(alerts_of_user, state.get("api_keys", []))
             
-        if "email" in notification_channels:
-            # Email would be implemented here in a real system
-            notification_details["email"] = {"status": "not_implemented"}
+            # Queue for the dispatcher, which sends in the background so slow destinations don't hold up checks
+            for channel in queued_channels:
+                notification_dispatcher.enqueue(channel, destinations[channel], notification_content, user_id)
+                notification_details["queued"][channel] += 1
+            enqueued_alerts.extend(alerts_of_user)
             
-        # Store the notification in the database for tracking
-        if alerts:
-            now = datetime.datetime.now().isoformat()
-            notification_data = {
-                "user_id": state.get("user_id"),
+            notification_rows.append({
+                "user_id": user_id,
                 "project_id": state.get("project_id"),
                 "content": notification_content["message"],
-                "alert_count": len(alerts),
-                "alert_types": [alert["type"] for alert in alerts],
-                "severity": max([alert["severity"] for alert in alerts], key=lambda x: 0 if x == "warning" else 1),
-                "sent_at": now,
+                "alert_count": len(alerts_of_user),
+                "alert_types": [alert["type"] for alert in alerts_of_user],
+                "severity": max([alert["severity"] for alert in alerts_of_user], key=lambda x: 0 if x == "warning" else 1),
+                "sent_at": now.isoformat(),
                 "channels": notification_channels
-            }
-            
+            })
+        notification_details["queued"] = dict(notification_details["queued"])
+        notification_details["alerts_sent"] = len(enqueued_alerts)
+        if notification_details["queued"]:
+            notification_dispatcher.start()
+        
+        # Store the notifications in the database for tracking
+        recorded = True
+        if notification_rows:
             try:
-                supabase.table("notifications").insert([notification_data]).execute()
+                get_supabase().table("notifications").insert(notification_rows).execute()
             except Exception as insert_error:
                 print(f"Error storing notification: {str(insert_error)}")
+                recorded = False
+        
+        # Remember what was queued, so the next runs only send what changed; the dispatcher retries failed
+        # deliveries. Alerts of users with notifications disabled or without a destination aren't recorded,
+        # so they go out once the user enables notifications or adds a destination
+        if recorded and enqueued_alerts:
+            try:
+                get_supabase().table("alert_fingerprints").upsert(
+                    fingerprint_records(enqueued_alerts, key_users, now), on_conflict="alert_key"
+                ).execute()
+            except Exception as e:
+                print(f"Error storing alert fingerprints: {str(e)}")
         
         # Update state
-        state["notification_sent"] = True
+        state["notification_sent"] = bool(notification_details["queued"])
         state["notification_details"] = notification_details
         state["status"] = "completed"
         
@@ -431,11 +637,15 @@ def generate_notification_content(alerts, api_keys):
     try:
         # If we have OpenAI API key, use LLM for better content
         if openai_api_key:
+            from langchain_openai import ChatOpenAI
+            from langchain.prompts import ChatPromptTemplate
+            
             # Format alerts for LLM context
+            keys_by_id = {k["id"]: k for k in api_keys}
             alert_descriptions = []
             for i, alert in enumerate(alerts):
                 # Find key details
-                key_details = next((k for k in api_keys if k["id"] == alert["api_key_id"]), {})
+                key_details = keys_by_id.get(alert["api_key_id"], {})
                 project_id = key_details.get("project_id", "Unknown")
                 
                 alert_descriptions.append(f"Alert {i+1}: {alert['message']} for {alert['api_key_name']} ({alert['provider']}), Project ID: {project_id}, Severity: {alert['severity']}")
@@ -513,61 +723,11 @@ def generate_notification_content(alerts, api_keys):
             "summary": f"{len(alerts)} API usage alerts detected"
         }
 
-def send_slack_notification(content):
-    """Send a notification to Slack"""
-    try:
-        if not slack_webhook_url:
-            return {"success": False, "error": "Slack webhook URL not configured"}
-            
-        # Create Slack message payload
-        slack_payload = {
-            "blocks": [
-                {
-                    "type": "header",
-                    "text": {
-                        "type": "plain_text",
-                        "text": content["title"]
-                    }
-                },
-                {
-                    "type": "section",
-                    "text": {
-                        "type": "mrkdwn",
-                        "text": content["message"]
-                    }
-                },
-                {
-                    "type": "divider"
-                },
-                {
-                    "type": "context",
-                    "elements": [
-                        {
-                            "type": "mrkdwn",
-                            "text": f"*Teiden Prevention Agent* | {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-                        }
-                    ]
-                }
-            ]
-        }
-        
-        # Send to Slack
-        response = requests.post(
-            slack_webhook_url,
-            json=slack_payload,
-            headers={"Content-Type": "application/json"}
-        )
-        
-        if response.status_code == 200:
-            return {"success": True}
-        else:
-            return {"success": False, "error": f"Error sending to Slack: {response.status_code} {response.text}"}
-    except Exception as e:
-        return {"success": False, "error": str(e)}
-
 # Build the LangGraph
 def build_graph():
     """Build the LangGraph for the prevention agent"""
+    from langgraph.graph import StateGraph, END
+    
     workflow = StateGraph(PreventionState)
     
     # Add nodes to the graph
@@ -579,8 +739,6 @@ def build_graph():
     workflow.add_node("send_notifications", send_notifications)
     
     # Define the edges
-    workflow.add_edge("fetch_api_keys", "fetch_usage_data")
-    workflow.add_edge("fetch_usage_data", "fetch_forecasts")
     workflow.add_edge("fetch_forecasts", "fetch_thresholds")
     workflow.add_edge("fetch_thresholds", "analyze_thresholds")
     workflow.add_edge("analyze_thresholds", "send_notifications")
@@ -605,20 +763,36 @@ def build_graph():
         }
     )
     
+    # Set the entry point
+    workflow.set_entry_point("fetch_api_keys")
+    
     # Compile the graph
     return workflow.compile()
 
+@lru_cache(maxsize=None)
+def get_graph():
+    """Return the compiled graph, building it once per process"""
+    return build_graph()
+
 def run_prevention_check(
     user_id: str = None,
     project_id: str = None,
-    provider: str = None
+    provider: str = None,
+    api_key_ids: List[str] = None
 ) -> Dict[str, Any]:
-    """Run the prevention agent to check for threshold crossings"""
+    """Run the prevention agent to check for threshold crossings, optionally for just some API keys.
+    
+    Without a user_id every tenant is checked separately (see run_fleet_prevention_check).
+    """
+    if not user_id and not api_key_ids:
+        return run_fleet_prevention_check(project_id=project_id, provider=provider)
+    
     # Initialize state
     state = PreventionState(
         user_id=user_id,
         project_id=project_id,
         provider=provider,
+        api_key_ids=api_key_ids,
         api_keys=None,
         usage_data=None,
         forecast_data=None,
@@ -631,9 +805,8 @@ def run_prevention_check(
         notification_details=None
     )
     
-    # Build and run the graph
-    graph = build_graph()
-    result = graph.invoke(state)
+    # Run the compiled graph
+    result = get_graph().invoke(state)
     
     # Return the relevant portions of the result
     if result.get("status") == "error":
@@ -651,7 +824,249 @@ def run_prevention_check(
             "notification_details": result.get("notification_details", {})
         }
 
+def fetch_tenant_ids(project_id: str = None, provider: str = None) -> List[str]:
+    """Users with API keys in scope, in pages of QUERY_PAGE_SIZE keys"""
+    tenant_ids = {}
+    offset = 0
+    while True:
+        query = get_supabase().table("user_api_keys").select("id, user_id")
+        if project_id:
+            query = query.eq("project_id", project_id)
+        if provider:
+            query = query.eq("provider", provider)
+        response = query.order("id").range(offset, offset + QUERY_PAGE_SIZE - 1).execute()
+        if hasattr(response, 'error') and response.error:
+            raise RuntimeError(f"Error fetching tenants: {response.error.message}")
+        tenant_ids.update(dict.fromkeys(row["user_id"] for row in response.data if row.get("user_id")))
+        if len(response.data) < QUERY_PAGE_SIZE:
+            return list(tenant_ids)
+        offset += QUERY_PAGE_SIZE
+
+def check_tenant(user_id: str, project_id: str = None, provider: str = None) -> Dict[str, Any]:
+    """One tenant's check of a fleet run; a failure is returned rather than raised"""
+    started = time.perf_counter()
+    try:
+        result = run_prevention_check(user_id=user_id, project_id=project_id, provider=provider)
+    except Exception as e:
+        result = {"success": False, "error": str(e), "status": "error"}
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+def init_fleet_worker():
+    """Worker processes only queue notifications; the process that started the run sends them"""
+    notification_dispatcher.sending = False
+
+def run_fleet_prevention_check(project_id: str = None, provider: str = None, max_workers: int = None) -> Dict[str, Any]:
+    """Check every tenant with its own thresholds, settings and notifications, in parallel.
+    
+    Each user with API keys in scope is one partition, checked on a pool of
+    PREVENTION_FLEET_WORKERS processes (or threads) as an ordinary run. Tenants
+    finish independently, a failing one is reported under failed_tenants, and
+    notifications go through the dispatcher, so a slow channel holds up no check.
+    """
+    started = time.perf_counter()
+    try:
+        tenant_ids = fetch_tenant_ids(project_id, provider)
+    except Exception as e:
+        return {"success": False, "error": str(e), "status": "error"}
+    
+    workers = max(1, min(max_workers or PREVENTION_FLEET_WORKERS, len(tenant_ids)))
+    results = {}
+    if workers == 1:
+        for user_id in tenant_ids:
+            results[user_id] = check_tenant(user_id, project_id, provider)
+    else:
+        if PREVENTION_FLEET_EXECUTOR == "process":
+            # Spawned rather than forked, as the agent server has threads running
+            import multiprocessing
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=init_fleet_worker)
+        else:
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prevention-fleet")
+        with executor:
+            futures = {executor.submit(check_tenant, user_id, project_id, provider): user_id for user_id in tenant_ids}
+            for future in as_completed(futures):
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as e:
+                    results[futures[future]] = {"success": False, "error": str(e), "status": "error"}
+    
+    # Send what the tenants queued
+    if any(result.get("notification_sent") for result in results.values()):
+        notification_dispatcher.start()
+    
+    failed_tenants = {user_id: result.get("error") for user_id, result in results.items() if not result.get("success")}
+    return {
+        "success": True,
+        "status": "completed" if not failed_tenants else "completed_with_errors",
+        "tenants": len(tenant_ids),
+        "workers": workers,
+        "failed_tenants": failed_tenants,
+        "alerts": [alert for result in results.values() for alert in result.get("alerts", [])],
+        "notification_sent": any(result.get("notification_sent") for result in results.values()),
+        "notification_details": {user_id: result.get("notification_details", {}) for user_id, result in results.items()},
+        "tenant_seconds": {user_id: round(result.get("seconds", 0), 3) for user_id, result in results.items()},
+        "seconds": time.perf_counter() - started
+    }
+
+class UsageEventMonitor:
+    """Runs prevention checks for the keys that just got new usage.
+    
+    Events are collected per user for PREVENTION_EVENT_DEBOUNCE_SECONDS, so a
+    fetcher writing many keys or days triggers one check per user over just
+    the keys it touched. Events queued locally while the server was down are
+    drained every PREVENTION_EVENT_POLL_SECONDS and acknowledged once their
+    user's check succeeds. The events of a failed check go back on the queue
+    for a retry after PREVENTION_EVENT_RETRY_SECONDS.
+    """
+    def __init__(self, debounce_seconds: float = PREVENTION_EVENT_DEBOUNCE_SECONDS, poll_seconds: float = PREVENTION_EVENT_POLL_SECONDS):
+        self.debounce_seconds = debounce_seconds
+        self.poll_seconds = poll_seconds
+        self._pending = {}  # user id -> set of key ids, or None for all of the user's keys
+        self._first_event_at = None
+        self._queued = {}  # user id -> queue messages ({"id", "attempts"}) of its pending events
+        self._direct = set()  # users with pending events that aren't on the queue
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.counters = {"events": 0, "queued_events": 0, "checks": 0, "failures": 0, "alerts": 0, "retried_events": 0, "dropped_events": 0}
+        self.last_latency_seconds = None
+    
+    def submit(self, events: List[Dict[str, Any]], messages: Optional[List[Dict[str, Any]]] = None) -> int:
+        """Add events, with the queue messages they came from if any, and wake the monitor; returns how many had a user"""
+        accepted = 0
+        unusable_ids = []
+        with self._lock:
+            for i, event in enumerate(events):
+                message = messages[i] if messages else None
+                user_id = event.get("user_id") if isinstance(event, dict) else None
+                if not user_id:
+                    if message:
+                        unusable_ids.append(message["id"])
+                    continue
+                keys = self._pending.get(user_id, set())
+                if keys is not None:
+                    self._pending[user_id] = keys | {event["api_key_id"]} if event.get("api_key_id") else None
+                if message:
+                    self._queued.setdefault(user_id, []).append(message)
+                else:
+                    self._direct.add(user_id)
+                accepted += 1
+            if accepted and self._first_event_at is None:
+                self._first_event_at = time.perf_counter()
+            self.counters["events"] += accepted
+        if unusable_ids:
+            get_local_queue().ack(unusable_ids)
+        self._wake.set()
+        return accepted
+    
+    def start(self):
+        """Start the monitor thread once"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="usage-event-monitor", daemon=True)
+                self._thread.start()
+    
+    def drain_queue(self):
+        """Move events queued locally by fetchers into the monitor"""
+        messages = get_local_queue().claim(USAGE_EVENTS_TOPIC, limit=1000)
+        if messages:
+            with self._lock:
+                self.counters["queued_events"] += len(messages)
+            self.submit([message["payload"] for message in messages], messages)
+    
+    def _run(self):
+        while True:
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+            try:
+                self.drain_queue()
+            except Exception as e:
+                print(f"Error draining usage events: {str(e)}")
+            
+            # Let a burst of events settle before checking
+            time.sleep(self.debounce_seconds)
+            self.run_pending()
+    
+    def run_pending(self):
+        """Check every user with pending events"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            queued, self._queued = self._queued, {}
+            direct, self._direct = self._direct, set()
+            first_event_at, self._first_event_at = self._first_event_at, None
+        
+        for user_id, api_key_ids in pending.items():
+            try:
+                result = run_prevention_check(user_id=user_id, api_key_ids=sorted(api_key_ids) if api_key_ids is not None else None)
+                success = result.get("success", False)
+                alerts = len(result.get("alerts", []))
+            except Exception as e:
+                print(f"Error in event-driven prevention check for user {user_id}: {str(e)}")
+                success, alerts = False, 0
+            with self._lock:
+                self.counters["checks"] += 1
+                self.counters["failures"] += 0 if success else 1
+                self.counters["alerts"] += alerts
+            
+            try:
+                if success:
+                    get_local_queue().ack([message["id"] for message in queued.get(user_id, [])])
+                else:
+                    self._retry(user_id, api_key_ids, queued.get(user_id, []), user_id in direct)
+            except Exception as e:
+                print(f"Error settling usage events for user {user_id}: {str(e)}")
+        
+        if pending and first_event_at is not None:
+            self.last_latency_seconds = time.perf_counter() - first_event_at
+    
+    def _retry(self, user_id: str, api_key_ids, messages: List[Dict[str, Any]], direct: bool):
+        """Put a failed check's events back on the queue, giving up on those checked PREVENTION_EVENT_MAX_ATTEMPTS times"""
+        queue = get_local_queue()
+        dropped = [message for message in messages if message["attempts"] >= PREVENTION_EVENT_MAX_ATTEMPTS]
+        retried = [message for message in messages if message["attempts"] < PREVENTION_EVENT_MAX_ATTEMPTS]
+        for message in retried:
+            queue.release(message["id"], PREVENTION_EVENT_RETRY_SECONDS * 2 ** (message["attempts"] - 1))
+        if dropped:
+            print(f"Dropping {len(dropped)} usage events for user {user_id} after {PREVENTION_EVENT_MAX_ATTEMPTS} failed checks")
+            queue.ack([message["id"] for message in dropped])
+        
+        # Events posted to the server weren't on the queue yet
+        requeued = 0
+        if direct:
+            events = [{"user_id": user_id, "api_key_id": key_id} for key_id in sorted(api_key_ids)] if api_key_ids is not None else [{"user_id": user_id}]
+            requeued = queue.put(USAGE_EVENTS_TOPIC, events, delay_seconds=PREVENTION_EVENT_RETRY_SECONDS)
+        with self._lock:
+            self.counters["retried_events"] += len(retried) + requeued
+            self.counters["dropped_events"] += len(dropped)
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.counters,
+                "pending_users": len(self._pending),
+                "running": self._thread is not None,
+                "last_latency_seconds": self.last_latency_seconds
+            }
+
+# Shared by the agent server's usage_events job
+usage_event_monitor = UsageEventMonitor()
+
+def handle_usage_events(events: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Accept usage events from a fetcher; the affected keys are checked within seconds"""
+    usage_event_monitor.start()
+    accepted = usage_event_monitor.submit(events)
+    return {"success": True, "status": "accepted", "events": accepted}
+
 if __name__ == "__main__":
-    # Example usage
-    result = run_prevention_check()
+    parser = argparse.ArgumentParser(description="Run the Teiden prevention agent")
+    parser.add_argument("--user_id")
+    parser.add_argument("--project_id")
+    parser.add_argument("--provider")
+    parser.add_argument("--api_key_ids", type=lambda value: [key_id for key_id in value.split(",") if key_id], help="Comma-separated API key ids to check")
+    args = parser.parse_args()
+    
+    result = run_prevention_check(**vars(args))
+    
+    # Give queued notifications a chance to go out before exiting; the rest stay queued for the next run or the server
+    notification_dispatcher.flush(NOTIFY_TIMEOUT_SECONDS * 2)
     print(json.dumps(result, indent=2)) 
\ No newline at end of file
@@ -0,0 +1,115 @@
+"""
+Threshold index for the Teiden prevention agent
+
+A threshold rule can name an API key, a project, a provider and/or model, or
+only its user. The index compiles a run's rules once into a dictionary keyed by
+those columns, so the most specific rule for a key (and model) takes a few
+lookups instead of a scan over every rule, and whole arrays of usage and
+forecast costs can be compared with their resolved thresholds at once.
+"""
+
+from typing import Dict, List, Any, Iterable, Optional, Sequence, Tuple
+import numpy as np
+
+# Rule scopes from most to least specific
+THRESHOLD_SCOPES = ("key", "project", "model", "user", "default")
+
+def rule_key(rule: Dict[str, Any]) -> Tuple:
+    """Lookup key of a threshold rule: its scope, user and the columns it names.
+
+    A key's project and provider are implied by the key, so key rules only keep
+    their model; project rules can also be narrowed to a provider and model.
+    """
+    user_id, model = rule.get("user_id"), rule.get("model") or None
+    if rule.get("api_key_id"):
+        return ("key", user_id, rule["api_key_id"], None, model)
+    if rule.get("project_id"):
+        return ("project", user_id, rule["project_id"], rule.get("provider") or None, model)
+    if rule.get("provider") or model:
+        return ("model", user_id, None, rule.get("provider") or None, model)
+    return ("user", user_id, None, None, None)
+
+class ThresholdIndex:
+    """Thresholds of a run compiled for most-specific-match lookup.
+
+    Each match is a (cost_threshold, usage_threshold, scope, rule id) tuple;
+    usage_threshold is the fraction of cost_threshold that raises a warning.
+    Keys or scopes without a matching rule get the defaults.
+    """
+    def __init__(self, rules: Iterable[Dict[str, Any]], default_cost_threshold: float, default_usage_threshold: float):
+        self.default = (float(default_cost_threshold), float(default_usage_threshold), "default", None)
+        self.rules = {}
+
+        # The most recently updated rule wins among rules with the same columns
+        for rule in sorted(rules, key=lambda rule: str(rule.get("updated_at") or "")):
+            key = rule_key(rule)
+            cost_threshold = rule.get("cost_threshold")
+            usage_threshold = rule.get("usage_threshold")
+            self.rules[key] = (
+                float(cost_threshold) if cost_threshold is not None else self.default[0],
+                float(usage_threshold) if usage_threshold is not None else self.default[1],
+                key[0],
+                rule.get("id")
+            )
+        self.key_ids = {key[2] for key in self.rules if key[0] == "key"}
+
+        # Resolved matches of key-less scopes, shared by every key in them
+        self._scope_matches = {}
+
+    def resolve(self, user_id: Optional[str], api_key_id: Optional[str] = None, project_id: Optional[str] = None,
+                provider: Optional[str] = None, model: Optional[str] = None) -> Tuple[float, float, str, Optional[str]]:
+        """The most specific rule matching a key, or a model of it: key, project, provider/model, user, default.
+
+        Without a model only rules that don't name one match.
+        """
+        models = (model, None) if model else (None,)
+        if api_key_id in self.key_ids:
+            for candidate in models:
+                match = self.rules.get(("key", user_id, api_key_id, None, candidate))
+                if match:
+                    return match
+
+        scope = (user_id, project_id, provider, model)
+        match = self._scope_matches.get(scope)
+        if match is None:
+            match = self._resolve_scope(user_id, project_id, provider, models)
+            self._scope_matches[scope] = match
+        return match
+
+    def _resolve_scope(self, user_id, project_id, provider, models) -> Tuple[float, float, str, Optional[str]]:
+        providers = (provider, None) if provider else (None,)
+        candidates = []
+        if project_id:
+            candidates += [("project", user_id, project_id, p, m) for m in models for p in providers]
+        candidates += [("model", user_id, None, p, m) for m in models for p in providers if p or m]
+        candidates.append(("user", user_id, None, None, None))
+        for candidate in candidates:
+            match = self.rules.get(candidate)
+            if match:
+                return match
+        return self.default
+
+    def resolve_keys(self, keys: List[Dict[str, Any]], models: Sequence[Optional[str]] = (None,)) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(keys x models) cost thresholds, usage thresholds and scopes (indexes into THRESHOLD_SCOPES) of user_api_keys rows.
+
+        Matches are resolved once per distinct (user, project, provider) scope
+        and model, then overridden for the few keys with rules of their own.
+        """
+        scope_ids = {}
+        key_scopes = np.fromiter(
+            (scope_ids.setdefault((key.get("user_id"), key.get("project_id"), key.get("provider")), len(scope_ids)) for key in keys),
+            dtype=int, count=len(keys)
+        )
+        table = np.empty((len(scope_ids), len(models), 3))
+        for (user_id, project_id, provider), s in scope_ids.items():
+            for m, model in enumerate(models):
+                match = self.resolve(user_id, None, project_id, provider, model)
+                table[s, m] = match[0], match[1], THRESHOLD_SCOPES.index(match[2])
+        resolved = table[key_scopes]
+
+        for k in [k for k, key in enumerate(keys) if key.get("id") in self.key_ids]:
+            key = keys[k]
+            for m, model in enumerate(models):
+                match = self.resolve(key.get("user_id"), key["id"], key.get("project_id"), key.get("provider"), model)
+                resolved[k, m] = match[0], match[1], THRESHOLD_SCOPES.index(match[2])
+        return resolved[:, :, 0], resolved[:, :, 1], resolved[:, :, 2].astype(int)
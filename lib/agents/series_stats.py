@@ -0,0 +1,330 @@
+"""
+Per-series usage statistics shared by the Teiden agents
+
+Each daily usage series (one per user, project, API key, provider and model)
+keeps running totals, Welford mean and variance of its daily values and of its
+day-over-day change, and a fixed-size window of its most recent days. The
+usage fetchers fold newly ingested days into these statistics, which are
+persisted in the series_statistics table, so the forecasting agent, the
+prevention agent and the dashboards read current statistics in O(1) per
+series instead of rescanning usage_metrics.
+"""
+
+import os
+import datetime
+from collections import defaultdict
+from typing import Dict, List, Any, Iterable, Optional
+import numpy as np
+
+STATS_METRICS = ("tokens_input", "tokens_output", "cost_in_usd")
+
+# Most recent days kept per series; re-ingested days older than this are not applied
+STATS_WINDOW_DAYS = int(os.environ.get("SERIES_STATS_WINDOW_DAYS", 28))
+
+# Days averaged at the start and end of a series for its growth rate
+GROWTH_DAYS = 7
+
+# Series keys per Supabase query
+STATS_QUERY_CHUNK = 200
+
+# Times a series' rows are re-applied when another writer updated its statistics in between
+STATS_UPDATE_ATTEMPTS = 3
+
+def series_stats_key(user_id, project_id, api_key_id, provider, model) -> str:
+    """Identifier of a usage series in series_statistics"""
+    return "|".join(str(part or "*") for part in (user_id, project_id, api_key_id, provider, model))
+
+class RunningMoments:
+    """Welford count, mean and sum of squared deviations, with removal"""
+    def __init__(self, count: int = 0, mean: float = 0.0, m2: float = 0.0):
+        self.count, self.mean, self.m2 = count, mean, m2
+
+    def add(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def remove(self, value: float):
+        if self.count <= 1:
+            self.count, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        previous_mean = (self.count * self.mean - value) / (self.count - 1)
+        self.m2 = max(self.m2 - (value - previous_mean) * (value - self.mean), 0.0)
+        self.count -= 1
+        self.mean = previous_mean
+
+    def std(self) -> float:
+        return float(np.sqrt(self.m2 / (self.count - 1))) if self.count > 1 else 0.0
+
+class SeriesStats:
+    """Running statistics of one daily usage series, updated a day at a time.
+
+    Days without usage between observed days count as zero, as they do in the
+    forecasting agent's usage cube.
+    """
+    def __init__(self, window_days: int = STATS_WINDOW_DAYS):
+        self.first_day: Optional[datetime.date] = None
+        self.last_day: Optional[datetime.date] = None
+        self.days = 0
+        self.totals = np.zeros(len(STATS_METRICS))
+        self.daily = [RunningMoments() for _ in STATS_METRICS]
+        self.change = RunningMoments()  # day-over-day change in total tokens, skipping zero days
+        self.first_week: List[float] = []  # total tokens of the first GROWTH_DAYS days
+        self.window = np.zeros((window_days, len(STATS_METRICS)))  # the last row is last_day
+
+    def observe(self, day: datetime.date, values) -> bool:
+        """Add a day's totals, or replace them if the day was seen before; False if it's too old to apply"""
+        values = np.asarray(values, dtype=float)
+        if self.last_day is None:
+            self.first_day = day
+            self.last_day = day - datetime.timedelta(days=1)
+
+        if day > self.last_day:
+            while self.last_day < day - datetime.timedelta(days=1):
+                self._append(np.zeros(len(STATS_METRICS)))
+            self._append(values)
+            return True
+
+        offset = (self.last_day - day).days
+        if day < self.first_day or offset >= len(self.window):
+            return False
+        self._replace(len(self.window) - 1 - offset, day, values)
+        return True
+
+    def _append(self, values: np.ndarray):
+        previous_total = self.window[-1, :2].sum()
+        self.days += 1
+        self.totals += values
+        for moments, value in zip(self.daily, values):
+            moments.add(value)
+        if self.days > 1 and previous_total > 0:
+            self.change.add(values[:2].sum() / previous_total - 1)
+        if len(self.first_week) < GROWTH_DAYS:
+            self.first_week.append(float(values[:2].sum()))
+        self.window = np.vstack([self.window[1:], values])
+        self.last_day += datetime.timedelta(days=1)
+
+    def _replace(self, index: int, day: datetime.date, values: np.ndarray):
+        old = self.window[index].copy()
+        self.totals += values - old
+        for moments, old_value, value in zip(self.daily, old, values):
+            moments.remove(old_value)
+            moments.add(value)
+
+        # Changes into and out of the day; the one into the window's oldest day can't be recomputed
+        pairs = []
+        if day > self.first_day and index > 0:
+            pairs.append(index - 1)
+        if day < self.last_day:
+            pairs.append(index)
+        for start in pairs:
+            if self.window[start, :2].sum() > 0:
+                self.change.remove(self.window[start + 1, :2].sum() / self.window[start, :2].sum() - 1)
+        self.window[index] = values
+        for start in pairs:
+            if self.window[start, :2].sum() > 0:
+                self.change.add(self.window[start + 1, :2].sum() / self.window[start, :2].sum() - 1)
+
+        since_first = (day - self.first_day).days
+        if since_first < len(self.first_week):
+            self.first_week[since_first] = float(values[:2].sum())
+
+    def recent(self, days: int) -> np.ndarray:
+        """(days x metrics) values of the series' last days, fewer if the series is shorter"""
+        return self.window[len(self.window) - min(days, self.days, len(self.window)):]
+
+    def summary(self) -> Dict[str, Any]:
+        """The statistics the agents report per series"""
+        totals = self.recent(GROWTH_DAYS)[:, :2].sum(axis=1)
+        if self.days >= GROWTH_DAYS:
+            start_avg = float(np.mean(self.first_week))
+            growth_rate = (totals.mean() / start_avg - 1) * 100 if start_avg > 0 else 0.0
+        elif self.days > 1:
+            growth_rate = (totals[-1] / self.first_week[0] - 1) * 100 if self.first_week[0] > 0 else 0.0
+        else:
+            growth_rate = 0.0
+
+        recent_cost = self.recent(GROWTH_DAYS)[:, 2]
+        return {
+            "avg_daily_input_tokens": float(self.daily[0].mean),
+            "avg_daily_output_tokens": float(self.daily[1].mean),
+            "avg_daily_cost": float(self.daily[2].mean),
+            "std_daily_cost": self.daily[2].std(),
+            "growth_rate": float(growth_rate),
+            "volatility": self.change.std() * 100,
+            "data_points": self.days,
+            "last_7_days_avg_cost": float(recent_cost.mean()) if len(recent_cost) else 0.0,
+            "first_day": self.first_day.isoformat() if self.first_day else None,
+            "last_day": self.last_day.isoformat() if self.last_day else None
+        }
+
+    def daily_values(self, as_of: datetime.date, days: int) -> Dict[str, np.ndarray]:
+        """Values of the days in the days up to as_of that the window covers, by ISO date"""
+        values = {}
+        for offset in range(days):
+            day = as_of - datetime.timedelta(days=offset)
+            if self.last_day is None or day > self.last_day or day < self.first_day:
+                continue
+            index = len(self.window) - 1 - (self.last_day - day).days
+            if index >= 0:
+                values[day.isoformat()] = self.window[index]
+        return values
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "first_day": self.first_day.isoformat() if self.first_day else None,
+            "last_day": self.last_day.isoformat() if self.last_day else None,
+            "days": self.days,
+            "totals": self.totals.tolist(),
+            "daily": [[moments.count, float(moments.mean), float(moments.m2)] for moments in self.daily],
+            "change": [self.change.count, float(self.change.mean), float(self.change.m2)],
+            "first_week": self.first_week,
+            "window": self.window.tolist()
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SeriesStats":
+        stats = cls(len(data["window"]))
+        stats.first_day = datetime.date.fromisoformat(data["first_day"]) if data.get("first_day") else None
+        stats.last_day = datetime.date.fromisoformat(data["last_day"]) if data.get("last_day") else None
+        stats.days = data["days"]
+        stats.totals = np.asarray(data["totals"], dtype=float)
+        stats.daily = [RunningMoments(*moments) for moments in data["daily"]]
+        stats.change = RunningMoments(*data["change"])
+        stats.first_week = list(data["first_week"])
+        stats.window = np.asarray(data["window"], dtype=float).reshape(len(data["window"]), len(STATS_METRICS))
+        return stats
+
+def combined_summary(stats_list: List[SeriesStats]) -> Dict[str, Any]:
+    """Summary of the sum of several series (e.g. one model across API keys).
+
+    Averages are exact over the combined span; growth and volatility are taken
+    from the series' windows summed by date, so they cover the window only.
+    """
+    if len(stats_list) == 1:
+        return stats_list[0].summary()
+
+    combined = SeriesStats()
+    last_day = max(stats.last_day for stats in stats_list)
+    first_day = min(stats.first_day for stats in stats_list)
+    span = (last_day - first_day).days + 1
+    by_day = defaultdict(lambda: np.zeros(len(STATS_METRICS)))
+    for stats in stats_list:
+        for day, values in stats.daily_values(last_day, min(span, STATS_WINDOW_DAYS)).items():
+            by_day[day] += values
+    for day in sorted(by_day):
+        combined.observe(datetime.date.fromisoformat(day), by_day[day])
+
+    summary = combined.summary()
+    totals = sum(stats.totals for stats in stats_list)
+    summary.update({
+        "avg_daily_input_tokens": float(totals[0] / span),
+        "avg_daily_output_tokens": float(totals[1] / span),
+        "avg_daily_cost": float(totals[2] / span),
+        "data_points": span,
+        "first_day": first_day.isoformat()
+    })
+    return summary
+
+def load_series_statistics(client, series_keys: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """series_statistics rows by series key, fetched in chunks"""
+    series_keys = list(series_keys)
+    rows = {}
+    for start in range(0, len(series_keys), STATS_QUERY_CHUNK):
+        chunk = series_keys[start:start + STATS_QUERY_CHUNK]
+        response = client.table("series_statistics").select("*").in_("series_key", chunk).execute()
+        rows.update({row["series_key"]: row for row in response.data or []})
+    return rows
+
+def query_series_statistics(client, user_id: Optional[str] = None, project_id: Optional[str] = None,
+                            provider: Optional[str] = None, api_key_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """series_statistics rows of a scope, fetching api_key_ids in chunks"""
+    def scope_query():
+        query = client.table("series_statistics").select("*")
+        if user_id:
+            query = query.eq("user_id", user_id)
+        if project_id:
+            query = query.eq("project_id", project_id)
+        if provider:
+            query = query.eq("provider", provider)
+        return query
+
+    if api_key_ids is None:
+        return scope_query().execute().data or []
+
+    api_key_ids = list(api_key_ids)
+    rows = []
+    for start in range(0, len(api_key_ids), STATS_QUERY_CHUNK):
+        rows.extend(scope_query().in_("api_key_id", api_key_ids[start:start + STATS_QUERY_CHUNK]).execute().data or [])
+    return rows
+
+def update_series_statistics(client, usage_rows: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Fold freshly stored usage_metrics rows into their series' statistics.
+
+    The rows must hold each (series, day) they touch in full, as the fetchers
+    write them: a day that was already observed is replaced, not added to.
+    Each write is conditional on the version it read, so when two fetchers
+    update a series at once, the one that loses re-reads and re-applies its days.
+    """
+    days = defaultdict(lambda: defaultdict(lambda: np.zeros(len(STATS_METRICS))))
+    labels = {}
+    for row in usage_rows:
+        key = series_stats_key(row.get("user_id"), row.get("project_id"), row.get("api_key_id"), row.get("provider"), row.get("model"))
+        labels[key] = row
+        days[key][str(row["timestamp"])[:10]] += [float(row.get(metric) or 0) for metric in STATS_METRICS]
+
+    pending, written, skipped = sorted(days), 0, 0
+    for _ in range(STATS_UPDATE_ATTEMPTS):
+        if not pending:
+            break
+        existing = load_series_statistics(client, pending)
+        updated_at = datetime.datetime.now().isoformat()
+        records, conflicts = {}, set()
+        for key in pending:
+            stats = SeriesStats.from_dict(existing[key]["stats"]) if key in existing else SeriesStats()
+            days_skipped = sum(
+                not stats.observe(datetime.date.fromisoformat(day), days[key][day]) for day in sorted(days[key])
+            )
+            label = labels[key]
+            records[key] = ({
+                "series_key": key,
+                "user_id": label.get("user_id"),
+                "project_id": label.get("project_id"),
+                "api_key_id": label.get("api_key_id"),
+                "provider": label.get("provider"),
+                "model": label.get("model"),
+                "stats": stats.to_dict(),
+                "summary": stats.summary(),
+                "last_day": stats.last_day.isoformat(),
+                "updated_at": updated_at
+            }, days_skipped)
+
+        # Existing series are updated only if nobody wrote them since they were read
+        for key, (record, _) in records.items():
+            if key not in existing:
+                continue
+            version = existing[key].get("version") or 0
+            response = (
+                client.table("series_statistics").update({**record, "version": version + 1})
+                .eq("series_key", key).eq("version", version).execute()
+            )
+            if not response.data:
+                conflicts.add(key)
+
+        # New series are inserted unless another writer created them first
+        new_records = [{**record, "version": 1} for key, (record, _) in records.items() if key not in existing]
+        if new_records:
+            response = client.table("series_statistics").upsert(new_records, on_conflict="series_key", ignore_duplicates=True).execute()
+            inserted = {row["series_key"] for row in response.data or []}
+            conflicts |= {record["series_key"] for record in new_records} - inserted
+
+        for key, (_, days_skipped) in records.items():
+            if key not in conflicts:
+                written += 1
+                skipped += days_skipped
+        pending = sorted(conflicts)
+
+    if pending:
+        print(f"Gave up updating statistics of {len(pending)} series after {STATS_UPDATE_ATTEMPTS} conflicting writes")
+    return {"series": written, "days_skipped": skipped, "conflicts": len(pending)}
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The agents import their modules from their own directories
+AGENTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ("", "forecasting-agent", "prevention-agent"):
+    sys.path.insert(0, os.path.join(AGENTS_DIR, directory))
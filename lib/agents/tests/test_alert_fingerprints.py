@@ -0,0 +1,49 @@
+import datetime
+
+from alert_fingerprints import alert_key, fingerprint_records, select_alerts_to_send, severity_band
+
+NOW = datetime.datetime(2026, 1, 2, 12, tzinfo=datetime.timezone.utc)
+COOLDOWN = 24 * 3600
+
+def alert(percentage, **fields):
+    return {"type": "cost_threshold", "api_key_id": "k1", "threshold_scope": "key", "model": "gpt-4", "percentage": percentage, **fields}
+
+def sent_record(percentage, hours_ago):
+    return {
+        alert_key(alert(percentage)): {
+            "severity_band": severity_band(percentage),
+            "last_sent_at": (NOW - datetime.timedelta(hours=hours_ago)).isoformat()
+        }
+    }
+
+def test_severity_bands():
+    assert [severity_band(p) for p in (None, 90, 100, 149, 150, 250)] == [0, 0, 1, 1, 2, 3]
+
+def test_forecast_days_share_a_key():
+    assert alert_key(alert(90, forecast_date="2026-01-03")) == alert_key(alert(95, forecast_date="2026-01-04"))
+
+def test_new_alert_is_sent():
+    to_send, suppressed = select_alerts_to_send([alert(120)], {}, NOW, COOLDOWN)
+    assert len(to_send) == 1 and not suppressed
+
+def test_repeat_within_cooldown_is_suppressed():
+    to_send, suppressed = select_alerts_to_send([alert(120)], sent_record(110, 1), NOW, COOLDOWN)
+    assert not to_send and len(suppressed) == 1
+
+def test_repeat_after_cooldown_is_sent():
+    to_send, _ = select_alerts_to_send([alert(120)], sent_record(110, 25), NOW, COOLDOWN)
+    assert len(to_send) == 1
+
+def test_rising_severity_band_skips_cooldown():
+    to_send, _ = select_alerts_to_send([alert(160)], sent_record(110, 1), NOW, COOLDOWN)
+    assert len(to_send) == 1
+
+def test_naive_timestamps_are_utc():
+    record = {alert_key(alert(120)): {"severity_band": 1, "last_sent_at": "2026-01-02T11:00:00"}}
+    assert not select_alerts_to_send([alert(120)], record, NOW, COOLDOWN)[0]
+
+def test_records_keep_the_highest_band_per_key():
+    records = fingerprint_records([alert(110), alert(210), alert(160)], {"k1": "u1"}, NOW)
+    assert len(records) == 1
+    assert records[0]["severity_band"] == 3 and records[0]["user_id"] == "u1"
+    assert records[0]["fingerprint"] == f"{alert_key(alert(210))}|3"
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+import budget_simulation
+from budget_simulation import simulate_budget_exhaustion, summarize_simulation, trailing_mean_residuals
+
+def noisy_fleet(series: int = 4, days: int = 60, horizon_days: int = 30, seed: int = 0):
+    """Series with noisy daily cost, each with a threshold near its expected horizon spend"""
+    rng = np.random.default_rng(seed)
+    level = rng.uniform(1, 5, (series, 1))
+    history = np.maximum(level * (1 + rng.normal(0, 0.4, (series, days))), 0)
+    residuals, counts = trailing_mean_residuals(history, np.zeros(series, dtype=int), np.full(series, days - 1))
+    forecasts = np.repeat(level, horizon_days, axis=1)
+    thresholds = level[:, 0] * horizon_days
+    return forecasts, residuals, counts, thresholds
+
+def assert_same_simulation(first, second):
+    np.testing.assert_array_equal(first["probability"], second["probability"])
+    np.testing.assert_array_equal(first["days_to_crossing"], second["days_to_crossing"])
+    assert first["probability_by_horizon"].keys() == second["probability_by_horizon"].keys()
+    for name, values in first["probability_by_horizon"].items():
+        np.testing.assert_array_equal(values, second["probability_by_horizon"][name])
+
+def test_residuals_are_packed_per_series_span():
+    history = np.array([
+        [1.0] * 10,
+        [0.0, 0.0, 0.0] + [2.0] * 7,
+    ])
+    residuals, counts = trailing_mean_residuals(history, np.array([0, 3]), np.array([9, 9]), window=3)
+    # Only days with a full window inside the span count
+    assert counts.tolist() == [7, 4]
+    np.testing.assert_allclose(residuals[0, :7], 0.0)
+    np.testing.assert_allclose(residuals[1, :4], 0.0)
+
+def test_the_same_seed_gives_the_same_quantiles():
+    fleet = noisy_fleet()
+    first = simulate_budget_exhaustion(*fleet, paths=500, seed=7)
+    second = simulate_budget_exhaustion(*fleet, paths=500, seed=7)
+    assert_same_simulation(first, second)
+    assert not np.isnan(first["days_to_crossing"]).all()
+
+    other = simulate_budget_exhaustion(*fleet, paths=500, seed=8)
+    assert not np.array_equal(first["probability"], other["probability"])
+
+def test_seeded_results_hold_across_chunks_and_threads(monkeypatch):
+    fleet = noisy_fleet(series=6)
+    monkeypatch.setattr(budget_simulation, "SIMULATION_WORKERS", 2)
+    # Room for one series per chunk, so six chunks race over two threads
+    monkeypatch.setattr(budget_simulation, "SIMULATION_CHUNK_VALUES", 2 * 200 * 30)
+    runs = [simulate_budget_exhaustion(*fleet, paths=200, seed=3) for _ in range(3)]
+    for run in runs[1:]:
+        assert_same_simulation(runs[0], run)
+
+def test_certain_and_impossible_crossings():
+    forecasts = np.full((3, 14), 10.0)
+    residuals = np.zeros((3, 20))
+    counts = np.array([20, 20, 0])
+    # Crossed on day 1, never reachable, and no threshold at all
+    thresholds = np.array([5.0, 1000.0, np.nan])
+    simulation = simulate_budget_exhaustion(forecasts, residuals, counts, thresholds, paths=100, seed=0)
+
+    assert simulation["probability"].tolist() == [1.0, 0.0, 0.0]
+    assert set(simulation["probability_by_horizon"]) == {"7d", "14d"}
+    assert simulation["probability_by_horizon"]["7d"].tolist() == [1.0, 0.0, 0.0]
+    assert simulation["days_to_crossing"][0].tolist() == [1.0, 1.0, 1.0]
+    assert np.isnan(simulation["days_to_crossing"][1:]).all()
+
+    assert summarize_simulation(simulation, 0) == {
+        "probability": 1.0,
+        "probability_by_horizon": {"7d": 1.0, "14d": 1.0},
+        "days_to_crossing": {"p10": 1.0, "p50": 1.0, "p90": 1.0}
+    }
+    assert summarize_simulation(simulation, 1)["days_to_crossing"] == {"p10": None, "p50": None, "p90": None}
+
+def test_identical_series_draw_independent_paths():
+    forecasts, residuals, counts, thresholds = noisy_fleet(series=1)
+    copies = 4
+    simulation = simulate_budget_exhaustion(
+        np.repeat(forecasts, copies, axis=0), np.repeat(residuals, copies, axis=0),
+        np.repeat(counts, copies), np.repeat(thresholds, copies), paths=500, seed=1
+    )
+    # Shared draws would give every copy exactly the same crossings
+    assert len(set(simulation["probability"].tolist())) > 1
+    assert simulation["probability"].std() == pytest.approx(0, abs=0.1)
@@ -0,0 +1,104 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from forecast_agent import ForecastAdmission, SingleFlight
+
+def test_concurrent_callers_share_one_computation():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"run": len(calls)}
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        leader = executor.submit(flights.run, "key", compute)
+        assert started.wait(5)
+        followers = [executor.submit(flights.run, "key", compute) for _ in range(4)]
+        while flights.stats()["coalesced"] < 4:
+            time.sleep(0.01)
+        release.set()
+        results = [leader.result(5)] + [future.result(5) for future in followers]
+
+    assert len(calls) == 1
+    assert results == [({"run": 1}, False)] + [({"run": 1}, True)] * 4
+    assert flights.stats() == {"in_flight": 0, "coalesced": 4}
+
+def test_other_keys_and_later_calls_compute_again():
+    flights = SingleFlight()
+    assert flights.run("a", lambda: 1) == (1, False)
+    assert flights.run("b", lambda: 2) == (2, False)
+    assert flights.run("a", lambda: 3) == (3, False)
+
+def test_waiting_callers_get_the_leaders_error():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("fit failed")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(flights.run, "key", failing)
+        assert started.wait(5)
+        follower = executor.submit(flights.run, "key", failing)
+        while flights.stats()["coalesced"] < 1:
+            time.sleep(0.01)
+        release.set()
+        for future in (leader, follower):
+            with pytest.raises(RuntimeError, match="fit failed"):
+                future.result(5)
+    assert flights.stats()["in_flight"] == 0
+
+def test_tenant_limit_is_enforced_and_released():
+    admission = ForecastAdmission(tenant_limit=2, process_limit=4, queue_limit=8, timeout=0.05)
+    assert admission.acquire("u1") and admission.acquire("u1")
+    assert not admission.acquire("u1")
+
+    # Other tenants still get the process' free slots
+    assert admission.acquire("u2")
+    assert admission.stats() == {"running": 3, "queued": 0, "rejected": 1}
+
+    admission.release("u1")
+    assert admission.acquire("u1")
+
+def test_process_limit_applies_across_tenants():
+    admission = ForecastAdmission(tenant_limit=2, process_limit=2, queue_limit=8, timeout=0.05)
+    assert admission.acquire("u1") and admission.acquire("u2")
+    assert not admission.acquire("u3")
+
+    # The rejected run gave back its tenant slot
+    admission.release("u1")
+    assert admission.acquire("u3")
+
+def test_full_queue_rejects_without_waiting():
+    admission = ForecastAdmission(tenant_limit=1, process_limit=1, queue_limit=1, timeout=5)
+    assert admission.acquire("u1")
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        waiting = executor.submit(admission.acquire, "u1")
+        while admission.stats()["queued"] < 1:
+            time.sleep(0.01)
+        started = time.monotonic()
+        assert not admission.acquire("u2")
+        assert time.monotonic() - started < 1
+        admission.release("u1")
+        assert waiting.result(5)
+    admission.release("u1")
+    assert admission.stats() == {"running": 0, "queued": 0, "rejected": 1}
+
+def test_tenant_semaphores_are_dropped_once_idle():
+    admission = ForecastAdmission(tenant_limit=1, process_limit=4, queue_limit=8, timeout=0.05)
+    for tenant in ("u1", "u2", "u3"):
+        assert admission.acquire(tenant)
+    assert not admission.acquire("u1")
+    assert set(admission._tenants) == {"u1", "u2", "u3"}
+    for tenant in ("u1", "u2", "u3"):
+        admission.release(tenant)
+    assert admission._tenants == {}
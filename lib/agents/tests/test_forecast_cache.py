@@ -0,0 +1,66 @@
+import forecast_agent
+from forecast_agent import ForecastResultCache, forecast_cache_key, forecast_params_key
+
+def scope(user_id, project_id=None):
+    return {"user_id": user_id, "project_id": project_id}
+
+def test_least_recently_used_entries_are_evicted():
+    cache = ForecastResultCache(max_entries=2)
+    cache.put("a", scope("u1"), {"run": "a"})
+    cache.put("b", scope("u1"), {"run": "b"})
+    assert cache.get("a") == {"run": "a"}
+
+    # "b" is now the least recently used
+    cache.put("c", scope("u1"), {"run": "c"})
+    assert cache.get("b") is None
+    assert cache.get("a") == {"run": "a"} and cache.get("c") == {"run": "c"}
+    assert cache.stats() == {
+        "entries": 2, "max_entries": 2, "hits": 3, "misses": 1, "hit_rate": 0.75, "evictions": 1, "invalidations": 0
+    }
+
+def test_peek_neither_counts_nor_refreshes():
+    cache = ForecastResultCache(max_entries=2)
+    cache.put("a", scope("u1"), {"run": "a"})
+    cache.put("b", scope("u1"), {"run": "b"})
+    assert cache.peek("a") == {"run": "a"} and cache.peek("missing") is None
+    cache.put("c", scope("u1"), {"run": "c"})
+    assert cache.peek("a") is None
+    assert cache.stats()["hits"] == cache.stats()["misses"] == 0
+
+def test_putting_an_existing_key_replaces_it():
+    cache = ForecastResultCache(max_entries=2)
+    cache.put("a", scope("u1"), {"run": 1})
+    cache.put("a", scope("u1"), {"run": 2})
+    assert cache.get("a") == {"run": 2} and cache.stats()["entries"] == 1
+
+def test_invalidation_drops_a_users_and_projects_entries():
+    cache = ForecastResultCache()
+    cache.put("u1", scope("u1"), {})
+    cache.put("u1-p1", scope("u1", "p1"), {})
+    cache.put("u1-p2", scope("u1", "p2"), {})
+    cache.put("u2", scope("u2"), {})
+    cache.put("everyone", scope(None), {})
+
+    # A project's entries, plus the user's and everyone's runs that include that project
+    assert cache.invalidate("u1", "p1") == 3
+    assert [key for key in ("u1", "u1-p1", "u1-p2", "u2", "everyone") if cache.peek(key) is not None] == ["u1-p2", "u2"]
+
+    assert cache.invalidate("u1") == 1
+    assert cache.invalidate() == 1
+    assert cache.stats()["entries"] == 0 and cache.stats()["invalidations"] == 5
+
+def test_new_usage_data_changes_the_cache_key(monkeypatch):
+    params = {"user_id": "u1", "project_id": None, "provider": None, "timeframe": "90d", "forecast_model": "statistical"}
+    params_key = forecast_params_key(params)
+    versions = iter(["10:2026-03-01T00:00:00", "10:2026-03-01T00:00:00", "11:2026-03-02T00:00:00"])
+    monkeypatch.setattr(forecast_agent, "usage_data_version", lambda *args: next(versions))
+    first, same, after_new_rows = (forecast_cache_key(params, params_key) for _ in range(3))
+    assert first == same != after_new_rows
+    assert forecast_params_key({**params, "forecast_model": "prophet"}) != params_key
+
+def test_unreadable_data_version_bypasses_the_cache(monkeypatch):
+    def unreachable(*args):
+        raise ConnectionError("no database")
+
+    monkeypatch.setattr(forecast_agent, "usage_data_version", unreachable)
+    assert forecast_cache_key({"user_id": "u1", "project_id": None, "provider": None, "timeframe": "90d"}, "key") is None
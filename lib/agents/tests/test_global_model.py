@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("sklearn")
+
+import global_model
+from global_model import forecast_global
+
+def weekly_values(rows: int, days: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    pattern = np.array([1.0, 1.2, 1.1, 1.0, 0.9, 0.4, 0.3])
+    levels = rng.uniform(50, 5000, size=rows)
+    return levels[:, None] * np.tile(pattern, days // 7 + 1)[:days] * rng.uniform(0.9, 1.1, size=(rows, days))
+
+def test_forecast_shapes_and_scale():
+    values = weekly_values(6, 56)
+    last_weekday = np.full(6, 6)
+    forecasts, held_out, report = forecast_global(values, last_weekday, np.zeros(6, dtype=int), 7, 1, estimator="linear")
+    assert forecasts.shape == (6, 7) and held_out.shape == (6, 0)
+    assert (forecasts >= 0).all()
+    assert report["training_rows"] == 6 * 55
+    # Each row is forecast at its own level
+    np.testing.assert_allclose(forecasts.mean(axis=1), values.mean(axis=1), rtol=0.3)
+
+def test_one_fit_scores_held_out_days(monkeypatch):
+    fits = []
+    build_estimator = global_model.build_estimator
+
+    def counting_estimator(estimator):
+        model = build_estimator(estimator)
+        fit = model.fit
+        model.fit = lambda X, y: fits.append(len(y)) or fit(X, y)
+        return model
+
+    monkeypatch.setattr(global_model, "build_estimator", counting_estimator)
+    values = weekly_values(4, 42)
+    forecasts, held_out, report = forecast_global(
+        values, np.zeros(4, dtype=int), np.zeros(4, dtype=int), 5, 1, estimator="linear", validation_days=7
+    )
+    assert fits == [4 * 34]
+    assert forecasts.shape == (4, 5) and held_out.shape == (4, 7)
+    assert report["training_rows"] == 4 * 34
+
+def test_held_out_days_are_not_learned():
+    values = weekly_values(4, 42)
+    changed = values.copy()
+    changed[:, -7:] *= 100
+    args = (np.zeros(4, dtype=int), np.zeros(4, dtype=int), 5, 1)
+    _, held_out, _ = forecast_global(values, *args, estimator="linear", validation_days=7)
+    _, changed_held_out, _ = forecast_global(changed, *args, estimator="linear", validation_days=7)
+    np.testing.assert_allclose(held_out, changed_held_out)
+
+def test_rows_with_unknown_history_start_later():
+    values = weekly_values(3, 35)
+    values[2, :28] = np.nan
+    forecasts, _, _ = forecast_global(values, np.zeros(3, dtype=int), np.zeros(3, dtype=int), 7, 1, estimator="linear")
+    assert np.isfinite(forecasts).all()
+
+def test_nothing_to_learn_carries_the_mean_forward():
+    values = np.array([[10.0], [30.0]])
+    forecasts, held_out, report = forecast_global(values, np.zeros(2, dtype=int), np.zeros(2, dtype=int), 3, 1)
+    np.testing.assert_allclose(forecasts, [[10.0] * 3, [30.0] * 3])
+    assert held_out.shape == (2, 0) and report["training_rows"] == 0
@@ -0,0 +1,54 @@
+import numpy as np
+
+from hierarchy import Hierarchy, reconcile
+
+BOTTOM = [
+    ("u1", "p1", "k1", "gpt-4"),
+    ("u1", "p1", "k1", "gpt-3.5"),
+    ("u1", "p1", "k2", "gpt-4"),
+    ("u1", "p2", "k3", "gpt-4"),
+    ("u2", "p3", "k4", "gpt-3.5")
+]
+
+def history(days=28, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(10, 100, (len(BOTTOM), days, 2))
+
+def assert_coherent(hierarchy, levels):
+    for level, values in hierarchy.aggregate(levels["bottom"]).items():
+        np.testing.assert_allclose(levels[level], values)
+    np.testing.assert_allclose(levels["total"][0], levels["bottom"].sum(axis=0))
+    np.testing.assert_allclose(levels["user"].sum(axis=0), levels["total"][0])
+    np.testing.assert_allclose(levels["model"].sum(axis=0), levels["total"][0])
+
+def test_levels():
+    hierarchy = Hierarchy(BOTTOM)
+    sizes = {level: len(labels) for level, (labels, _) in hierarchy.levels.items()}
+    assert sizes == {"total": 1, "user": 2, "project": 3, "key": 4, "model": 2}
+    S = hierarchy.summing_matrix()
+    assert S.shape == (sum(sizes.values()) + len(BOTTOM), len(BOTTOM))
+    np.testing.assert_array_equal(S[0], np.ones(len(BOTTOM)))
+
+def test_bottom_up_sums_the_bottom_forecasts():
+    hierarchy = Hierarchy(BOTTOM)
+    forecasts = history(7, seed=1)
+    levels, report = reconcile(hierarchy, forecasts, history(), method="bottom_up")
+    assert report["method"] == "bottom_up"
+    np.testing.assert_array_equal(levels["bottom"], forecasts)
+    assert_coherent(hierarchy, levels)
+
+def test_mint_is_coherent_and_non_negative():
+    hierarchy = Hierarchy(BOTTOM)
+    forecasts = history(7, seed=1)
+    forecasts[0] = -5
+    levels, report = reconcile(hierarchy, forecasts, history(), method="mint")
+    assert report["method"] == "mint" and report["aggregate_nodes"] == 12
+    assert (levels["bottom"] >= 0).all()
+    assert_coherent(hierarchy, levels)
+
+def test_mint_keeps_already_coherent_forecasts():
+    # Base forecasts that already add up are left unchanged by the projection
+    hierarchy = Hierarchy(BOTTOM)
+    constant = np.full((len(BOTTOM), 28, 2), 10.0)
+    levels, _ = reconcile(hierarchy, constant[:, :7], constant, method="mint")
+    np.testing.assert_allclose(levels["bottom"], constant[:, :7])
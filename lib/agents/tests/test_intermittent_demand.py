@@ -0,0 +1,37 @@
+import numpy as np
+
+from intermittent_demand import (
+    DEMAND_PATHS, SHORT_SERIES_DAYS, classify_demand, croston_sba_forecast, demand_statistics, seasonal_naive_forecast
+)
+
+def test_classification_routes_series():
+    smooth = np.full(30, 100.0) + np.arange(30)
+    erratic = np.tile([10.0, 500.0], 15)
+    intermittent = np.tile([0.0, 0.0, 100.0], 10)
+    lumpy = np.tile([0.0, 0.0, 10.0, 0.0, 0.0, 500.0], 5)
+    cases = {
+        "smooth": smooth, "erratic": erratic, "intermittent": intermittent, "lumpy": lumpy,
+        "short": np.full(SHORT_SERIES_DAYS - 1, 100.0), "no_demand": np.zeros(30)
+    }
+    for expected, demand in cases.items():
+        assert classify_demand(demand) == expected
+    assert {DEMAND_PATHS[name] for name in ("intermittent", "lumpy", "no_demand")} == {"croston_sba"}
+    assert DEMAND_PATHS["short"] == "seasonal_naive"
+    assert DEMAND_PATHS["smooth"] == DEMAND_PATHS["erratic"] == "model"
+
+def test_demand_statistics():
+    assert demand_statistics(np.tile([0.0, 0.0, 100.0], 10)) == (3.0, 0.0)
+    assert demand_statistics(np.zeros(5))[0] == float("inf")
+
+def test_croston_sba_of_regular_demand():
+    # Every third day a demand of 90: a rate of 30 a day, less the SBA correction
+    forecast = croston_sba_forecast(np.tile([0.0, 0.0, 90.0], 10), 5, alpha=0.1)
+    np.testing.assert_allclose(forecast, np.full(5, 0.95 * 30))
+
+def test_croston_sba_without_demand():
+    np.testing.assert_array_equal(croston_sba_forecast(np.zeros(10), 3), np.zeros(3))
+
+def test_seasonal_naive_repeats_last_week():
+    values = np.arange(10.0)
+    np.testing.assert_array_equal(seasonal_naive_forecast(values, 9), [3, 4, 5, 6, 7, 8, 9, 3, 4])
+    np.testing.assert_array_equal(seasonal_naive_forecast(np.array([2.0, 4.0]), 3), [3, 3, 3])
@@ -0,0 +1,97 @@
+import json
+import threading
+
+import numpy as np
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+import forecast_agent
+from forecast_agent import StubForecastBackend, fit_to_horizon, llm_forecast
+
+class RecordingBackend(StubForecastBackend):
+    """Stub backend that records the series ids of every request it answers"""
+    name = "recording"
+
+    def __init__(self, drop=(), truncate=()):
+        self.requests = []
+        self.drop, self.truncate = set(drop), set(truncate)
+        self._lock = threading.Lock()
+
+    def complete(self, system_prompt, user_prompt):
+        with self._lock:
+            self.requests.append([series["id"] for series in json.loads(user_prompt)["series"]])
+        response = json.loads(super().complete(system_prompt, user_prompt))
+        for series_id in self.drop:
+            response.pop(series_id, None)
+        for series_id in self.truncate & set(response):
+            response[series_id] = {key: values[:2] for key, values in response[series_id].items()}
+        return json.dumps(response)
+
+@pytest.fixture(autouse=True)
+def llm_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(forecast_agent, "CACHE_DIR", str(tmp_path))
+
+def usage_frames(count: int, days: int = 28):
+    timestamps = pd.date_range("2026-01-01", periods=days, freq="D")
+    frames = {}
+    for i in range(count):
+        tokens = 1000.0 * (i + 1) + 100.0 * (np.arange(days) % 7)
+        frames[f"model-{i}"] = pd.DataFrame({
+            "timestamp": timestamps,
+            "tokens_input": tokens,
+            "tokens_output": tokens / 2,
+            "cost_in_usd": tokens / 1e5
+        })
+    return frames
+
+def test_every_series_is_answered_from_one_batch():
+    frames = usage_frames(5)
+    backend = RecordingBackend()
+    forecasts, report = llm_forecast(frames, 10, backend=backend)
+    assert report == {"backend": "recording", "series": 5, "batches": 1, "cache_hits": 0, "fallbacks": 0}
+    assert backend.requests == [list(frames)]
+
+    # The stub repeats the last week of the history the prompt carried
+    last_week = frames["model-2"]["tokens_input"].to_numpy()[-7:]
+    np.testing.assert_allclose(forecasts["model-2"][0], np.resize(last_week, 10))
+    assert len(forecasts["model-2"]) == 3
+
+def test_series_are_split_across_batches_by_token_budget(monkeypatch):
+    monkeypatch.setattr(forecast_agent, "LLM_TOKEN_BUDGET", 600)
+    frames = usage_frames(6)
+    backend = RecordingBackend()
+    forecasts, report = llm_forecast(frames, 7, backend=backend)
+    assert report["batches"] == len(backend.requests) > 1
+    assert sorted(series_id for request in backend.requests for series_id in request) == sorted(frames)
+    assert set(forecasts) == set(frames) and report["fallbacks"] == 0
+
+def test_repeated_prompts_are_served_from_the_cache(monkeypatch):
+    monkeypatch.setattr(forecast_agent, "LLM_TOKEN_BUDGET", 600)
+    frames = usage_frames(4)
+    backend = RecordingBackend()
+    first, first_report = llm_forecast(frames, 7, backend=backend)
+    requests = len(backend.requests)
+    second, second_report = llm_forecast(frames, 7, backend=backend)
+    assert len(backend.requests) == requests
+    assert second_report["cache_hits"] == second_report["batches"] == first_report["batches"]
+    for name in frames:
+        np.testing.assert_allclose(second[name], first[name])
+
+def test_short_answers_are_padded_and_missing_ones_fall_back():
+    pytest.importorskip("statsmodels")
+    frames = usage_frames(3)
+    backend = RecordingBackend(drop=["model-0"], truncate=["model-1"])
+    forecasts, report = llm_forecast(frames, 5, backend=backend)
+    assert report["fallbacks"] == 1
+    assert all(len(values) == 5 for values in forecasts["model-0"])
+    short = forecasts["model-1"][0]
+    np.testing.assert_allclose(short[2:], short[1])
+
+def test_only_the_requested_metrics_are_returned():
+    forecasts, _ = llm_forecast(usage_frames(2), 4, metrics=["tokens_input", "tokens_output"], backend=RecordingBackend())
+    assert all(len(values) == 2 for values in forecasts.values())
+
+def test_fit_to_horizon():
+    np.testing.assert_allclose(fit_to_horizon([1, 2, 3, 4], 2), [1, 2])
+    np.testing.assert_allclose(fit_to_horizon([1, 2], 4), [1, 2, 2, 2])
@@ -0,0 +1,53 @@
+import time
+
+import pytest
+
+from local_queue import LocalQueue
+
+@pytest.fixture
+def queue(tmp_path):
+    return LocalQueue(str(tmp_path / "queue.sqlite3"))
+
+def test_claim_leases_oldest_first(queue):
+    queue.put("jobs", [{"n": 1}, {"n": 2}, {"n": 3}])
+    claimed = queue.claim("jobs", limit=2)
+    assert [message["payload"]["n"] for message in claimed] == [1, 2]
+    assert all(message["attempts"] == 1 for message in claimed)
+    assert [message["payload"]["n"] for message in queue.claim("jobs")] == [3]
+    assert queue.claim("jobs") == []
+
+def test_ack_removes_messages(queue):
+    queue.put("jobs", [{"n": 1}, {"n": 2}])
+    claimed = queue.claim("jobs")
+    queue.ack([claimed[0]["id"]])
+    assert queue.size("jobs") == 1
+
+def test_expired_lease_makes_message_claimable_again(queue):
+    queue.put("jobs", [{"n": 1}])
+    assert queue.claim("jobs", lease_seconds=0.05)
+    assert queue.claim("jobs") == []
+    time.sleep(0.1)
+    retried = queue.claim("jobs")
+    assert len(retried) == 1 and retried[0]["attempts"] == 2
+
+def test_release_retries_after_delay(queue):
+    queue.put("jobs", [{"n": 1}])
+    message = queue.claim("jobs")[0]
+    queue.release(message["id"], delay_seconds=0.1)
+    assert queue.claim("jobs") == []
+    assert queue.topics() == []
+    time.sleep(0.15)
+    assert queue.claim("jobs")[0]["attempts"] == 2
+
+def test_delayed_put_and_topics(queue):
+    queue.put("notifications:slack:a", [{}])
+    queue.put("notifications:email:b", [{}], delay_seconds=60)
+    queue.put("usage_events", [{}])
+    assert queue.topics("notifications:") == ["notifications:slack:a"]
+    assert queue.size() == 3
+
+def test_queues_on_the_same_file_share_messages(queue):
+    other = LocalQueue(queue.path)
+    queue.put("jobs", [{"n": 1}])
+    assert other.claim("jobs")[0]["payload"] == {"n": 1}
+    assert queue.claim("jobs") == []
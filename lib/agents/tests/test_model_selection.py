@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+import forecast_agent
+from forecast_agent import ComputeBudget, backtest_fold_count, select_and_forecast
+
+WEEK = np.array([10.0, 12.0, 11.0, 10.0, 9.0, 4.0, 3.0])
+STATE = {"user_id": "u1", "project_id": None, "provider": None}
+
+@pytest.fixture
+def clock(tmp_path, monkeypatch):
+    """Simulated seconds: a statistical forecast takes 0.1 and a Prophet one 1.0"""
+    now = [0.0]
+
+    def last_value(df, horizon_days, metrics=forecast_agent.FORECAST_METRICS):
+        now[0] += 0.1
+        return tuple(np.full(horizon_days, df[metric].iloc[-1]) for metric in metrics)
+
+    def seasonal_naive(df, horizon_days, metrics=forecast_agent.FORECAST_METRICS):
+        now[0] += 1.0
+        return tuple(np.resize(df[metric].to_numpy()[-7:], horizon_days) for metric in metrics)
+
+    monkeypatch.setattr(forecast_agent, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(forecast_agent, "statistical_forecast", last_value)
+    monkeypatch.setattr(forecast_agent, "prophet_forecast", seasonal_naive)
+    monkeypatch.setitem(forecast_agent.FORECASTERS, "statistical", last_value)
+    monkeypatch.setitem(forecast_agent.FORECASTERS, "prophet", seasonal_naive)
+    return now
+
+def simulated_budget(seconds: float, now) -> ComputeBudget:
+    budget = ComputeBudget(seconds)
+    budget.clock = lambda: now[0]
+    budget.started = now[0]
+    return budget
+
+def weekly_frames(scales):
+    """Purely weekly series, so seasonal naive (standing in for Prophet) backtests perfectly"""
+    days = 56
+    timestamps = pd.date_range("2026-01-05", periods=days, freq="D")
+    pattern = np.resize(WEEK, days)
+    return {
+        name: pd.DataFrame({
+            "timestamp": timestamps,
+            "tokens_input": pattern * scale * 100,
+            "tokens_output": pattern * scale * 50,
+            "cost_in_usd": pattern * scale
+        })
+        for name, scale in scales.items()
+    }
+
+def test_compute_budget_estimates_from_recorded_fits():
+    budget = ComputeBudget(10)
+    assert budget.estimate("prophet", 3, default=1.5) == 4.5
+    budget.record("prophet", 4.0, fits=2)
+    budget.record("prophet", 1.0)
+    assert budget.estimate("prophet", 2, default=1.5) == pytest.approx(3.0)
+    assert budget.estimate("statistical") == 0.0
+
+def test_compute_budget_remaining(clock):
+    budget = simulated_budget(2.0, clock)
+    clock[0] += 1.5
+    assert budget.used() == 1.5 and budget.remaining() == 0.5
+    assert budget.affords(0.4) and not budget.affords(0.5)
+    clock[0] += 1.0
+    assert budget.remaining() == 0.0 and budget.exhausted()
+
+def test_backtest_fold_count():
+    # Folds of 7 days need at least SELECTION_MIN_TRAIN_DAYS of history before them
+    assert backtest_fold_count(56, 14) == 3
+    assert backtest_fold_count(30, 14) == 2
+    assert backtest_fold_count(12, 14) == 0
+    assert backtest_fold_count(12, 1) == 2
+
+def test_small_budget_skips_the_expensive_candidates(clock):
+    frames = weekly_frames({"small": 1.0, "large": 3.0, "medium": 2.0})
+    forecasts, report = select_and_forecast(frames, 7, simulated_budget(4.9, clock), STATE)
+    series = report["series"]
+
+    # The costliest series goes first: Prophet's backtest (3 x 1.0s, estimated from
+    # SELECTION_PROPHET_SECONDS) and its final fit both fit in the budget, and it wins
+    assert series["large"]["selected"] == "prophet" and series["large"]["source"] == "backtest"
+    assert series["large"]["backtest_smape"]["prophet"] == 0.0
+    assert series["large"]["expensive_compute_seconds"] == pytest.approx(4.0)
+
+    # The next one can still backtest Holt-Winters, but not Prophet
+    assert series["medium"]["selected"] == "statistical" and series["medium"]["source"] == "budget"
+    assert set(series["medium"]["backtest_smape"]) == {"statistical"}
+
+    # The last one can't even afford the Holt-Winters backtest
+    assert series["small"]["selected"] == "statistical" and series["small"]["source"] == "budget"
+    assert series["small"]["backtest_smape"] == {}
+
+    assert report["selected_counts"] == {"prophet": 1, "statistical": 2}
+    assert report["budget"]["seconds"] == 4.9 and report["budget"]["used_seconds"] == pytest.approx(4.8)
+    assert report["expensive_compute_seconds"] == pytest.approx(4.0)
+    assert report["selected_smape"] < report["statistical_only_smape"]
+    assert set(forecasts) == set(frames)
+
+def test_exhausted_budget_forecasts_every_series_statistically(clock):
+    frames = weekly_frames({"a": 1.0, "b": 2.0})
+    forecasts, report = select_and_forecast(frames, 7, simulated_budget(0, clock), STATE)
+    assert report["selected_counts"] == {"statistical": 2}
+    assert all(series["source"] == "budget" for series in report["series"].values())
+    assert report["budget"]["exhausted"] and report["statistical_only_smape"] is None
+    assert set(forecasts) == set(frames)
+
+def test_winners_are_remembered_but_budget_skips_are_not(clock):
+    frames = weekly_frames({"large": 3.0, "medium": 2.0})
+    select_and_forecast(frames, 7, simulated_budget(4.9, clock), STATE)
+    _, report = select_and_forecast(frames, 7, simulated_budget(100, clock), STATE)
+    assert report["series"]["large"]["source"] == "memory"
+    assert report["series"]["medium"]["source"] == "backtest"
+    assert report["series"]["medium"]["selected"] == "prophet"
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from online_holt_winters import (
+    SEASONAL_PERIODS, advance_filter_states, filter_state_from_fit, forecast_filter_states,
+    frozen_filter_state, stack_filter_states, unstack_filter_states
+)
+
+ExponentialSmoothing = pytest.importorskip("statsmodels.tsa.holtwinters").ExponentialSmoothing
+
+def weekly_series(days, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(days)
+    return 1000 + 5 * t + 200 * np.sin(2 * np.pi * t / 7) + rng.normal(0, 30, days)
+
+def fit(values):
+    return ExponentialSmoothing(values, trend="add", seasonal="add", seasonal_periods=SEASONAL_PERIODS).fit()
+
+def state_at(results, day):
+    """States after filtering day, in the layout filter_state_from_fit captures"""
+    return {
+        "alpha": float(results.params["smoothing_level"]),
+        "beta": float(results.params["smoothing_trend"]),
+        "gamma": float(results.params["smoothing_seasonal"]),
+        "level": float(results.level[day]),
+        "trend": float(results.trend[day]),
+        "season": np.asarray(results.season)[day - SEASONAL_PERIODS + 1:day + 1].tolist(),
+        "last_day": str(day)
+    }
+
+def test_filter_state_matches_statsmodels_forecast():
+    results = fit(weekly_series(60))
+    arrays = stack_filter_states([filter_state_from_fit(results, "2026-01-01")])
+    np.testing.assert_allclose(forecast_filter_states(arrays, 14, non_negative=False)[0], results.forecast(14), rtol=1e-6)
+
+def test_advance_matches_statsmodels_filter():
+    values = weekly_series(60)
+    results = fit(values)
+    arrays = stack_filter_states([state_at(results, 44)])
+    advanced = advance_filter_states(arrays, values[None, 45:])
+
+    final = filter_state_from_fit(results, "59")
+    np.testing.assert_allclose(advanced["level"][0], final["level"], rtol=1e-6)
+    np.testing.assert_allclose(advanced["trend"][0], final["trend"], rtol=1e-6, atol=1e-9)
+    np.testing.assert_allclose(advanced["season"][0], final["season"], rtol=1e-6, atol=1e-6)
+
+def test_mask_leaves_series_without_new_days_unchanged():
+    values = weekly_series(60)
+    results = fit(values)
+    arrays = stack_filter_states([state_at(results, 50), state_at(results, 55)])
+    mask = np.zeros((2, 9), dtype=bool)
+    mask[0, :] = True
+    mask[1, 5:] = True
+    advanced = advance_filter_states(arrays, np.vstack([values[51:], values[51:]]), mask)
+
+    np.testing.assert_allclose(advanced["level"], [results.level[59]] * 2, rtol=1e-6)
+    np.testing.assert_allclose(advanced["season"][0], advanced["season"][1], rtol=1e-6)
+
+def test_frozen_state_repeats_its_forecast():
+    season = np.arange(1.0, SEASONAL_PERIODS + 1)
+    arrays = stack_filter_states([frozen_filter_state(season, "2026-01-01")])
+    np.testing.assert_array_equal(forecast_filter_states(arrays, 7)[0], season)
+
+    advanced = advance_filter_states(arrays, np.full((1, 3), 100.0))
+    np.testing.assert_array_equal(forecast_filter_states(advanced, 7)[0], np.roll(season, -3))
+
+def test_unstack_round_trips():
+    states = [frozen_filter_state(np.ones(SEASONAL_PERIODS), "2026-01-01"), frozen_filter_state(np.zeros(SEASONAL_PERIODS), "2026-01-02")]
+    assert unstack_filter_states(stack_filter_states(states), ["2026-01-01", "2026-01-02"]) == states
@@ -0,0 +1,88 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from series_stats import RunningMoments, SeriesStats, combined_summary
+
+START = datetime.date(2026, 1, 1)
+
+def observed(values_by_day, window_days=28) -> SeriesStats:
+    stats = SeriesStats(window_days)
+    for offset, values in enumerate(values_by_day):
+        assert stats.observe(START + datetime.timedelta(days=offset), values)
+    return stats
+
+def daily_values(days: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    tokens = rng.uniform(100, 1000, size=(days, 2))
+    return np.column_stack([tokens, tokens.sum(axis=1) / 1000])
+
+def assert_same_stats(actual: SeriesStats, expected: SeriesStats):
+    np.testing.assert_allclose(actual.totals, expected.totals)
+    for moments, expected_moments in zip(actual.daily + [actual.change], expected.daily + [expected.change]):
+        assert moments.count == expected_moments.count
+        np.testing.assert_allclose([moments.mean, moments.m2], [expected_moments.mean, expected_moments.m2])
+    np.testing.assert_allclose(actual.window, expected.window)
+    np.testing.assert_allclose(actual.first_week, expected.first_week)
+    assert actual.summary() == pytest.approx(expected.summary())
+
+def test_running_moments_remove_matches_recompute():
+    values = [3.0, 8.0, 1.0, 4.0, 9.0]
+    moments = RunningMoments()
+    for value in values:
+        moments.add(value)
+    moments.remove(8.0)
+    rest = [3.0, 1.0, 4.0, 9.0]
+    assert moments.count == 4
+    np.testing.assert_allclose([moments.mean, moments.std()], [np.mean(rest), np.std(rest, ddof=1)])
+
+def test_running_moments_remove_last_value():
+    moments = RunningMoments()
+    moments.add(5.0)
+    moments.remove(5.0)
+    assert (moments.count, moments.mean, moments.m2) == (0, 0.0, 0.0)
+
+def test_replaced_days_match_a_series_built_from_the_final_values():
+    values = daily_values(20)
+    stats = observed(values)
+    final = values.copy()
+    for offset in (0, 3, 12, 19):
+        final[offset] = final[offset] * 2 + 1
+        assert stats.observe(START + datetime.timedelta(days=offset), final[offset])
+    assert_same_stats(stats, observed(final))
+
+def test_replacing_a_zero_day_restores_its_changes():
+    values = daily_values(10)
+    values[4] = 0
+    stats = observed(values)
+    values[4] = [500.0, 500.0, 1.0]
+    stats.observe(START + datetime.timedelta(days=4), values[4])
+    assert_same_stats(stats, observed(values))
+
+def test_gap_days_count_as_zero():
+    stats = SeriesStats()
+    stats.observe(START, [10.0, 10.0, 1.0])
+    stats.observe(START + datetime.timedelta(days=3), [20.0, 20.0, 2.0])
+    assert stats.days == 4
+    np.testing.assert_allclose(stats.recent(4)[:, 2], [1.0, 0.0, 0.0, 2.0])
+
+def test_days_before_the_window_are_skipped():
+    stats = observed(daily_values(10), window_days=5)
+    assert not stats.observe(START + datetime.timedelta(days=4), [1.0, 1.0, 1.0])
+    assert not stats.observe(START - datetime.timedelta(days=1), [1.0, 1.0, 1.0])
+    assert stats.observe(START + datetime.timedelta(days=5), [1.0, 1.0, 1.0])
+
+def test_round_trip():
+    stats = observed(daily_values(15))
+    assert_same_stats(SeriesStats.from_dict(stats.to_dict()), stats)
+
+def test_combined_summary_averages_over_the_combined_span():
+    first = observed(daily_values(10, seed=1))
+    second = SeriesStats()
+    for offset, values in enumerate(daily_values(5, seed=2)):
+        second.observe(START + datetime.timedelta(days=5 + offset), values)
+    summary = combined_summary([first, second])
+    assert summary["data_points"] == 10
+    assert summary["avg_daily_cost"] == (first.totals[2] + second.totals[2]) / 10
+    assert summary["first_day"] == START.isoformat()
@@ -0,0 +1,54 @@
+import numpy as np
+
+from threshold_index import THRESHOLD_SCOPES, ThresholdIndex
+
+RULES = [
+    {"id": "user", "user_id": "u1", "cost_threshold": 100},
+    {"id": "project", "user_id": "u1", "project_id": "p1", "cost_threshold": 50, "usage_threshold": 0.5},
+    {"id": "project-model", "user_id": "u1", "project_id": "p1", "model": "gpt-4", "cost_threshold": 40},
+    {"id": "model", "user_id": "u1", "provider": "openai", "model": "gpt-4", "cost_threshold": 30},
+    {"id": "key", "user_id": "u1", "api_key_id": "k1", "cost_threshold": 10},
+    {"id": "key-model", "user_id": "u1", "api_key_id": "k1", "model": "gpt-4", "cost_threshold": 5}
+]
+
+def index(rules=RULES):
+    return ThresholdIndex(rules, 1000, 0.8)
+
+def test_most_specific_rule_wins():
+    thresholds = index()
+    assert thresholds.resolve("u1", "k1", "p1", "openai", "gpt-4")[3] == "key-model"
+    assert thresholds.resolve("u1", "k1", "p1", "openai", "dall-e-3")[3] == "key"
+    assert thresholds.resolve("u1", "k2", "p1", "openai", "gpt-4")[3] == "project-model"
+    assert thresholds.resolve("u1", "k2", "p1", "openai")[3] == "project"
+    assert thresholds.resolve("u1", "k3", None, "openai", "gpt-4")[3] == "model"
+    assert thresholds.resolve("u1", "k3", None, "anthropic")[3] == "user"
+
+def test_unmatched_scope_gets_defaults():
+    assert index().resolve("u2", "k9") == (1000.0, 0.8, "default", None)
+
+def test_missing_values_fall_back_to_defaults():
+    assert index().resolve("u1", "k2", "p1")[:3] == (50.0, 0.5, "project")
+    assert index().resolve("u1", "k3")[:3] == (100.0, 0.8, "user")
+
+def test_latest_rule_wins_for_the_same_columns():
+    rules = [
+        {"id": "new", "user_id": "u1", "cost_threshold": 20, "updated_at": "2026-02-01"},
+        {"id": "old", "user_id": "u1", "cost_threshold": 10, "updated_at": "2026-01-01"}
+    ]
+    assert index(rules).resolve("u1")[3] == "new"
+
+def test_resolve_keys_matches_resolve():
+    thresholds = index()
+    keys = [
+        {"id": "k1", "user_id": "u1", "project_id": "p1", "provider": "openai"},
+        {"id": "k2", "user_id": "u1", "project_id": "p1", "provider": "openai"},
+        {"id": "k3", "user_id": "u1", "project_id": None, "provider": "openai"},
+        {"id": "k4", "user_id": "u2", "project_id": None, "provider": "openai"}
+    ]
+    models = [None, "gpt-4"]
+    cost, usage, scopes = thresholds.resolve_keys(keys, models)
+    for k, key in enumerate(keys):
+        for m, model in enumerate(models):
+            match = thresholds.resolve(key["user_id"], key["id"], key["project_id"], key["provider"], model)
+            assert (cost[k, m], usage[k, m], THRESHOLD_SCOPES[scopes[k, m]]) == match[:3]
+    np.testing.assert_array_equal(cost[:, 1], [5, 40, 30, 1000])
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from usage_cube import UsageCube, unique_labels
+
+def usage_row(day, model, api_key_id="k1", tokens_input=0.0, tokens_output=0.0, cost_in_usd=0.0, hour="00"):
+    return {
+        "timestamp": f"2026-03-{day:02d}T{hour}:00:00+00:00", "model": model, "api_key_id": api_key_id,
+        "tokens_input": tokens_input, "tokens_output": tokens_output, "cost_in_usd": cost_in_usd
+    }
+
+ROWS = [
+    usage_row(1, "gpt-4", tokens_input=100, cost_in_usd=1.0),
+    usage_row(1, "gpt-4", tokens_input=50, cost_in_usd=0.5, hour="13"),
+    usage_row(4, "gpt-4", api_key_id="k2", tokens_input=10, tokens_output=5, cost_in_usd=0.1),
+    usage_row(2, "gpt-3.5", tokens_input=20, cost_in_usd=0.02),
+    usage_row(3, "gpt-3.5", api_key_id="k2", tokens_input=30, cost_in_usd=None),
+]
+
+def test_rows_are_bucketed_by_day():
+    cube = UsageCube.from_rows(ROWS)
+    assert cube.series == ("gpt-3.5", "gpt-4")
+    assert cube.row_count == 5
+    assert cube.days.tolist() == np.arange("2026-03-01", "2026-03-05", dtype="datetime64[D]").tolist()
+    # Both of gpt-4's rows on the 1st land on that day; a missing cost counts as zero
+    np.testing.assert_allclose(cube.values[cube.index["gpt-4"], 0], [150.0, 0.0, 1.5])
+    np.testing.assert_allclose(cube.values[cube.index["gpt-3.5"], 2], [30.0, 0.0, 0.0])
+
+def test_missing_days_are_zero_filled_within_each_series_span():
+    cube = UsageCube.from_rows(ROWS)
+    np.testing.assert_allclose(cube.series_values("gpt-4", ["tokens_input"])[:, 0], [150.0, 0.0, 0.0, 10.0])
+    assert cube.observed[cube.index["gpt-4"]].tolist() == [True, False, False, True]
+
+    # A series' span runs from its own first to last row
+    assert cube.series_days("gpt-3.5").astype(str).tolist() == ["2026-03-02", "2026-03-03"]
+    assert cube.observed_days() == 4
+
+def test_frame_is_gap_free_and_daily():
+    pytest.importorskip("pandas")
+    frame = UsageCube.from_rows(ROWS).frame("gpt-4")
+    assert list(frame.columns) == ["timestamp", "tokens_input", "tokens_output", "cost_in_usd"]
+    assert frame["timestamp"].dt.strftime("%Y-%m-%d").tolist() == ["2026-03-01", "2026-03-02", "2026-03-03", "2026-03-04"]
+    np.testing.assert_allclose(frame["cost_in_usd"], [1.5, 0.0, 0.0, 0.1])
+
+def test_aggregate_sums_series_over_a_subset_of_fields():
+    cube = UsageCube.from_rows(ROWS, series_fields=("api_key_id", "model"))
+    assert cube.series == (("k1", "gpt-3.5"), ("k1", "gpt-4"), ("k2", "gpt-3.5"), ("k2", "gpt-4"))
+
+    by_key = cube.aggregate(("api_key_id",))
+    assert by_key.series == ("k1", "k2") and by_key.series_fields == ("api_key_id",)
+    np.testing.assert_allclose(by_key.totals("tokens_input"), [170.0, 40.0])
+    np.testing.assert_allclose(by_key.series_values("k2", ["tokens_input"])[:, 0], [30.0, 10.0])
+
+    by_model = cube.aggregate(("model",))
+    single = UsageCube.from_rows(ROWS)
+    assert by_model.series == single.series
+    np.testing.assert_allclose(by_model.values, single.values)
+    assert (by_model.observed == single.observed).all()
+
+def test_empty_rows_make_an_empty_cube():
+    cube = UsageCube.from_rows([])
+    assert len(cube) == 0 and cube.row_count == 0 and cube.observed_days() == 0
+
+def test_the_cube_is_read_only():
+    cube = UsageCube.from_rows(ROWS)
+    with pytest.raises(ValueError):
+        cube.values[0, 0, 0] = 1.0
+
+def test_unique_labels_sorts_tuples_with_none():
+    labels, inverse = unique_labels([("b", None), ("a", "x"), ("b", None), (None, "y")])
+    assert labels == [(None, "y"), ("a", "x"), ("b", None)]
+    assert inverse.tolist() == [2, 1, 2, 0]
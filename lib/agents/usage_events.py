@@ -0,0 +1,61 @@
+"""
+Usage events published by the Teiden usage fetchers
+
+After a fetcher stores new usage, it publishes one event per (user, project,
+API key) it wrote to. Events go to the agent server's usage_events job, which
+runs prevention checks for just those keys within seconds. When the server
+can't be reached, they are put on the local queue (local_queue.py) instead,
+and the server drains it when it is back.
+"""
+
+import os
+import json
+import urllib.request
+from typing import Dict, List, Any
+from dotenv import load_dotenv
+
+from local_queue import get_local_queue
+
+# Load environment variables
+load_dotenv()
+
+USAGE_EVENTS_TOPIC = "usage_events"
+
+AGENT_SERVER_URL = os.environ.get("AGENT_SERVER_URL", "http://127.0.0.1:8765")
+AGENT_SERVER_TOKEN = os.environ.get("AGENT_SERVER_TOKEN")
+
+# Seconds to wait for the server before queueing the events locally
+PUBLISH_TIMEOUT_SECONDS = 2
+
+def usage_events_from_rows(usage_rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """One event per distinct (user, project, API key) among stored usage_metrics rows"""
+    scopes = dict.fromkeys((row.get("user_id"), row.get("project_id"), row.get("api_key_id")) for row in usage_rows)
+    return [
+        {"user_id": user_id, "project_id": project_id, "api_key_id": api_key_id}
+        for user_id, project_id, api_key_id in scopes
+        if user_id
+    ]
+
+def publish_usage_events(events: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Send events to the agent server, or queue them locally if it can't be reached"""
+    if not events:
+        return {"published": 0, "via": None}
+
+    request = urllib.request.Request(
+        f"{AGENT_SERVER_URL}/jobs/usage_events",
+        data=json.dumps({"events": events}).encode("utf-8"),
+        headers={
+            "Content-Type": "application/json",
+            **({"x-agent-token": AGENT_SERVER_TOKEN} if AGENT_SERVER_TOKEN else {})
+        },
+        method="POST"
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=PUBLISH_TIMEOUT_SECONDS) as response:
+            if json.loads(response.read() or b"{}").get("success"):
+                return {"published": len(events), "via": "server"}
+    except Exception as e:
+        print(f"Agent server unreachable for usage events ({str(e)}), queueing them locally")
+
+    get_local_queue().put(USAGE_EVENTS_TOPIC, events)
+    return {"published": len(events), "via": "queue"}
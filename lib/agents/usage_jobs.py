@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Usage jobs for Teiden Dashboard without the agent server
+
+The dashboard's usage fetcher runs the series_statistics and usage_events jobs
+on the agent server. When the server isn't running, agent-client.ts runs this
+script instead, with the job type as its argument and the job's parameters as
+JSON on stdin: usage rows are folded into the series statistics directly, and
+usage events are published the way the Python fetcher publishes them, so they
+wait on the local queue until the server is back.
+"""
+
+import os
+import sys
+import json
+import argparse
+from typing import Dict, List, Any
+from dotenv import load_dotenv
+
+from series_stats import update_series_statistics
+from usage_events import publish_usage_events
+
+# Load environment variables
+load_dotenv()
+
+supabase_url = os.environ.get("NEXT_PUBLIC_SUPABASE_URL")
+supabase_key = os.environ.get("SUPABASE_SERVICE_KEY")
+
+def update_usage_statistics(usage_rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Fold usage rows stored by the dashboard's fetcher into the series statistics"""
+    from supabase import create_client
+    return {"success": True, **update_series_statistics(create_client(supabase_url, supabase_key), usage_rows)}
+
+def queue_usage_events(events: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Publish usage events, queueing them locally while the server is down"""
+    return {"success": True, **publish_usage_events(events)}
+
+USAGE_JOBS = {
+    "series_statistics": update_usage_statistics,
+    "usage_events": queue_usage_events
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a usage job without the agent server")
+    parser.add_argument("job", choices=sorted(USAGE_JOBS))
+    args = parser.parse_args()
+
+    result = USAGE_JOBS[args.job](**json.load(sys.stdin))
+    print(json.dumps(result, indent=2))
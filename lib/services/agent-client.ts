@@ -0,0 +1,121 @@
+import { execFile } from 'child_process';
+import { promisify } from 'util';
+import path from 'path';
+
+const execFileAsync = promisify(execFile);
+
+export type AgentJobType = 'forecast' | 'forecast_status' | 'prevention' | 'series_statistics' | 'usage_events';
+
+// Long-lived agent server started with scripts/run_agent_server.sh
+const AGENT_SERVER_URL = process.env.AGENT_SERVER_URL || 'http://127.0.0.1:8765';
+
+// How long to wait for the server's response before giving up on a job (default 15 minutes)
+const AGENT_SERVER_TIMEOUT_MS = Number(process.env.AGENT_SERVER_TIMEOUT_MS || 15 * 60 * 1000);
+
+// Connection errors that mean no server is listening, so the job never started there
+const SERVER_UNREACHABLE_CODES = ['ECONNREFUSED', 'ENOTFOUND'];
+
+// Agent scripts, with their leading arguments, used when the agent server isn't running
+const AGENT_SCRIPTS: Partial<Record<AgentJobType, string[]>> = {
+  forecast: ['lib/agents/forecasting-agent/forecast_agent.py'],
+  prevention: ['lib/agents/prevention-agent/prevention_agent.py'],
+  series_statistics: ['lib/agents/usage_jobs.py', 'series_statistics'],
+  usage_events: ['lib/agents/usage_jobs.py', 'usage_events']
+};
+
+// Parameters that need the server's background workers; a script run ignores them
+const SERVER_ONLY_PARAMS = ['progressive'];
+
+/**
+ * Run an agent job on the agent server, which keeps the Python libraries,
+ * compiled graphs and clients warm between requests. Falls back to running
+ * the agent script in a new Python process only if the connection to the
+ * server is refused; timeouts and other errors are thrown, since the job may
+ * still be running on the server.
+ */
+export async function runAgentJob(type: AgentJobType, params: Record<string, any> = {}): Promise<any> {
+  let response: Response;
+
+  try {
+    response = await fetch(`${AGENT_SERVER_URL}/jobs/${type}`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        ...(process.env.AGENT_SERVER_TOKEN ? { 'x-agent-token': process.env.AGENT_SERVER_TOKEN } : {})
+      },
+      body: JSON.stringify(params),
+      cache: 'no-store',
+      signal: AbortSignal.timeout(AGENT_SERVER_TIMEOUT_MS)
+    });
+  } catch (error: any) {
+    if (!isServerUnreachable(error)) {
+      throw error;
+    }
+    console.warn(`Agent server unreachable at ${AGENT_SERVER_URL}, running ${type} agent script instead`);
+    return runAgentScript(type, params);
+  }
+
+  const result = await response.json();
+
+  if (!response.ok) {
+    throw new Error(result.error || `Agent server returned status ${response.status}`);
+  }
+
+  return result;
+}
+
+// A refused connection or unknown host; with several addresses (localhost) the cause is an AggregateError
+function isServerUnreachable(error: any): boolean {
+  const causes = [error?.cause, ...(error?.cause?.errors ?? [])];
+  return causes.some((cause) => SERVER_UNREACHABLE_CODES.includes(cause?.code));
+}
+
+// Run an agent script directly and parse the JSON result it prints
+async function runAgentScript(type: AgentJobType, params: Record<string, any>): Promise<any> {
+  const script = AGENT_SCRIPTS[type];
+
+  if (!script) {
+    throw new Error(`The ${type} job needs the agent server`);
+  }
+
+  const [scriptFile, ...scriptArgs] = script;
+  const entries = Object.entries(params)
+    .filter(([key, value]) => !SERVER_ONLY_PARAMS.includes(key) && value !== undefined && value !== null && value !== '');
+
+  // Arguments are passed to python3 directly, without a shell, so request values can't inject commands.
+  // Arrays and objects (usage rows, events) can outgrow a command-line argument, so they go as JSON on stdin
+  const scriptPath = path.resolve(process.cwd(), scriptFile);
+  const args = [
+    scriptPath,
+    ...scriptArgs,
+    ...entries
+      .filter(([, value]) => typeof value !== 'object')
+      .map(([key, value]) => `--${key}=${String(value)}`)
+  ];
+  const structuredParams = Object.fromEntries(entries.filter(([, value]) => typeof value === 'object'));
+
+  console.log(`Running ${type} agent script`);
+
+  const run = execFileAsync('python3', args, {
+    env: { ...process.env, PYTHONPATH: process.cwd() }
+  });
+  if (Object.keys(structuredParams).length > 0) {
+    run.child.stdin?.end(JSON.stringify(structuredParams));
+  } else {
+    run.child.stdin?.end();
+  }
+  const { stdout, stderr } = await run;
+
+  if (stderr) {
+    console.warn(`${type} agent warnings:`, stderr);
+  }
+
+  // Find the JSON output in stdout
+  const jsonMatch = stdout.match(/({[\s\S]*})/);
+
+  if (!jsonMatch || !jsonMatch[1]) {
+    throw new Error('No valid JSON output found');
+  }
+
+  return JSON.parse(jsonMatch[1]);
+}
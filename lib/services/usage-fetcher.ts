@@ -1,6 +1,7 @@
 import { createClient } from '@supabase/supabase-js';
 import OpenAIClient from '../api-clients/openai';
 import { encryption } from '../encryption';
+import { runAgentJob } from './agent-client';
 
 // Initialize Supabase client
 const supabase = createClient(
@@ -206,6 +207,22 @@ export async function fetchAndStoreOpenAIUsage() {
           }
           
           console.log(`Successfully stored ${usageMetrics.length} usage metrics for user ${apiKey.user_id}`);
+          
+          // Fold the new days into the per-series statistics the agents read
+          try {
+            await runAgentJob('series_statistics', { usage_rows: usageMetrics });
+          } catch (statsError) {
+            console.warn(`Could not update series statistics for user ${apiKey.user_id}:`, statsError);
+          }
+
+          // Have the prevention agent check this key's new usage within seconds
+          try {
+            await runAgentJob('usage_events', {
+              events: [{ user_id: apiKey.user_id, project_id: apiKey.project_id ?? null, api_key_id: apiKey.id }]
+            });
+          } catch (eventError) {
+            console.warn(`Could not publish usage events for key ${apiKey.id}:`, eventError);
+          }
         } else {
           console.log(`No usage data found for user ${apiKey.user_id} in the specified date range`);
         }
@@ -0,0 +1,25 @@
+#!/bin/bash
+
+# Run the Teiden Agent Server
+# This script starts the long-lived agent service that keeps the forecasting and
+# prevention agents loaded and serves their jobs to the API routes over HTTP
+
+# Change to the project root directory
+cd "$(dirname "$0")/.."
+
+# Check if Python virtual environment exists
+if [ ! -d "venv" ]; then
+  echo "Creating Python virtual environment..."
+  python3 -m venv venv
+fi
+
+# Activate virtual environment
+source venv/bin/activate
+
+# Install dependencies
+echo "Installing dependencies..."
+pip install -r lib/agents/requirements.txt
+
+# Serve until stopped (AGENT_SERVER_HOST / AGENT_SERVER_PORT, default 127.0.0.1:8765)
+echo "Starting agent server..."
+exec python3 lib/agents/agent_server.py